@@ -0,0 +1,161 @@
+"""
+Admission Module
+
+Inbound flood protection: decides whether a member's message may be relayed,
+using a token bucket per user, a global ingress budget shared by everyone,
+and a cheap fingerprint of recent messages to drop repeated duplicates.
+"""
+
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+from broadcaster import TokenBucket
+from metrics import INGRESS_REJECTED
+
+# Admission decisions
+ADMIT = 'admit'
+THROTTLED_USER = 'throttled_user'
+THROTTLED_GLOBAL = 'throttled_global'
+DUPLICATE = 'duplicate'
+
+
+def fingerprint(text: str) -> int:
+    """Hash a message ignoring case and whitespace differences"""
+    return zlib.crc32(" ".join(text.casefold().split()).encode("utf-8"))
+
+
+class AdmissionController:
+    # Limits adjustable at runtime, with their types
+    LIMITS = {
+        'user_rate': float,
+        'user_burst': float,
+        'global_rate': float,
+        'global_burst': float,
+        'max_duplicates': int,
+        'duplicate_window': float,
+    }
+    # Prune per-user state once this many users are tracked
+    PRUNE_THRESHOLD = 10000
+
+    def __init__(self, user_rate: float = 1.0, user_burst: float = 5.0, global_rate: float = 20.0,
+                 global_burst: float = 40.0, max_duplicates: int = 2, duplicate_window: float = 30.0,
+                 notice_interval: float = 10.0):
+        """
+        Initialize the admission controller
+
+        Args:
+            user_rate: Messages per second a single member may sustain
+            user_burst: Messages a member may send back to back
+            global_rate: Messages per second relayed across all members
+            global_burst: Global burst size
+            max_duplicates: Identical messages in a row allowed within the window
+            duplicate_window: Seconds after which a repeat no longer counts as duplicate
+            notice_interval: Minimum seconds between throttle notices to one member
+        """
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_duplicates = max_duplicates
+        self.duplicate_window = duplicate_window
+        self.notice_interval = notice_interval
+        self.global_bucket = TokenBucket(global_rate, capacity=global_burst)
+        self.user_buckets: Dict[int, TokenBucket] = {}
+        # user_id -> (fingerprint of last message, times repeated, last seen)
+        self.recent: Dict[int, Tuple[int, int, float]] = {}
+        # user_id -> when the member was last told they are throttled
+        self.notified_at: Dict[int, float] = {}
+        self.rejected: Dict[str, int] = {THROTTLED_USER: 0, THROTTLED_GLOBAL: 0, DUPLICATE: 0}
+
+    def _user_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            if len(self.user_buckets) >= self.PRUNE_THRESHOLD:
+                self._prune()
+            bucket = TokenBucket(self.user_rate, capacity=self.user_burst)
+            self.user_buckets[user_id] = bucket
+        return bucket
+
+    def _prune(self) -> None:
+        """Drop state that no longer affects any decision"""
+        now = time.monotonic()
+        for user_id in [u for u, bucket in self.user_buckets.items() if bucket.is_idle()]:
+            del self.user_buckets[user_id]
+        for user_id in [u for u, entry in self.recent.items() if now - entry[2] > self.duplicate_window]:
+            del self.recent[user_id]
+        for user_id in [u for u, at in self.notified_at.items() if now - at > self.notice_interval]:
+            del self.notified_at[user_id]
+
+    def _reject(self, reason: str) -> str:
+        self.rejected[reason] += 1
+        INGRESS_REJECTED.labels(reason).inc()
+        return reason
+
+    def admit(self, user_id: int, text: str, now: Optional[float] = None) -> str:
+        """
+        Decide whether a member's message may be relayed
+
+        Args:
+            user_id: Sender
+            text: Message text (used for duplicate detection)
+            now: Current monotonic time
+
+        Returns:
+            ADMIT, THROTTLED_USER, THROTTLED_GLOBAL or DUPLICATE
+        """
+        now = time.monotonic() if now is None else now
+
+        # Duplicates are checked first so they never consume rate budget
+        mark = fingerprint(text)
+        previous = self.recent.get(user_id)
+        if previous and previous[0] == mark and now - previous[2] <= self.duplicate_window:
+            repeats = previous[1] + 1
+            self.recent[user_id] = (mark, repeats, now)
+            if repeats > self.max_duplicates:
+                return self._reject(DUPLICATE)
+        else:
+            self.recent[user_id] = (mark, 1, now)
+
+        user_bucket = self._user_bucket(user_id)
+        if user_bucket.try_acquire() > 0:
+            return self._reject(THROTTLED_USER)
+        if self.global_bucket.try_acquire() > 0:
+            # Not this member's fault; give their token back
+            user_bucket.refund()
+            return self._reject(THROTTLED_GLOBAL)
+        return ADMIT
+
+    def should_notify(self, user_id: int, now: Optional[float] = None) -> bool:
+        """Check (and record) whether a throttled member should be told, at most once per interval"""
+        now = time.monotonic() if now is None else now
+        last = self.notified_at.get(user_id)
+        if last is not None and now - last < self.notice_interval:
+            return False
+        self.notified_at[user_id] = now
+        return True
+
+    def set_limit(self, name: str, value: str) -> None:
+        """
+        Change one of LIMITS at runtime
+
+        Args:
+            name: Limit name
+            value: New value as typed by the admin
+
+        Raises:
+            ValueError: If the name is unknown or the value invalid
+        """
+        if name not in self.LIMITS:
+            raise ValueError(f"Unknown limit: {name}")
+        parsed = self.LIMITS[name](value)
+        if parsed <= 0:
+            raise ValueError(f"{name} must be positive")
+        setattr(self, name, parsed)
+        # Rebuild buckets so the new limits apply immediately
+        self.global_bucket = TokenBucket(self.global_rate, capacity=self.global_burst)
+        self.user_buckets.clear()
+
+    def get_limits(self) -> Dict[str, float]:
+        """Get the current value of every adjustable limit"""
+        return {name: getattr(self, name) for name in self.LIMITS}
@@ -0,0 +1,113 @@
+"""
+Simulated Telegram Bot API for benchmarks.
+
+FakeBotApi plugs into python-telegram-bot as the HTTP transport, so the real
+Bot/ExtBot code (request building, response parsing, RetryAfter/Forbidden/
+NetworkError mapping) runs unchanged while responses come from memory after a
+configurable delay.
+
+Usage:
+    api = FakeBotApi(latency=0.05, flood_rate=0.01)
+    bot = AnonymousChatBot(request=api)
+"""
+
+import asyncio
+import json
+import random
+import time
+import zlib
+from collections import Counter
+from typing import Callable, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeBotApi(BaseRequest):
+    def __init__(self, latency: float = 0.05, jitter: float = 0.5, error_rate: float = 0.0,
+                 flood_rate: float = 0.0, retry_after: int = 1, blocked_rate: float = 0.0,
+                 seed: int = 0, on_message: Optional[Callable[[int, str, float], None]] = None):
+        """
+        Initialize the simulated API
+
+        Args:
+            latency: Mean response time in seconds
+            jitter: Random +/- fraction applied to the latency
+            error_rate: Probability of a 502 response (NetworkError, transient)
+            flood_rate: Probability of a 429 response (RetryAfter)
+            retry_after: retry_after seconds sent with 429 responses
+            blocked_rate: Fraction of chats that always answer 403 (Forbidden)
+            seed: Random seed for reproducible runs
+            on_message: Called with (chat_id, text, monotonic time) for every delivered message
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.blocked_rate = blocked_rate
+        self.on_message = on_message
+        self.random = random.Random(seed)
+        self.next_message_id = 1
+        self.calls: Counter = Counter()
+        self.statuses: Counter = Counter()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def is_blocked(self, chat_id: int) -> bool:
+        """Blocked chats are chosen deterministically so retries fail the same way"""
+        return (zlib.crc32(str(chat_id).encode()) % 10000) < self.blocked_rate * 10000
+
+    def _respond(self, method: str, params: dict) -> Tuple[int, dict]:
+        chat_id = params.get("chat_id")
+        if chat_id is not None and method.startswith("send") and self.is_blocked(int(chat_id)):
+            return 403, {"ok": False, "error_code": 403,
+                         "description": "Forbidden: bot was blocked by the user"}
+        roll = self.random.random()
+        if roll < self.flood_rate:
+            return 429, {"ok": False, "error_code": 429,
+                         "description": f"Too Many Requests: retry after {self.retry_after}",
+                         "parameters": {"retry_after": self.retry_after}}
+        if roll < self.flood_rate + self.error_rate:
+            return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+        if method.startswith("send"):
+            text = params.get("text") or params.get("caption") or ""
+            if self.on_message is not None:
+                self.on_message(int(chat_id), text, time.monotonic())
+            if method == "sendMediaGroup":
+                return 200, {"ok": True, "result": [
+                    self._message(chat_id, "") for _ in params.get("media", [])
+                ]}
+            return 200, {"ok": True, "result": self._message(chat_id, text)}
+        return 200, {"ok": True, "result": True}
+
+    def _message(self, chat_id, text: str) -> dict:
+        message_id = self.next_message_id
+        self.next_message_id += 1
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency > 0:
+            spread = self.latency * self.jitter
+            await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-spread, spread)))
+        status, payload = self._respond(api_method, request_data.parameters if request_data else {})
+        self.statuses[status] += 1
+        return status, json.dumps(payload).encode("utf-8")
@@ -0,0 +1,189 @@
+"""
+Benchmark for the Bot API transport: HTTP/1.1 pooling vs HTTP/2 multiplexing.
+
+Runs a local stand-in for the Bot API in a separate process that answers
+every method after a fixed delay, once over HTTP/1.1 (aiohttp) and once
+over cleartext HTTP/2 (h2, prior knowledge), then sends a burst of
+sendMessage calls through transport.PooledRequest with different pool
+sizes. Reports throughput, latency percentiles, the connections actually
+opened and how many requests found the pool saturated. HTTP/2 needs
+python-telegram-bot[http2].
+
+Usage:
+    python benchmarks/http_transport.py [--requests 2000] [--concurrency 100] [--latency 0.02]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aiohttp import web  # noqa: E402
+from telegram import Bot  # noqa: E402
+
+from metrics import HTTP_POOL_SATURATED  # noqa: E402
+from transport import PooledRequest  # noqa: E402
+
+TOKEN = "123456:BENCHMARK"
+USER = {"id": 123456, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+MESSAGE = {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hola"}
+
+
+def response_body(path: str) -> bytes:
+    method = path.rstrip("/").rsplit("/", 1)[-1]
+    return json.dumps({"ok": True, "result": USER if method == "getMe" else MESSAGE}).encode()
+
+
+async def start_http1(latency, connections):
+    async def handle(request):
+        connections.value += request.transport not in seen
+        seen.add(request.transport)
+        await request.read()
+        await asyncio.sleep(latency)
+        return web.Response(body=response_body(request.path), content_type="application/json")
+
+    seen = set()
+    app = web.Application()
+    app.router.add_route("POST", "/{tail:.*}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return site._server.sockets[0].getsockname()[1]
+
+
+async def start_http2(latency, connections):
+    import h2.config
+    import h2.connection
+    import h2.events
+
+    class Http2Protocol(asyncio.Protocol):
+        def connection_made(self, transport):
+            connections.value += 1
+            self.transport = transport
+            self.connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+            self.connection.initiate_connection()
+            self.paths = {}
+            transport.write(self.connection.data_to_send())
+
+        def connection_lost(self, exc):
+            self.transport = None
+
+        def data_received(self, data):
+            for event in self.connection.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    headers = {bytes(name): bytes(value) for name, value in
+                               ((n if isinstance(n, bytes) else n.encode(), v if isinstance(v, bytes) else v.encode())
+                                for n, v in event.headers)}
+                    self.paths[event.stream_id] = headers[b":path"].decode()
+                elif isinstance(event, h2.events.DataReceived):
+                    self.connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    asyncio.ensure_future(self.respond(event.stream_id))
+            self.transport.write(self.connection.data_to_send())
+
+        async def respond(self, stream_id):
+            await asyncio.sleep(latency)
+            if self.transport is None:
+                return
+            body = response_body(self.paths.pop(stream_id))
+            self.connection.send_headers(stream_id, [
+                (":status", "200"), ("content-type", "application/json"), ("content-length", str(len(body))),
+            ])
+            self.connection.send_data(stream_id, body, end_stream=True)
+            self.transport.write(self.connection.data_to_send())
+
+    server = await asyncio.get_running_loop().create_server(Http2Protocol, "127.0.0.1", 0)
+    return server.sockets[0].getsockname()[1]
+
+
+def serve(http_version, latency, connections, ports):
+    """Server process: report the listening port (or None without h2) and serve until killed"""
+    async def main():
+        try:
+            start = start_http1 if http_version == "1.1" else start_http2
+            ports.put(await start(latency, connections))
+        except ImportError:
+            ports.put(None)
+            return
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+async def run_case(label, http_version, pool_size, port, args, connections):
+    request = PooledRequest(
+        label, connection_pool_size=pool_size, http_version=http_version, pool_timeout=60.0,
+        read_timeout=30.0, write_timeout=30.0,
+    )
+    bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{port}/bot", request=request, get_updates_request=request)
+    opened = connections.value
+    await bot.initialize()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def send(index):
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.send_message(chat_id=1, text=f"mensaje {index}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(index) for index in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await bot.shutdown()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:<12} {args.requests / elapsed:>8.0f} req/s {statistics.median(latencies) * 1e3:>8.1f}ms "
+          f"{p99 * 1e3:>8.1f}ms {connections.value - opened:>6} {HTTP_POOL_SATURATED.labels(label).value:>10.0f}")
+
+
+async def run(args):
+    cases = [("1.1", size) for size in args.http1_pools] + [("2", size) for size in args.http2_pools]
+    print(f"{args.requests} sendMessage calls, {args.concurrency} at once, "
+          f"{args.latency * 1e3:.0f}ms simulated API latency")
+    print(f"{'transport':<12} {'throughput':>14} {'p50':>10} {'p99':>10} {'conns':>6} {'saturated':>10}")
+    for http_version in ("1.1", "2"):
+        sizes = [size for version, size in cases if version == http_version]
+        if not sizes:
+            continue
+        connections = multiprocessing.Value("i", 0, lock=False)
+        ports = multiprocessing.Queue()
+        server = multiprocessing.Process(
+            target=serve, args=(http_version, args.latency, connections, ports), daemon=True
+        )
+        server.start()
+        try:
+            port = ports.get(timeout=30)
+            if port is None:
+                print("HTTP/2 skipped: install python-telegram-bot[http2]")
+                continue
+            for size in sizes:
+                await run_case(f"h{http_version[0]}-pool{size}", http_version, size, port, args, connections)
+        finally:
+            server.terminate()
+            server.join()
+
+
+def main():
+    # PTB warns that self-hosted Bot API servers only speak HTTP/1.1; this stand-in speaks both
+    warnings.filterwarnings("ignore", message="You set the HTTP version")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100, help="Requests in flight at once")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated API latency (s)")
+    parser.add_argument("--http1-pools", type=int, nargs="*", default=[1, 20, 100])
+    parser.add_argument("--http2-pools", type=int, nargs="*", default=[1, 2])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+End-to-end load test for AnonymousChatBot against a simulated Bot API.
+
+Seeds a room with N members, then replays synthetic join/chat/leave updates
+through the real Application handlers while delivery workers drain the
+outbound queue into FakeBotApi. Reports update throughput, delivery
+throughput, p50/p99 handler and end-to-end delivery latency, and memory, and
+writes the results as JSON so runs can be compared across commits.
+
+Usage:
+    python benchmarks/load_test.py [--sizes 100 1000 10000] [--events 50]
+        [--latency 0.02] [--error-rate 0.01] [--flood-rate 0.001]
+        [--telegram-limits] [--output load_test.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from telegram import Update  # noqa: E402
+
+from fake_bot_api import FakeBotApi  # noqa: E402
+from main import AnonymousChatBot  # noqa: E402
+from room_manager import RoomManager  # noqa: E402
+
+CHAT_TEXT = re.compile(r": bench-(\d+)$")
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list (None if empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def rss_bytes():
+    """Current resident set size, falling back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_update(bot, update_id, user_id, text):
+    """Build a private-chat text Update as Telegram would deliver it"""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id * 10, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return Update.de_json({"update_id": update_id, "message": message}, bot)
+
+
+def configure_environment(args):
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123456:BENCHMARK",
+        "STATE_BACKEND": "local",
+        "STORAGE_BACKEND": "memory",
+        "OUTBOX_PATH": ":memory:",
+        "BOT_MODE": "polling",
+        "BROADCAST_CONCURRENCY": str(args.concurrency),
+        "DELIVERY_WORKERS": str(args.workers),
+        "BROADCAST_RATE": "30" if args.telegram_limits else "1e9",
+        "BROADCAST_PER_CHAT_RATE": "1" if args.telegram_limits else "1e9",
+        # Measure the relay path, not inbound flood protection
+        "INGRESS_USER_RATE": "1e9",
+        "INGRESS_USER_BURST": "1e9",
+        "INGRESS_GLOBAL_RATE": "1e9",
+        "INGRESS_GLOBAL_BURST": "1e9",
+    })
+    for name in ("PORT", "ADMIN_USER_ID", "SHARDS", "SHARD_ID"):
+        os.environ.pop(name, None)
+
+
+async def run_scenario(members, args):
+    """Run one seeded room size and return its metrics"""
+    rng = random.Random(args.seed)
+    ingest_times = {}
+    chat_latencies = []
+    deliveries = {"all": 0, "chat": 0, "last": None}
+    handler_errors = {}
+
+    def on_message(chat_id, text, now):
+        deliveries["all"] += 1
+        deliveries["last"] = now
+        match = CHAT_TEXT.search(text)
+        if match:
+            deliveries["chat"] += 1
+            chat_latencies.append(now - ingest_times[int(match.group(1))])
+
+    api = FakeBotApi(
+        latency=args.latency, error_rate=args.error_rate, flood_rate=args.flood_rate,
+        retry_after=args.retry_after, blocked_rate=args.blocked_rate, seed=args.seed,
+        on_message=on_message,
+    )
+    bot = AnonymousChatBot(request=api)
+    application = bot.application
+
+    async def on_error(update, context):
+        # Failed replies to the sender surface here instead of as logged tracebacks
+        name = type(context.error).__name__
+        handler_errors[name] = handler_errors.get(name, 0) + 1
+
+    application.add_error_handler(on_error)
+    await application.initialize()
+    await bot.post_init(application)
+
+    rss_before = rss_bytes()
+    room = bot.rooms.get_room(RoomManager.DEFAULT_ROOM)
+    active = []
+    for user_id in range(1, members + 1):
+        name = room.name_generator.get_unique_name(user_id=user_id)
+        room.user_manager.add_user(user_id, user_id * 10, name)
+        bot.rooms.set_user_room(user_id, room)
+        active.append(user_id)
+    seeded_bytes = rss_bytes() - rss_before
+
+    handler_latencies = []
+    counts = {"chat": 0, "join": 0, "leave": 0}
+    next_user_id = members + 1
+    total_weight = args.chat_weight + args.join_weight + args.leave_weight
+    started = time.monotonic()
+
+    for update_id in range(1, args.events + 1):
+        if args.ingress_rate > 0:
+            delay = started + update_id / args.ingress_rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        roll = rng.random() * total_weight
+        if roll < args.chat_weight and active:
+            kind, user_id, text = "chat", rng.choice(active), f"bench-{update_id}"
+            ingest_times[update_id] = time.monotonic()
+        elif roll < args.chat_weight + args.join_weight or not active:
+            kind, user_id, text = "join", next_user_id, "/start"
+            next_user_id += 1
+            active.append(user_id)
+        else:
+            index = rng.randrange(len(active))
+            active[index], active[-1] = active[-1], active[index]
+            kind, user_id, text = "leave", active.pop(), "/leave"
+
+        handler_started = time.monotonic()
+        await application.process_update(make_update(application.bot, update_id, user_id, text))
+        handler_latencies.append(time.monotonic() - handler_started)
+        counts[kind] += 1
+
+    ingest_done = time.monotonic()
+    deadline = ingest_done + args.drain_timeout
+    while bot.outbound_queue.depth() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    undelivered = bot.outbound_queue.depth()
+    finished = deliveries["last"] or time.monotonic()
+    peak_rss = rss_bytes()
+
+    await bot.post_shutdown(application)
+    await application.shutdown()
+
+    elapsed = max(finished - started, 1e-9)
+    return {
+        "members": members,
+        "updates": dict(counts, total=args.events),
+        "ingest_seconds": round(ingest_done - started, 4),
+        "total_seconds": round(elapsed, 4),
+        "updates_per_second": round(args.events / max(ingest_done - started, 1e-9), 2),
+        "deliveries": deliveries["all"],
+        "chat_deliveries": deliveries["chat"],
+        "deliveries_per_second": round(deliveries["all"] / elapsed, 2),
+        "undelivered": undelivered,
+        "handler_errors": handler_errors,
+        "handler_latency": {
+            "p50": percentile(handler_latencies, 0.50),
+            "p99": percentile(handler_latencies, 0.99),
+            "max": max(handler_latencies, default=None),
+        },
+        "delivery_latency": {
+            "p50": percentile(chat_latencies, 0.50),
+            "p99": percentile(chat_latencies, 0.99),
+            "max": max(chat_latencies, default=None),
+        },
+        "api_calls": dict(api.calls),
+        "api_statuses": {str(status): count for status, count in api.statuses.items()},
+        "memory": {
+            "rss_bytes": peak_rss,
+            "seeded_bytes_per_member": round(seeded_bytes / members, 1) if members else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="Members seeded into the room for each run")
+    parser.add_argument("--events", type=int, default=50, help="Updates replayed per run")
+    parser.add_argument("--chat-weight", type=float, default=0.9)
+    parser.add_argument("--join-weight", type=float, default=0.05)
+    parser.add_argument("--leave-weight", type=float, default=0.05)
+    parser.add_argument("--ingress-rate", type=float, default=0.0,
+                        help="Updates per second (0 = as fast as the handlers allow)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mean simulated API latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 502 responses")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after sent with 429s")
+    parser.add_argument("--blocked-rate", type=float, default=0.0, help="Fraction of chats answering 403")
+    parser.add_argument("--concurrency", type=int, default=200, help="BROADCAST_CONCURRENCY")
+    parser.add_argument("--workers", type=int, default=4, help="DELIVERY_WORKERS")
+    parser.add_argument("--telegram-limits", action="store_true",
+                        help="Apply the production 30 msg/s global and 1 msg/s per-chat limits")
+    parser.add_argument("--drain-timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test.json", help="JSON results file ('-' for stdout)")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    configure_environment(args)
+
+    results = []
+    for members in args.sizes:
+        result = asyncio.run(run_scenario(members, args))
+        results.append(result)
+        latency = result["delivery_latency"]
+        print(
+            f"{members:>7} members: {result['updates_per_second']:>8.1f} updates/s  "
+            f"{result['deliveries_per_second']:>9.1f} deliveries/s  "
+            f"delivery p50={latency['p50'] or 0:.3f}s p99={latency['p99'] or 0:.3f}s  "
+            f"rss={result['memory']['rss_bytes'] / 2**20:.1f} MiB  "
+            f"undelivered={result['undelivered']}"
+        )
+
+    report = {
+        "benchmark": "load_test",
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Memory benchmark for the reply-threading message map.
+
+Measures bytes per tracked copy held by MessageMap when relaying messages to
+rooms of different sizes, next to a plain two-dict layout
+({(chat_id, message_id): logical_id} plus {logical_id: {chat_id: message_id}}).
+
+Usage:
+    python benchmarks/memory_message_map.py [--room-sizes 10 1000 10000] [--copies 200000]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from memory_users import measure  # noqa: E402
+from message_map import MessageMap  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--room-sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--copies", type=int, default=200000, help="Copies tracked per run")
+    args = parser.parse_args()
+
+    for room_size in args.room_sizes:
+        messages = max(1, args.copies // room_size)
+
+        def build_map():
+            message_map = MessageMap(capacity=messages, max_copies=args.copies)
+            message_id = 1
+            for _ in range(messages):
+                logical_id = message_map.register(1, 10, message_id)
+                for member in range(room_size):
+                    message_map.add_copy(logical_id, (member + 2) * 10, message_id)
+                message_id += 1
+            return message_map
+
+        def build_dicts():
+            index = {}
+            forward = {}
+            message_id = 1
+            for logical_id in range(messages):
+                index[(10, message_id)] = logical_id
+                copies = forward[logical_id] = {10: message_id}
+                for member in range(room_size):
+                    index[((member + 2) * 10, message_id)] = logical_id
+                    copies[(member + 2) * 10] = message_id
+                message_id += 1
+            return index, forward
+
+        total = messages * room_size
+        for label, build in (("MessageMap", build_map), ("tuple-keyed dicts", build_dicts)):
+            used, built = measure(build)
+            del built
+            print(f"room {room_size:>6}  {messages:>6} msgs  {label:<18} {used / total:7.1f} B/copy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Memory benchmark for the user registry.
+
+Measures bytes per active user held by UserManager (records plus name,
+join-time and idle-expiry indexes) at 10k and 100k members, next to the previous per-user dict layout.
+
+Usage:
+    python benchmarks/memory_users.py [--sizes 10000 100000]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from name_generator import NameGenerator  # noqa: E402
+from user_manager import UserManager, UserRecord  # noqa: E402
+
+
+def measure(build):
+    """Return the bytes still allocated after ``build()`` and the built object"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        generator = NameGenerator()
+        names = [generator.get_unique_name(user_id=user_id) for user_id in range(1, size + 1)]
+
+        def build_manager():
+            manager = UserManager()
+            for user_id, name in enumerate(names, start=1):
+                manager.add_user(user_id, user_id * 10, name)
+            return manager
+
+        def build_records():
+            now = time.time()
+            return {
+                user_id: UserRecord(user_id * 10, name, now)
+                for user_id, name in enumerate(names, start=1)
+            }
+
+        def build_legacy():
+            registry = {}
+            for user_id, name in enumerate(names, start=1):
+                registry[user_id] = {'chat_id': user_id * 10, 'name': name, 'joined_at': time.time()}
+            return registry
+
+        results = []
+        for label, build in (("slotted records", build_records),
+                             ("legacy dict records", build_legacy),
+                             ("UserManager (records + indexes)", build_manager)):
+            used, built = measure(build)
+            results.append((label, used))
+            del built
+        for label, used in results:
+            print(f"{size:>7} users  {label:<38} {used / size:7.1f} B/user")
+
+
+if __name__ == "__main__":
+    main()
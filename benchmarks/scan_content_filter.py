@@ -0,0 +1,128 @@
+"""
+Benchmark for the content filter's per-message cost.
+
+Compiles rule sets of increasing size from random Spanish-looking words and
+times ContentFilter.check over a batch of chat messages, next to the naive
+approach of one compiled word-boundary regex per pattern. The automaton's
+cost should stay flat as the rule set grows; the regex loop's grows with it.
+
+Usage:
+    python benchmarks/scan_content_filter.py [--patterns 10 1000 10000] [--messages 2000]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from content_filter import BLOCK, FLAG, LINK, MASK, PHONE, ContentFilter, fold  # noqa: E402
+
+SYLLABLES = ("ba", "ca", "da", "fe", "gi", "jo", "lu", "ma", "ne", "ño", "pa", "que", "ri", "sa", "to", "vi", "za")
+FILLER = ("hola", "que", "tal", "como", "estás", "yo", "bien", "gracias", "mañana", "vamos", "al", "cine",
+          "alguien", "sabe", "dónde", "está", "la", "fiesta", "jaja", "vale", "nos", "vemos", "luego")
+
+
+def random_word(rng, syllables):
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+
+def make_rules(rng, count):
+    rules = [(MASK, LINK), (FLAG, PHONE)]
+    actions = (BLOCK, MASK, MASK, FLAG)
+    while len(rules) < count:
+        pattern = " ".join(random_word(rng, rng.randint(2, 4)) for _ in range(rng.choice((1, 1, 1, 2))))
+        rules.append((rng.choice(actions), pattern))
+    return rules
+
+
+def make_messages(rng, count, rules):
+    words = [pattern for _, pattern in rules if not pattern.startswith("<")]
+    messages = []
+    for index in range(count):
+        message = [rng.choice(FILLER) for _ in range(rng.randint(5, 25))]
+        if index % 10 == 0:
+            message.insert(rng.randrange(len(message)), rng.choice(words).upper())
+        if index % 50 == 0:
+            message.append("https://t.me/ejemplo")
+        messages.append(" ".join(message))
+    return messages
+
+
+REGRESSION_RULES = [(MASK, "palabra prohibida")]
+
+# (message, text relayed under make_rules' <link> and <phone> rules plus REGRESSION_RULES)
+REGRESSIONS = (
+    # A link prefix must start a word
+    ("awww. que lindo", "awww. que lindo"),
+    ("mira www.ejemplo.com", "mira " + "*" * 15),
+    ("ven a (https://t.me/grupo)", "ven a (" + "*" * 19),
+    # Whitespace between the words of a pattern may be any run of whitespace
+    ("es palabra prohibida", "es ******* *********"),
+    ("es palabra  prohibida", "es *******  *********"),
+    ("es Palabra\t\nPROHIBIDA ya", "es *******\t\n********* ya"),
+    ("palabras prohibidas", "palabras prohibidas"),
+)
+
+
+def check_regressions():
+    content_filter = ContentFilter(make_rules(random.Random(0), 2) + REGRESSION_RULES)
+    for message, expected in REGRESSIONS:
+        relayed = content_filter.check(message).text
+        assert relayed == expected, f"{message!r} relayed as {relayed!r}, expected {expected!r}"
+
+
+def time_per_message(check, messages):
+    started = time.perf_counter()
+    for message in messages:
+        check(message)
+    return (time.perf_counter() - started) / len(messages)
+
+
+def naive_checker(rules):
+    """One regex per word pattern, tried in turn on the folded text"""
+    compiled = [
+        (action, re.compile(r"(?<!\w)" + re.escape(fold(pattern)) + r"(?!\w)"))
+        for action, pattern in rules if not pattern.startswith("<")
+    ]
+
+    def check(text):
+        folded = fold(text)
+        return [action for action, regex in compiled if regex.search(folded)]
+
+    return check
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patterns", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--naive-messages", type=int, default=200,
+                        help="Messages timed for the regex loop (it is slow at large rule sets)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    check_regressions()
+    rng = random.Random(args.seed)
+    fold("warm up the folding table")
+    print(f"{'patterns':>9} {'compile':>9} {'nodes':>8} {'automaton':>11} {'regex loop':>11} {'matched':>8}")
+    for count in args.patterns:
+        rules = make_rules(rng, count)
+        messages = make_messages(rng, args.messages, rules)
+
+        started = time.perf_counter()
+        content_filter = ContentFilter(rules)
+        compile_time = time.perf_counter() - started
+
+        automaton = time_per_message(content_filter.check, messages)
+        naive = time_per_message(naive_checker(rules), messages[:args.naive_messages])
+        matched = sum(1 for message in messages if content_filter.check(message).action)
+        print(f"{count:>9} {compile_time * 1e3:>7.0f}ms {len(content_filter.automaton):>8} "
+              f"{automaton * 1e6:>9.1f}µs {naive * 1e6:>9.1f}µs {matched:>8}")
+
+
+if __name__ == "__main__":
+    main()
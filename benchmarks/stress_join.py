@@ -0,0 +1,138 @@
+"""
+Stress test for concurrent joins.
+
+Pushes a burst of /start, /join and /leave updates from many users through
+the Application's update queue, so they are handled by the concurrent
+update processor exactly as polling or webhook updates would be. Each
+simulated API call yields to the event loop, which lets handlers interleave.
+Once everything is handled it checks the invariants concurrency could break:
+
+- no anonymous name is held by two members of the same room
+- every member is indexed in exactly the room that holds them
+- each room's name allocator marks exactly its members' names as used
+
+Usage:
+    python benchmarks/stress_join.py [--users 2000] [--repeats 3] [--concurrency 256]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_bot_api import FakeBotApi  # noqa: E402
+from load_test import make_update  # noqa: E402
+from main import AnonymousChatBot  # noqa: E402
+
+ROOMS = ("general", "musica", "juegos")
+
+
+def check_invariants(bot):
+    """Return a list of human-readable invariant violations (empty if consistent)"""
+    problems = []
+    seen_users = {}
+    for room in bot.rooms.rooms.values():
+        users = room.user_manager.get_active_users()
+        names = Counter(user_info.name for user_info in users.values())
+        for name, count in names.items():
+            if count > 1:
+                problems.append(f"room {room.name}: name {name!r} held by {count} members")
+        for user_id in users:
+            if user_id in seen_users:
+                problems.append(f"user {user_id} is a member of {seen_users[user_id]} and {room.name}")
+            seen_users[user_id] = room.name
+            if bot.rooms.user_rooms.get(user_id) != room.name:
+                problems.append(f"user {user_id} in {room.name} but indexed in {bot.rooms.user_rooms.get(user_id)}")
+        used = room.name_generator.used_names
+        if set(names) != set(used):
+            problems.append(
+                f"room {room.name}: {len(set(used) - set(names))} names marked used without a member, "
+                f"{len(set(names) - set(used))} members with names not marked used"
+            )
+    for user_id, room_name in bot.rooms.user_rooms.items():
+        if seen_users.get(user_id) != room_name:
+            problems.append(f"user {user_id} indexed in {room_name} but not a member")
+    return problems
+
+
+async def run(args):
+    bot = AnonymousChatBot(request=FakeBotApi(latency=args.latency, seed=args.seed))
+    application = bot.application
+    rng = random.Random(args.seed)
+
+    updates = []
+    update_id = 0
+    for _ in range(args.repeats):
+        for user_id in range(1, args.users + 1):
+            update_id += 1
+            roll = rng.random()
+            if roll < 0.6:
+                text = "/start"
+            elif roll < 0.9:
+                text = f"/join {rng.choice(ROOMS)}"
+            else:
+                text = "/leave"
+            updates.append(make_update(application.bot, update_id, user_id, text))
+    rng.shuffle(updates)
+
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        started = time.monotonic()
+        for update in updates:
+            await application.update_queue.put(update)
+        # Wait for the queue to drain and the last handlers to finish
+        processor = application.update_processor
+        idle_polls = 0
+        while idle_polls < 3:
+            await asyncio.sleep(0.05)
+            idle = application.update_queue.empty() and not len(getattr(processor, "user_locks", ()))
+            idle_polls = idle_polls + 1 if idle else 0
+        elapsed = time.monotonic() - started
+        await application.stop()
+        await bot.post_shutdown(application)
+
+    problems = check_invariants(bot)
+    members = bot.rooms.get_total_user_count()
+    print(f"{len(updates)} updates from {args.users} users in {elapsed:.2f}s "
+          f"({len(updates) / elapsed:.0f} updates/s, concurrency {args.concurrency}); "
+          f"{members} members at the end")
+    for problem in problems[:20]:
+        print(f"  VIOLATION: {problem}")
+    print("OK: no duplicate names or inconsistent membership" if not problems
+          else f"FAILED: {len(problems)} violation(s)")
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=3, help="Updates per user")
+    parser.add_argument("--concurrency", type=int, default=256, help="UPDATE_CONCURRENCY")
+    parser.add_argument("--latency", type=float, default=0.005, help="Mean simulated API latency (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123456:BENCHMARK",
+        "STATE_BACKEND": "local",
+        "STORAGE_BACKEND": "memory",
+        "OUTBOX_PATH": ":memory:",
+        "UPDATE_CONCURRENCY": str(args.concurrency),
+        "BROADCAST_RATE": "1e9",
+        "BROADCAST_PER_CHAT_RATE": "1e9",
+    })
+    for name in ("PORT", "ADMIN_USER_ID", "SHARDS", "SHARD_ID"):
+        os.environ.pop(name, None)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
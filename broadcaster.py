@@ -0,0 +1,325 @@
+"""
+Broadcaster Module
+
+Handles concurrent fan-out of messages to many recipients while respecting
+Telegram's global and per-chat rate limits.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telegram import ReplyParameters
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from media import send_media
+from metrics import SEND_FAILURES, SEND_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Failure classes reported in DeliveryResult.failure
+FAILURE_BLOCKED = 'blocked'
+FAILURE_CHAT_NOT_FOUND = 'chat_not_found'
+FAILURE_RATE_LIMITED = 'rate_limited'
+FAILURE_TRANSIENT = 'transient'
+FAILURE_PERMANENT = 'permanent'
+
+# The member can never be reached again
+UNREACHABLE_FAILURES = (FAILURE_BLOCKED, FAILURE_CHAT_NOT_FOUND)
+# A later attempt may succeed
+RETRYABLE_FAILURES = (FAILURE_RATE_LIMITED, FAILURE_TRANSIENT)
+
+_CHAT_NOT_FOUND_MARKERS = ("chat not found", "user not found", "peer_id_invalid")
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Classify a send failure
+
+    Args:
+        error: Exception raised by the Bot API call
+
+    Returns:
+        One of the FAILURE_* constants
+    """
+    if isinstance(error, RetryAfter):
+        return FAILURE_RATE_LIMITED
+    if isinstance(error, Forbidden):
+        # Blocked by the user, or the account was deactivated
+        return FAILURE_BLOCKED
+    if isinstance(error, BadRequest):
+        # BadRequest subclasses NetworkError but retrying it never helps
+        message = error.message.lower()
+        if any(marker in message for marker in _CHAT_NOT_FOUND_MARKERS):
+            return FAILURE_CHAT_NOT_FOUND
+        return FAILURE_PERMANENT
+    if isinstance(error, (TimedOut, NetworkError)):
+        return FAILURE_TRANSIENT
+    return FAILURE_PERMANENT
+
+
+def _retry_seconds(retry_after) -> float:
+    """Normalize RetryAfter.retry_after (int, float or timedelta) to seconds"""
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TokenBucket:
+    """Asynchronous token bucket used to pace outbound API calls"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Initialize the bucket
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum burst size (defaults to one second worth of tokens)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens accumulated since the last update"""
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available
+
+        Returns:
+            0 if a token was taken, otherwise the seconds to wait before retrying
+        """
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        while True:
+            delay = self.try_acquire()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def refund(self) -> None:
+        """Return a token taken by a request that was not carried out"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float) -> None:
+        """Block the bucket for the given number of seconds (e.g. after a 429)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def is_idle(self) -> bool:
+        """Check whether the bucket is full, i.e. it carries no pacing state"""
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+@dataclass
+class DeliveryResult:
+    """Outcome of delivering one message to one recipient"""
+    user_id: Optional[int]
+    chat_id: int
+    ok: bool
+    message_id: Optional[int] = None
+    error: Optional[Exception] = None
+    attempts: int = 0
+    # FAILURE_* class of the last error, None on success
+    failure: Optional[str] = None
+
+
+class Broadcaster:
+    # Prune idle per-chat buckets once the table grows past this size
+    CHAT_BUCKET_PRUNE_THRESHOLD = 10000
+
+    def __init__(self, bot, max_concurrency: int = 20, global_rate: float = 30.0,
+                 per_chat_rate: float = 1.0, max_retries: int = 3, global_bucket=None):
+        """
+        Initialize the broadcaster
+
+        Args:
+            bot: Object exposing async ``send_message(chat_id=..., text=...)``, the
+                media send methods used by media.send_media and the edit/delete methods
+            max_concurrency: Maximum number of requests in flight at once
+            global_rate: Messages per second allowed across all chats
+            per_chat_rate: Messages per second allowed to a single chat
+            max_retries: Retries per recipient for rate-limit and network errors
+            global_bucket: Bucket pacing every call instead of a local
+                TokenBucket(global_rate), e.g. a shared_state.SharedTokenBucket
+                so several workers split one rate and pause together on a 429
+        """
+        self.bot = bot
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.in_flight = asyncio.Semaphore(self.max_concurrency)
+        self.global_bucket = global_bucket if global_bucket is not None else TokenBucket(global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        """Get or create the rate limiter for a single chat"""
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.CHAT_BUCKET_PRUNE_THRESHOLD:
+                self._prune_chat_buckets()
+            bucket = TokenBucket(self.per_chat_rate, capacity=1.0)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_chat_buckets(self) -> None:
+        """Drop per-chat buckets that are full and therefore carry no state"""
+        idle = [chat_id for chat_id, bucket in self.chat_buckets.items() if bucket.is_idle()]
+        for chat_id in idle:
+            del self.chat_buckets[chat_id]
+
+    async def send(self, chat_id: int, text: str, user_id: Optional[int] = None,
+                   media: Optional[Dict] = None, reply_to_message_id: Optional[int] = None) -> DeliveryResult:
+        """
+        Send one message, waiting for rate-limit tokens and retrying on 429s
+
+        Args:
+            chat_id: Destination chat ID
+            text: Message text
+            user_id: Recipient user ID, carried through to the result
+            media: Media to send by file_id instead of the text
+            reply_to_message_id: Message in the destination chat to reply to
+
+        Returns:
+            DeliveryResult describing the outcome
+        """
+        reply_parameters = None
+        if reply_to_message_id:
+            # The replied-to copy may have been deleted since; send anyway
+            reply_parameters = ReplyParameters(reply_to_message_id, allow_sending_without_reply=True)
+        if media is None:
+            return await self._call(chat_id, user_id, lambda: self.bot.send_message(
+                chat_id=chat_id, text=text, reply_parameters=reply_parameters
+            ))
+        return await self._call(chat_id, user_id, lambda: send_media(self.bot, chat_id, media, reply_parameters))
+
+    async def _call(self, chat_id: int, user_id: Optional[int], request) -> DeliveryResult:
+        """
+        Run one Bot API call for a chat under the rate limits, retrying on 429s
+        and network errors
+
+        Args:
+            chat_id: Chat the call acts on (selects the per-chat bucket)
+            user_id: Recipient user ID, carried through to the result
+            request: Zero-argument function returning the API call's coroutine
+        """
+        result = DeliveryResult(user_id=user_id, chat_id=chat_id, ok=False)
+        chat_bucket = self._chat_bucket(chat_id)
+
+        while result.attempts <= self.max_retries:
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+            result.attempts += 1
+            try:
+                async with self.in_flight:
+                    started = time.perf_counter()
+                    try:
+                        message = await request()
+                    finally:
+                        SEND_LATENCY.observe(time.perf_counter() - started)
+            except Exception as e:
+                result.error = e
+                result.failure = classify_error(e)
+                SEND_FAILURES.labels(type(e).__name__).inc()
+                if result.failure == FAILURE_RATE_LIMITED:
+                    # Flood control applies to the whole bot, so pause every sender
+                    self.global_bucket.pause(_retry_seconds(e.retry_after))
+                elif result.failure == FAILURE_TRANSIENT:
+                    await asyncio.sleep(min(2 ** result.attempts * 0.1, 5.0))
+                else:
+                    break
+            else:
+                result.ok = True
+                result.error = None
+                result.failure = None
+                result.message_id = getattr(message, "message_id", None)
+                break
+
+        return result
+
+    async def _fan_out(self, targets: List, call) -> List[DeliveryResult]:
+        """Run ``call(target)`` for every target with at most max_concurrency in flight"""
+        results: List[Optional[DeliveryResult]] = [None] * len(targets)
+        next_index = 0
+
+        async def worker() -> None:
+            nonlocal next_index
+            while next_index < len(targets):
+                index = next_index
+                next_index += 1
+                results[index] = await call(targets[index])
+
+        worker_count = min(self.max_concurrency, len(targets))
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
+        return results
+
+    async def broadcast(self, recipients: Iterable[Tuple[int, int]], text: str) -> List[DeliveryResult]:
+        """
+        Send a message to many recipients concurrently
+
+        Args:
+            recipients: Iterable of (user_id, chat_id) pairs
+            text: Message text
+
+        Returns:
+            One DeliveryResult per recipient, in the order they were given
+        """
+        return await self._fan_out(
+            list(recipients), lambda target: self.send(target[1], text, user_id=target[0])
+        )
+
+    async def edit(self, chat_id: int, message_id: int, text: str, caption: bool = False,
+                   user_id: Optional[int] = None) -> DeliveryResult:
+        """
+        Replace the text (or caption) of an already delivered message, under
+        the same rate limits and retries as send()
+
+        Args:
+            chat_id: Chat holding the message
+            message_id: Message to edit
+            text: New text
+            caption: Edit the caption of a media message instead of message text
+            user_id: Recipient user ID, carried through to the result
+        """
+        if caption:
+            return await self._call(chat_id, user_id, lambda: self.bot.edit_message_caption(
+                chat_id=chat_id, message_id=message_id, caption=text
+            ))
+        return await self._call(chat_id, user_id, lambda: self.bot.edit_message_text(
+            chat_id=chat_id, message_id=message_id, text=text
+        ))
+
+    async def delete_copies(self, copies: Iterable[Tuple[int, int]]) -> List[DeliveryResult]:
+        """
+        Delete already delivered messages
+
+        Args:
+            copies: Iterable of (chat_id, message_id) pairs
+
+        Returns:
+            One DeliveryResult per copy
+        """
+        return await self._fan_out(list(copies), lambda copy: self._call(
+            copy[0], None, lambda: self.bot.delete_message(chat_id=copy[0], message_id=copy[1])
+        ))
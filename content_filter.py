@@ -0,0 +1,346 @@
+"""
+Content Filter Module
+
+Screening of relayed text for banned words, links and phone numbers. Word
+patterns are compiled once into an Aho-Corasick automaton, so a message is
+scanned in a single pass whatever the size of the ban list; phone numbers
+take one more regular-expression pass. Each rule carries an action: block
+the message, mask the match, or flag the message to the admin.
+
+Rules are read from a text file, one per line:
+
+    # comment
+    block palabra prohibida
+    mask otra
+    flag *estafa*
+    mask <link>
+    flag <phone>
+
+A line without a leading action uses the default action. Patterns match
+whole words, ignoring case, accents and how much whitespace separates their
+words; a leading or trailing ``*`` lets that side match inside a word. ``<link>`` and ``<phone>`` enable the
+built-in link and phone number detectors.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Rule actions, weakest first
+FLAG = 'flag'
+MASK = 'mask'
+BLOCK = 'block'
+ACTIONS = (FLAG, MASK, BLOCK)
+
+# Built-in detectors usable as patterns
+LINK = '<link>'
+PHONE = '<phone>'
+
+# Text starting a link; the match extends to the end of the token
+_LINK_PREFIXES = ('http://', 'https://', 'www.', 't.me/', 'telegram.me/', 'telegram.dog/')
+# 8 to 15 digits, optionally with a leading + and single separators between digits
+_PHONE_RE = re.compile(r'(?<!\w)\+?\d(?:[\s().-]?\d){7,14}(?!\w)')
+# Whitespace that _squeeze changes: runs, or anything but a plain space
+_SQUEEZABLE_RE = re.compile(r'\s\s|[^\S ]')
+_SPACE_RUN_RE = re.compile(r'\s+')
+
+# Pattern kinds
+_WORD = 0
+_LINK = 1
+
+
+@lru_cache(maxsize=None)
+def _fold_table() -> Dict[int, str]:
+    """
+    str.translate table folding case and accents one character to one
+    character, so offsets in folded text are offsets in the original
+    """
+    table = {}
+    for code in range(0x10000):
+        if 0xD800 <= code < 0xE000:
+            continue
+        char = chr(code)
+        decomposed = unicodedata.normalize('NFKD', char)
+        # Only strip combining marks; leave ligatures and the like alone
+        if len(decomposed) > 1 and not all(unicodedata.combining(mark) for mark in decomposed[1:]):
+            decomposed = char
+        base = decomposed[0]
+        folded = base.casefold()
+        if len(folded) != 1:
+            folded = base.lower() if len(base.lower()) == 1 else base
+        if folded != char:
+            table[code] = folded
+    return table
+
+
+def fold(text: str) -> str:
+    """Fold case and accents without changing the length of the text"""
+    return text.translate(_fold_table())
+
+
+def _squeeze(text: str) -> Tuple[str, Optional[List[int]]]:
+    """
+    Collapse each run of whitespace to a single space, as in rule patterns
+
+    Returns:
+        (squeezed text, offset in ``text`` of each squeezed offset plus one
+        for the end, or None if the text had nothing to collapse)
+    """
+    if not _SQUEEZABLE_RE.search(text):
+        return text, None
+    pieces = []
+    offsets = []
+    position = 0
+    for run in _SPACE_RUN_RE.finditer(text):
+        pieces.append(text[position:run.start()])
+        pieces.append(' ')
+        offsets.extend(range(position, run.start() + 1))
+        position = run.end()
+    pieces.append(text[position:])
+    offsets.extend(range(position, len(text) + 1))
+    return "".join(pieces), offsets
+
+
+class FilterResult:
+    __slots__ = ('text', 'blocked', 'masked', 'flagged')
+
+    def __init__(self, text: str, blocked: bool = False, masked: Optional[List[str]] = None,
+                 flagged: Optional[List[str]] = None):
+        # Text to relay, with masked matches replaced by asterisks
+        self.text = text
+        self.blocked = blocked
+        # Matched fragments of the original text, per action
+        self.masked = masked or []
+        self.flagged = flagged or []
+
+    @property
+    def action(self) -> Optional[str]:
+        """Strongest action applied, or None if nothing matched"""
+        if self.blocked:
+            return BLOCK
+        if self.masked:
+            return MASK
+        if self.flagged:
+            return FLAG
+        return None
+
+
+def parse_rules(text: str, default_action: str = MASK) -> List[Tuple[str, str]]:
+    """
+    Parse a rules file
+
+    Args:
+        text: File contents
+        default_action: Action of lines that do not start with one
+
+    Returns:
+        (action, pattern) pairs in file order
+    """
+    if default_action not in ACTIONS:
+        raise ValueError(f"Unknown content filter action: {default_action}")
+    rules = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        action, _, pattern = line.partition(' ')
+        if action.lower() in ACTIONS and pattern.strip():
+            rules.append((action.lower(), pattern.strip()))
+        else:
+            rules.append((default_action, line))
+    return rules
+
+
+class Automaton:
+    """Aho-Corasick automaton over folded text"""
+
+    def __init__(self, patterns: Sequence[str]):
+        """
+        Args:
+            patterns: Non-empty, already folded patterns; an index into this
+                sequence is reported for each match
+        """
+        self.lengths = [len(pattern) for pattern in patterns]
+        # Per node: transitions, failure link, patterns ending here, and the
+        # nearest node down the failure chain that has patterns ending at it
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[Tuple[int, ...]] = [()]
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = goto[node][char] = len(goto)
+                    goto.append({})
+                    outputs.append(())
+                node = next_node
+            outputs[node] += (index,)
+
+        fail = [0] * len(goto)
+        output_link = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                target = goto[state].get(char, 0)
+                fail[child] = target if target != child else 0
+                output_link[child] = fail[child] if outputs[fail[child]] else output_link[fail[child]]
+                queue.append(child)
+
+        self.goto = goto
+        self.fail = fail
+        self.outputs = outputs
+        self.output_link = output_link
+
+    def __len__(self) -> int:
+        return len(self.goto)
+
+    def find(self, text: str) -> List[Tuple[int, int, int]]:
+        """
+        Find every occurrence of every pattern
+
+        Returns:
+            (start, end, pattern index) per occurrence, in order of end offset
+        """
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        output_link = self.output_link
+        lengths = self.lengths
+        matches = []
+        node = 0
+        for end, char in enumerate(text, 1):
+            next_node = goto[node].get(char)
+            while next_node is None and node:
+                node = fail[node]
+                next_node = goto[node].get(char)
+            if next_node is None:
+                node = 0
+                continue
+            node = next_node
+            hit = node if outputs[node] else output_link[node]
+            while hit:
+                for index in outputs[hit]:
+                    matches.append((end - lengths[index], end, index))
+                hit = output_link[hit]
+        return matches
+
+
+class ContentFilter:
+    def __init__(self, rules: Sequence[Tuple[str, str]] = ()):
+        """
+        Compile rules into a filter
+
+        Args:
+            rules: (action, pattern) pairs, see parse_rules
+        """
+        # (folded pattern, kind, whole word on the left, on the right) -> action;
+        # a pattern listed twice keeps its strongest action
+        compiled: Dict[Tuple[str, int, bool, bool], str] = {}
+        self.phone_action: Optional[str] = None
+
+        def add(pattern: str, action: str, kind: int, left: bool, right: bool) -> None:
+            key = (pattern, kind, left, right)
+            previous = compiled.get(key)
+            if previous is None or ACTIONS.index(action) > ACTIONS.index(previous):
+                compiled[key] = action
+
+        for action, pattern in rules:
+            if action not in ACTIONS:
+                raise ValueError(f"Unknown content filter action: {action}")
+            if pattern.lower() == LINK:
+                for prefix in _LINK_PREFIXES:
+                    # Links start a word ("awww." is not one) but may run on after the prefix
+                    add(prefix, action, _LINK, True, False)
+            elif pattern.lower() == PHONE:
+                if self.phone_action is None or ACTIONS.index(action) > ACTIONS.index(self.phone_action):
+                    self.phone_action = action
+            else:
+                left = not pattern.startswith('*')
+                right = not pattern.endswith('*')
+                folded = " ".join(fold(pattern.strip('*')).split())
+                if folded:
+                    add(folded, action, _WORD, left, right)
+
+        # (action, kind, left, right) per automaton pattern
+        self.rules = [(action, kind, left, right) for (_, kind, left, right), action in compiled.items()]
+        self.automaton = Automaton([pattern for pattern, _, _, _ in compiled])
+        # Rules as listed, not automaton patterns (<link> compiles to several)
+        self.rule_count = len(rules)
+
+    @classmethod
+    def from_file(cls, path: str, default_action: str = MASK) -> 'ContentFilter':
+        """Compile the rules file at ``path`` (see the module docstring for its format)"""
+        with open(path, encoding='utf-8') as rules_file:
+            return cls(parse_rules(rules_file.read(), default_action))
+
+    def __len__(self) -> int:
+        return self.rule_count
+
+    def _matches(self, text: str) -> List[Tuple[int, int, str]]:
+        """(start, end, action) of each rule match in the original text"""
+        # Patterns have single spaces between words, so "palabra \t prohibida"
+        # is scanned as "palabra prohibida" and offsets are mapped back after
+        scanned, offsets = _squeeze(fold(text))
+        matches = []
+        rules = self.rules
+        link_end = 0
+        for start, end, index in self.automaton.find(scanned):
+            action, kind, left, right = rules[index]
+            if left and start and scanned[start - 1].isalnum():
+                continue
+            if right and end < len(scanned) and scanned[end].isalnum():
+                continue
+            if offsets is not None:
+                start, end = offsets[start], offsets[end - 1] + 1
+            if kind == _LINK:
+                if start < link_end:
+                    # Another prefix inside a link already found (https://t.me/...)
+                    continue
+                # The link runs to the end of the token it starts in
+                while end < len(text) and not text[end].isspace():
+                    end += 1
+                link_end = end
+            matches.append((start, end, action))
+        if self.phone_action:
+            matches.extend((found.start(), found.end(), self.phone_action) for found in _PHONE_RE.finditer(text))
+        return matches
+
+    def check(self, text: str) -> FilterResult:
+        """
+        Screen a message
+
+        Args:
+            text: Message text as sent
+
+        Returns:
+            What to relay and which rules matched
+        """
+        if not self.rule_count or not text:
+            return FilterResult(text)
+        matches = self._matches(text)
+        if not matches:
+            return FilterResult(text)
+
+        result = FilterResult(text)
+        spans = []
+        for start, end, action in matches:
+            fragment = text[start:end]
+            if action == BLOCK:
+                result.blocked = True
+            elif action == MASK:
+                result.masked.append(fragment)
+                spans.append((start, end))
+            else:
+                result.flagged.append(fragment)
+        if spans and not result.blocked:
+            chars = list(text)
+            for start, end in spans:
+                for offset in range(start, end):
+                    if not chars[offset].isspace():
+                        chars[offset] = '*'
+            result.text = "".join(chars)
+        return result
@@ -0,0 +1,149 @@
+"""
+Digest Module
+
+Opt-in batching of relayed lines: instead of one Telegram message per line,
+members in digest mode receive every line of a short window (or up to the
+message size limit) as a single combined message, in order.
+"""
+
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from storage import MemoryStorage
+
+# Telegram's maximum message length
+MAX_MESSAGE_CHARS = 4096
+
+
+class _PendingDigest:
+    __slots__ = ('chat_id', 'lines', 'size', 'deadline')
+
+    def __init__(self, chat_id: int, deadline: float):
+        self.chat_id = chat_id
+        self.lines: List[str] = []
+        self.size = 0
+        self.deadline = deadline
+
+
+class DigestBuffer:
+    STORAGE_NAMESPACE = 'digest'
+
+    def __init__(self, storage: Optional[MemoryStorage] = None, window: float = 3.0,
+                 max_chars: int = MAX_MESSAGE_CHARS):
+        """
+        Initialize the digest buffer, restoring opted-in users from storage
+
+        Args:
+            storage: Persistence backend for the opt-in set
+            window: Seconds between the first buffered line and delivery
+            max_chars: Maximum length of one combined message
+        """
+        self.storage = storage or MemoryStorage()
+        self.window = window
+        self.max_chars = max_chars
+        self.enabled: Set[int] = {int(user_id) for user_id in self.storage.load(self.STORAGE_NAMESPACE)}
+        self.pending: Dict[int, _PendingDigest] = {}
+        # (deadline, user_id) in deadline order; the window is fixed, so
+        # insertion order is deadline order. Entries whose buffer was already
+        # sent (size overflow) are skipped when popped
+        self._deadlines: Deque[Tuple[float, int]] = deque()
+
+    def set_enabled(self, user_id: int, enabled: bool) -> None:
+        """Turn digest mode on or off for a user"""
+        if enabled:
+            self.enabled.add(user_id)
+            self.storage.put(self.STORAGE_NAMESPACE, user_id, True)
+        else:
+            self.enabled.discard(user_id)
+            self.storage.delete(self.STORAGE_NAMESPACE, user_id)
+
+    def is_enabled(self, user_id: int) -> bool:
+        """Check whether a user receives digests"""
+        return user_id in self.enabled
+
+    def apply_changes(self, changes: Dict[str, Tuple[bool, Dict[str, object]]]) -> None:
+        """Apply opt-in changes made by another worker (see SharedStorage.fetch_changes)"""
+        change = changes.get(self.STORAGE_NAMESPACE)
+        if change is None:
+            return
+        full, records = change
+        if full:
+            self.enabled = {int(user_id) for user_id in records}
+            return
+        for user_id, value in records.items():
+            if value is None:
+                self.enabled.discard(int(user_id))
+            else:
+                self.enabled.add(int(user_id))
+
+    def add(self, user_id: int, chat_id: int, line: str,
+            now: Optional[float] = None) -> Optional[Tuple[int, int, str]]:
+        """
+        Buffer a line for a recipient
+
+        Args:
+            user_id: Recipient user ID
+            chat_id: Recipient chat ID
+            line: Relayed line, already attributed to its anonymous name
+            now: Current monotonic time
+
+        Returns:
+            (user_id, chat_id, text) to send right away when the line would push
+            the buffer past max_chars, otherwise None
+        """
+        now = time.monotonic() if now is None else now
+        ready = None
+        digest = self.pending.get(user_id)
+        if digest is not None and digest.size + 1 + len(line) > self.max_chars:
+            ready = self._take(user_id)
+            digest = None
+        if digest is None:
+            digest = _PendingDigest(chat_id, now + self.window)
+            self.pending[user_id] = digest
+            self._deadlines.append((digest.deadline, user_id))
+        digest.lines.append(line)
+        digest.size += len(line) + (1 if digest.size else 0)
+        return ready
+
+    def _take(self, user_id: int) -> Tuple[int, int, str]:
+        digest = self.pending.pop(user_id)
+        return user_id, digest.chat_id, "\n".join(digest.lines)
+
+    def pop_user(self, user_id: int) -> Optional[Tuple[int, int, str]]:
+        """Take a user's buffer early (e.g. ahead of media that cannot be buffered)"""
+        if user_id not in self.pending:
+            return None
+        return self._take(user_id)
+
+    def next_deadline(self) -> Optional[float]:
+        """Monotonic time at which the oldest buffer is due, or None if empty"""
+        while self._deadlines:
+            deadline, user_id = self._deadlines[0]
+            digest = self.pending.get(user_id)
+            if digest is not None and digest.deadline == deadline:
+                return deadline
+            self._deadlines.popleft()
+        return None
+
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[int, int, str]]:
+        """
+        Take every buffer whose window has elapsed
+
+        Returns:
+            (user_id, chat_id, text) for each combined message to send
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, user_id = self._deadlines.popleft()
+            digest = self.pending.get(user_id)
+            if digest is not None and digest.deadline == deadline:
+                ready.append(self._take(user_id))
+        return ready
+
+    def pop_all(self) -> List[Tuple[int, int, str]]:
+        """Take every buffer regardless of its window (e.g. at shutdown)"""
+        ready = [self._take(user_id) for user_id in list(self.pending)]
+        self._deadlines.clear()
+        return ready
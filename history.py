@@ -0,0 +1,159 @@
+"""
+History Module
+
+Recent relayed messages per room, so members can catch up on what was said
+before they joined. Each room keeps a fixed-capacity ring of lines that is
+bounded both by message count and by total UTF-8 bytes.
+"""
+
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+
+class HistoryBuffer:
+    def __init__(self, capacity: int = 200, max_bytes: int = 64 * 1024):
+        """
+        Args:
+            capacity: Messages kept; the oldest is dropped first
+            max_bytes: Total UTF-8 size of the kept messages
+        """
+        self.capacity = max(1, capacity)
+        self.max_bytes = max_bytes
+        self._lines: List[Optional[str]] = [None] * self.capacity
+        self._sizes = array('q', bytes(8 * self.capacity))
+        self._times = array('d', bytes(8 * self.capacity))
+        # Logical message IDs (see message_map.py), 0 when untracked
+        self._refs = array('q', bytes(8 * self.capacity))
+        # Slot of the oldest message and number of slots in use
+        self.start = 0
+        self.count = 0
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _drop_oldest(self) -> None:
+        self.bytes -= self._sizes[self.start]
+        self._lines[self.start] = None
+        self._sizes[self.start] = 0
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+
+    def add(self, line: str, ref: Optional[int] = None, now: Optional[float] = None) -> bool:
+        """
+        Append a relayed message
+
+        Args:
+            line: Message as relayed, with the sender's anonymous name
+            ref: Logical ID of the message, so it can later be edited or removed
+            now: Time the message was relayed
+
+        Returns:
+            False if the line alone exceeds max_bytes and was not kept
+        """
+        size = len(line.encode('utf-8'))
+        if size > self.max_bytes:
+            return False
+        while self.count and (self.count == self.capacity or self.bytes + size > self.max_bytes):
+            self._drop_oldest()
+        slot = (self.start + self.count) % self.capacity
+        self._lines[slot] = line
+        self._sizes[slot] = size
+        self._times[slot] = time.time() if now is None else now
+        self._refs[slot] = ref or 0
+        self.count += 1
+        self.bytes += size
+        return True
+
+    def _find(self, ref: int) -> Optional[int]:
+        """Slot holding a logical message ID, newest first"""
+        if not ref:
+            return None
+        for offset in range(self.count - 1, -1, -1):
+            slot = (self.start + offset) % self.capacity
+            if self._refs[slot] == ref and self._lines[slot] is not None:
+                return slot
+        return None
+
+    def replace(self, ref: int, line: str) -> bool:
+        """Update an edited message in place; False if it is no longer kept"""
+        slot = self._find(ref)
+        if slot is None:
+            return False
+        size = len(line.encode('utf-8'))
+        if self.bytes - self._sizes[slot] + size > self.max_bytes:
+            # Cannot grow past the byte budget in place; drop it instead
+            return self.remove(ref)
+        self.bytes += size - self._sizes[slot]
+        self._lines[slot] = line
+        self._sizes[slot] = size
+        return True
+
+    def remove(self, ref: int) -> bool:
+        """Blank a deleted message; its slot is reclaimed when it becomes the oldest"""
+        slot = self._find(ref)
+        if slot is None:
+            return False
+        self.bytes -= self._sizes[slot]
+        self._lines[slot] = None
+        self._sizes[slot] = 0
+        return True
+
+    def recent(self, limit: Optional[int] = None) -> List[Tuple[float, str]]:
+        """
+        Get the most recent messages
+
+        Args:
+            limit: Maximum number of messages (defaults to all kept)
+
+        Returns:
+            (relayed at, line) pairs, oldest first
+        """
+        entries = []
+        for offset in range(self.count - 1, -1, -1):
+            if limit is not None and len(entries) >= limit:
+                break
+            slot = (self.start + offset) % self.capacity
+            line = self._lines[slot]
+            if line is not None:
+                entries.append((self._times[slot], line))
+        entries.reverse()
+        return entries
+
+
+class HistoryStore:
+    def __init__(self, capacity: int = 200, max_bytes: int = 64 * 1024, max_rooms: int = 0):
+        """
+        Args:
+            capacity: Messages kept per room
+            max_bytes: Total UTF-8 size kept per room
+            max_rooms: Rooms kept; the least recently used is dropped first (0 = no limit)
+        """
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.max_rooms = max_rooms
+        # In least recently used order
+        self.rooms: Dict[str, HistoryBuffer] = {}
+
+    def get(self, room_name: str) -> HistoryBuffer:
+        """Get a room's buffer, creating it on first use"""
+        buffer = self.rooms.pop(room_name, None)
+        if buffer is None:
+            buffer = HistoryBuffer(self.capacity, self.max_bytes)
+            if self.max_rooms and len(self.rooms) >= self.max_rooms:
+                del self.rooms[next(iter(self.rooms))]
+        self.rooms[room_name] = buffer
+        return buffer
+
+    def discard(self, room_name: str) -> None:
+        """Forget a deleted room's messages"""
+        self.rooms.pop(room_name, None)
+
+    def replace(self, ref: int, line: str) -> bool:
+        """Update an edited message in whichever room holds it"""
+        return any(buffer.replace(ref, line) for buffer in self.rooms.values())
+
+    def remove(self, ref: int) -> bool:
+        """Remove a deleted message from whichever room holds it"""
+        return any(buffer.remove(ref) for buffer in self.rooms.values())
@@ -0,0 +1,106 @@
+"""
+HTTP Server Module
+
+Local aiohttp server for the bot: receives webhook updates from Telegram
+(verified with the secret token header) and exposes health, readiness and
+Prometheus metrics routes for the hosting platform.
+"""
+
+import hmac
+import json
+import logging
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class BotHttpServer:
+    def __init__(self, application: Application, host: str = "0.0.0.0", port: int = 8080,
+                 webhook_path: Optional[str] = None, secret_token: Optional[str] = None):
+        """
+        Initialize the server
+
+        Args:
+            application: Application whose update queue receives webhook updates
+            host: Interface to bind
+            port: Port to bind
+            webhook_path: URL path for Telegram updates (None disables the webhook route)
+            secret_token: Expected value of the secret token header
+        """
+        self.application = application
+        self.host = host
+        self.port = port
+        self.webhook_path = webhook_path
+        self.secret_token = secret_token
+        self.runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/healthz", self.handle_health)
+        self.app.router.add_get("/readyz", self.handle_ready)
+        self.app.router.add_get("/metrics", self.handle_metrics)
+        if webhook_path:
+            self.app.router.add_post(f"/{webhook_path.strip('/')}", self.handle_update)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        """Liveness: the process is up and serving requests"""
+        return web.Response(text="ok")
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        """Readiness: the application has started processing updates"""
+        if self.application.running:
+            return web.Response(text="ready")
+        return web.Response(status=503, text="starting")
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Prometheus scrape endpoint"""
+        return web.Response(
+            body=REGISTRY.render().encode("utf-8"),
+            headers={"Content-Type": METRICS_CONTENT_TYPE},
+        )
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Verify and enqueue one Update posted by Telegram"""
+        if self.secret_token is not None:
+            received = request.headers.get(SECRET_TOKEN_HEADER, "")
+            if not hmac.compare_digest(received, self.secret_token):
+                return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return web.Response(status=400)
+        # Valid JSON that is not an object (a list, a string...) is not an Update
+        if not isinstance(data, dict):
+            return web.Response(status=400)
+
+        try:
+            update = Update.de_json(data, self.application.bot)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            update = None
+        if update is None:
+            return web.Response(status=400)
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def start(self) -> None:
+        """Bind and start serving"""
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        """Stop serving and release the port"""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
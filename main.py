@@ -6,12 +6,43 @@ random unique names and can chat without revealing their identities.
 """
 
 import os
+import asyncio
 import logging
+import signal
 import time
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from name_generator import NameGenerator  
-from user_manager import UserManager
+from typing import Dict, List, Optional, Tuple
+from telegram import Bot, InlineKeyboardMarkup, Update
+from telegram.request import BaseRequest
+from telegram.error import BadRequest
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters, ContextTypes
+from room_manager import CREATE_THROTTLED, ROOM_LIMIT, RoomManager, Room, normalize_room_name
+from name_generator import normalize_name
+from name_catalog import load_catalog
+from broadcaster import Broadcaster
+from message_queue import EDIT_CAPTION, EDIT_TEXT, OutboundQueue, DeliveryWorkers
+from storage import create_storage
+from digest import DigestBuffer
+from admission import AdmissionController, ADMIT, DUPLICATE, THROTTLED_GLOBAL, THROTTLED_USER
+from content_filter import ContentFilter
+from media import MediaGroupCollector, attribute, extract_media
+from message_map import MessageMap
+from presence import JOINED, KICKED, LEFT, PresenceCoalescer
+from roster import MAX_PAGE_CHARS, RosterCache, chunk_lines, page_keyboard, paginate
+from history import HistoryStore
+from update_processor import UserOrderedUpdateProcessor
+from transport import API, DELIVERY, UPDATES, request_from_env
+from shared_state import InProcessBackend, RedisBackend, SharedStorage, SharedOutboundQueue, SharedTokenBucket, StateSync
+from metrics import ACTIVE_USERS, BROADCAST_SIZE, CONTENT_FILTERED, HANDLER_LATENCY, MEMBERS_EVICTED, QUEUE_DEPTH
+
+# Media relayed by handle_media, and how each kind is named to users
+MEDIA_FILTER = filters.PHOTO | filters.Sticker.ALL | filters.VOICE | filters.VIDEO | filters.Document.ALL
+MEDIA_LABELS = {
+    'photo': ("Foto", "enviada"),
+    'video': ("Vídeo", "enviado"),
+    'document': ("Documento", "enviado"),
+    'voice': ("Nota de voz", "enviada"),
+    'sticker': ("Sticker", "enviado"),
+}
 
 # Configure logging
 logging.basicConfig(
@@ -21,199 +52,1050 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class AnonymousChatBot:
-    def __init__(self):
-        """Initialize the bot with token from environment variable"""
+    def __init__(self, request: Optional[BaseRequest] = None):
+        """
+        Initialize the bot with token from environment variable
+        
+        Args:
+            request: Bot API transport override (e.g. a simulated API for benchmarks)
+        """
         self.token = os.getenv('TELEGRAM_BOT_TOKEN')
         if not self.token:
             raise ValueError("TELEGRAM_BOT_TOKEN environment variable is required")
         
-        # Initialize components
-        self.name_generator = NameGenerator()
-        self.user_manager = UserManager()
+        # Shared state lets several worker processes serve the same bot:
+        # "local" (default) keeps state in this process, "inprocess" and
+        # "redis" route storage and the outbound queue through a shared backend
+        self.state_backend = os.getenv('STATE_BACKEND', 'local').lower()
+        self.worker_id = os.getenv('WORKER_ID')
+        # "all" (default), "ingest" (handle updates only) or "delivery" (send only)
+        self.worker_role = os.getenv('WORKER_ROLE', 'all').lower()
+        if self.worker_role not in ('all', 'ingest', 'delivery'):
+            raise ValueError(f"Unknown WORKER_ROLE: {self.worker_role}")
+        self.shared_backend = None
+        if self.state_backend == 'redis':
+            # Each delivering worker resumes the items claimed under its id
+            # after a restart, so the id must be stable and unique
+            if not self.worker_id and self.worker_role != 'ingest':
+                raise ValueError("WORKER_ID environment variable is required with STATE_BACKEND=redis")
+            self.shared_backend = RedisBackend(os.getenv('REDIS_URL'))
+        elif self.state_backend == 'inprocess':
+            self.shared_backend = InProcessBackend()
+        elif self.state_backend != 'local':
+            raise ValueError(f"Unknown STATE_BACKEND: {self.state_backend}")
+        
+        # Initialize components on top of the configured storage backend
+        if self.shared_backend is not None:
+            self.storage = SharedStorage(self.shared_backend)
+        else:
+            self.storage = create_storage(os.getenv('STORAGE_BACKEND', 'memory'), os.getenv('STORAGE_PATH'))
+        self.storage_flush_interval = float(os.getenv('STORAGE_FLUSH_INTERVAL', '2'))
+        # Rooms are assigned to shards by consistent hashing; SHARDS lists every
+        # shard and SHARD_ID names the one this process hosts. At most MAX_ROOMS
+        # rooms exist at once (0 = no limit), each user may create one every
+        # ROOM_CREATE_INTERVAL seconds, and empty rooms are deleted
+        shards = [shard.strip() for shard in os.getenv('SHARDS', '0').split(',') if shard.strip()]
+        self.rooms = RoomManager(
+            self.storage,
+            seed=int(os.getenv('NAME_SEED', '0')),
+            shards=shards,
+            shard_id=os.getenv('SHARD_ID'),
+            max_rooms=int(os.getenv('MAX_ROOMS', '500')),
+            create_interval=float(os.getenv('ROOM_CREATE_INTERVAL', '60')),
+        )
+        # Opt-in batching of relayed lines into one message per recipient
+        self.digest = DigestBuffer(
+            self.storage,
+            window=float(os.getenv('DIGEST_WINDOW', '3')),
+            max_chars=int(os.getenv('DIGEST_MAX_CHARS', '4096')),
+        )
+        self.digest_pending = asyncio.Event()
+        # Albums arrive one update per item and are relayed as one media group
+        self.media_groups = MediaGroupCollector(delay=float(os.getenv('MEDIA_GROUP_DELAY', '1')))
+        self.media_groups_pending = asyncio.Event()
+        # Relayed messages and their copies, so replies, edits and deletes
+        # reach the matching message in every member's chat
+        self.message_map = MessageMap(
+            capacity=int(os.getenv('REPLY_MAP_CAPACITY', '4096')),
+            max_copies=int(os.getenv('REPLY_MAP_MAX_COPIES', '200000')),
+            ttl=float(os.getenv('REPLY_MAP_TTL', str(48 * 3600))),
+        )
+        # Join/leave notices are summarized per room over a short window;
+        # rooms above PRESENCE_QUIET_ROOM_SIZE members get none (0 = no limit)
+        self.presence = PresenceCoalescer(
+            window=float(os.getenv('PRESENCE_WINDOW', '5')),
+            max_names=int(os.getenv('PRESENCE_MAX_NAMES', '10')),
+            quiet_room_size=int(os.getenv('PRESENCE_QUIET_ROOM_SIZE', '0')),
+        )
+        self.presence_pending = asyncio.Event()
+        # Recent relayed messages per room for /history and catch-up on join
+        # (HISTORY_CATCHUP messages, 0 disables)
+        self.history = HistoryStore(
+            capacity=int(os.getenv('HISTORY_SIZE', '200')),
+            max_bytes=int(os.getenv('HISTORY_MAX_BYTES', str(64 * 1024))),
+            max_rooms=self.rooms.max_rooms,
+        )
+        self.history_catchup = int(os.getenv('HISTORY_CATCHUP', '20'))
+        # Rendered, paginated member lists for /users and /realusers
+        self.roster = RosterCache(page_size=int(os.getenv('ROSTER_PAGE_SIZE', '50')))
+        self.rooms.deletion_listeners += [self.history.discard, self.roster.discard]
+        self.state_sync = None
+        if self.shared_backend is not None:
+            self.state_sync = StateSync(
+                self.storage, self.rooms, interval=float(os.getenv('STATE_SYNC_INTERVAL', '1')),
+                listeners=[self.digest],
+            )
+        
+        # Members idle for IDLE_TTL seconds go dormant (no broadcasts) until
+        # they send a message or /start again; 0 disables expiry
+        self.idle_ttl = float(os.getenv('IDLE_TTL', str(7 * 24 * 3600)))
+        self.idle_check_interval = float(os.getenv('IDLE_CHECK_INTERVAL', '60'))
+        
+        # Inbound flood protection, adjustable at runtime with /admin limit
+        self.admission = AdmissionController(
+            user_rate=float(os.getenv('INGRESS_USER_RATE', '1')),
+            user_burst=float(os.getenv('INGRESS_USER_BURST', '5')),
+            global_rate=float(os.getenv('INGRESS_GLOBAL_RATE', '20')),
+            global_burst=float(os.getenv('INGRESS_GLOBAL_BURST', '40')),
+            max_duplicates=int(os.getenv('INGRESS_MAX_DUPLICATES', '2')),
+        )
+        
+        # Banned words, links and phone numbers; reloadable with /admin filter reload
+        self.content_filter_path = os.getenv('CONTENT_FILTER_PATH')
+        self.content_filter_default_action = os.getenv('CONTENT_FILTER_DEFAULT_ACTION', 'mask').lower()
+        self.content_filter = (
+            ContentFilter.from_file(self.content_filter_path, self.content_filter_default_action)
+            if self.content_filter_path else ContentFilter()
+        )
         
         # Admin configuration
         admin_id = os.getenv('ADMIN_USER_ID')
         self.admin_user_id = int(admin_id) if admin_id else None
         
+        # Run mode: "polling" (default) or "webhook"
+        self.mode = os.getenv('BOT_MODE', 'polling').lower()
+        if self.mode not in ('polling', 'webhook'):
+            raise ValueError(f"Unknown BOT_MODE: {self.mode}")
+        self.webhook_url = os.getenv('WEBHOOK_URL')
+        self.webhook_path = os.getenv('WEBHOOK_PATH', 'telegram')
+        self.webhook_secret = os.getenv('WEBHOOK_SECRET')
+        if self.mode == 'webhook' and not (self.webhook_url and self.webhook_secret):
+            raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET are required in webhook mode")
+        
         # Create application
-        self.application = Application.builder().token(self.token).build()
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+        )
+        if request is not None:
+            builder = builder.request(request)
+        else:
+            # Separate pools for handler calls and for long polling (see transport.py)
+            builder = (
+                builder
+                .request(request_from_env(API, pool_size=256))
+                .get_updates_request(request_from_env(UPDATES, pool_size=1))
+            )
+        # Updates from different users are handled concurrently; each user's own
+        # updates still run one at a time, in order
+        update_concurrency = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+        if update_concurrency > 1:
+            builder = builder.concurrent_updates(UserOrderedUpdateProcessor(update_concurrency))
+        self.application = builder.build()
+        
+        # Concurrent, rate-limited fan-out, through its own connection pool sized
+        # to its concurrency so broadcasts never wait on handler replies
+        broadcast_concurrency = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+        if request is not None:
+            self.delivery_bot = self.application.bot
+        else:
+            delivery_request = request_from_env(DELIVERY, pool_size=broadcast_concurrency)
+            self.delivery_bot = Bot(self.token, request=delivery_request, get_updates_request=delivery_request)
+        # BROADCAST_RATE is the bot's total; with a shared backend every worker
+        # draws on one bucket, which a 429 pauses for all of them
+        global_rate = float(os.getenv('BROADCAST_RATE', '30'))
+        global_bucket = None
+        if self.shared_backend is not None:
+            global_bucket = SharedTokenBucket(self.shared_backend, 'broadcast', global_rate)
+        self.broadcaster = Broadcaster(
+            self.delivery_bot,
+            max_concurrency=broadcast_concurrency,
+            global_rate=global_rate,
+            per_chat_rate=float(os.getenv('BROADCAST_PER_CHAT_RATE', '1')),
+            global_bucket=global_bucket,
+        )
+        
+        # Durable outbound queue drained by background delivery workers
+        if self.shared_backend is not None:
+            self.outbound_queue = SharedOutboundQueue(self.shared_backend, self.worker_id or 'worker-0')
+        else:
+            self.outbound_queue = OutboundQueue(os.getenv('OUTBOX_PATH', 'outbox.db'))
+        self.delivery_workers = DeliveryWorkers(
+            self.outbound_queue,
+            self.broadcaster,
+            worker_count=int(os.getenv('DELIVERY_WORKERS', '4')),
+            on_unreachable=self.evict_member,
+            evict_after=int(os.getenv('EVICT_AFTER_FAILURES', '5')),
+            message_map=self.message_map,
+        )
+        
+        # Gauges read at scrape time rather than on every change
+        QUEUE_DEPTH.set_function(self.outbound_queue.depth)
+        ACTIVE_USERS.set_function(self.rooms.get_total_user_count)
+        
+        # Local HTTP server: webhook ingest plus health/readiness routes. In
+        # polling mode it only runs when a port is configured.
+        self.http_server = None
+        port = os.getenv('PORT')
+        if self.mode == 'webhook' or port:
+            from http_server import BotHttpServer
+            self.http_server = BotHttpServer(
+                self.application,
+                host=os.getenv('HTTP_HOST', '0.0.0.0'),
+                port=int(port or '8080'),
+                webhook_path=self.webhook_path if self.mode == 'webhook' and self.worker_role != 'delivery' else None,
+                secret_token=self.webhook_secret,
+            )
         
         # Setup handlers
         self.setup_handlers()
     
+    async def post_init(self, application: Application) -> None:
+        """Start background delivery once the application is initialized"""
+        if self.delivery_bot is not application.bot:
+            await self.delivery_bot.initialize()
+        if self.worker_role != 'ingest':
+            await self.delivery_workers.start()
+        if self.http_server:
+            await self.http_server.start()
+        self.background_tasks = [
+            asyncio.create_task(self.storage.run_flusher(self.storage_flush_interval))
+        ]
+        if self.state_sync:
+            self.background_tasks.append(asyncio.create_task(self.state_sync.run()))
+        if self.idle_ttl > 0 and self.worker_role != 'delivery':
+            self.background_tasks.append(asyncio.create_task(self.run_idle_expiry()))
+        if self.worker_role != 'delivery':
+            self.background_tasks.append(asyncio.create_task(self.run_digest_flusher()))
+            self.background_tasks.append(asyncio.create_task(self.run_media_group_flusher()))
+            self.background_tasks.append(asyncio.create_task(self.run_presence_flusher()))
+
+    async def run_idle_expiry(self) -> None:
+        """Periodically move idle members of local rooms to the dormant state"""
+        while True:
+            await asyncio.sleep(self.idle_check_interval)
+            for room in list(self.rooms.rooms.values()):
+                if not self.rooms.is_local(room.name):
+                    continue
+                expired = room.user_manager.expire_idle(self.idle_ttl)
+                if not expired:
+                    continue
+                logger.info("%d idle member(s) of room %s went dormant", len(expired), room.name)
+                try:
+                    await self.enqueue_message(
+                        [(user_id, room.user_manager.get_user_chat_id(user_id)) for user_id in expired],
+                        "💤 Has dejado de recibir mensajes del grupo por inactividad.\n"
+                        "Envía un mensaje o usa /start para volver a recibirlos."
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not queue dormancy notices for room {room.name}: {e}")
+
+    async def run_digest_flusher(self) -> None:
+        """Send each digest once its window has elapsed"""
+        while True:
+            deadline = self.digest.next_deadline()
+            if deadline is None:
+                self.digest_pending.clear()
+                await self.digest_pending.wait()
+                continue
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.send_digests(self.digest.pop_due())
+            except Exception as e:
+                logger.warning(f"Could not queue digests: {e}")
+
+    async def run_media_group_flusher(self) -> None:
+        """Relay each album once no more of its items are arriving"""
+        while True:
+            deadline = self.media_groups.next_deadline()
+            if deadline is None:
+                self.media_groups_pending.clear()
+                await self.media_groups_pending.wait()
+                continue
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            for group in self.media_groups.pop_due():
+                try:
+                    await self.relay_album(group)
+                except Exception as e:
+                    logger.warning(f"Could not queue album from user {group.user_id}: {e}")
+
+    async def relay_album(self, group) -> None:
+        """Broadcast a collected album to its room and confirm it to the sender"""
+        room = self.rooms.get_room(group.room_name)
+        if group.rejected or not group.items or not room:
+            return
+        if not await self.moderate_album(room, group):
+            return
+        description = f"[álbum de {group.anonymous_name}]"
+        count = await self.broadcast_message(
+            room, description, exclude_user_id=group.user_id,
+            media=group.build(), ref=group.ref, reply_to=group.reply_to
+        )
+        caption = group.items[0].get('caption')
+        self.history.get(room.name).add(f"{description} {caption}" if caption else description, group.ref)
+        await self.enqueue_message(
+            [(group.user_id, group.chat_id)],
+            f"✅ Álbum enviado como {group.anonymous_name} a {count} usuario(s)"
+        )
+
+    async def moderate_album(self, room: Room, group) -> bool:
+        """Filter an album's captions in place; False if any of them blocks it"""
+        for item in group.items:
+            if item.get('caption'):
+                caption = await self.moderate(room, group.user_id, group.chat_id, group.anonymous_name, item['caption'])
+                if caption is None:
+                    return False
+                item['caption'] = caption
+        return True
+
+    async def run_presence_flusher(self) -> None:
+        """Broadcast each room's presence summary once its window has elapsed"""
+        while True:
+            deadline = self.presence.next_deadline()
+            if deadline is None:
+                self.presence_pending.clear()
+                await self.presence_pending.wait()
+                continue
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.broadcast_presence(self.presence.pop_due())
+            except Exception as e:
+                logger.warning(f"Could not queue presence notices: {e}")
+
+    async def broadcast_presence(self, summaries) -> None:
+        """Send presence summaries through the normal broadcast path"""
+        for room_name, text, exclude_user_id in summaries:
+            room = self.rooms.get_room(room_name)
+            if room:
+                await self.broadcast_message(room, text, exclude_user_id=exclude_user_id)
+
+    def announce(self, room: Room, event: str, anonymous_name: str, user_id: int) -> None:
+        """Queue a join/leave/kick notice for the room's next presence summary"""
+        if self.presence.add(room.name, event, anonymous_name, user_id,
+                             room.user_manager.get_active_user_count()):
+            self.presence_pending.set()
+
+    async def send_digests(self, ready) -> None:
+        """Journal combined messages, one enqueue per distinct digest text"""
+        by_text = {}
+        for user_id, chat_id, text in ready:
+            by_text.setdefault(text, []).append((user_id, chat_id))
+        for text, recipients in by_text.items():
+            await self.enqueue_message(recipients, text)
+
+    async def post_shutdown(self, application: Application) -> None:
+        """Stop delivery workers; undelivered messages stay journaled"""
+        if self.http_server:
+            await self.http_server.stop()
+        # Journal collected albums, pending notices and buffered digests so
+        # they are delivered after a restart
+        for group in self.media_groups.pop_all():
+            await self.relay_album(group)
+        await self.broadcast_presence(self.presence.pop_all())
+        await self.send_digests(self.digest.pop_all())
+        await self.delivery_workers.stop()
+        if self.delivery_bot is not application.bot:
+            await self.delivery_bot.shutdown()
+        self.outbound_queue.close()
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        self.storage.close()
+
     def setup_handlers(self):
         """Setup all command and message handlers"""
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("leave", self.leave_command))
-        self.application.add_handler(CommandHandler("users", self.users_command))
-        self.application.add_handler(CommandHandler("admin", self.admin_command))
-        self.application.add_handler(CommandHandler("realusers", self.real_users_command))
-        self.application.add_handler(CommandHandler("kickuser", self.kick_user_command))
-        self.application.add_handler(CommandHandler("resetuser", self.reset_user_command))
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        commands = {
+            "start": self.start_command,
+            "leave": self.leave_command,
+            "join": self.join_command,
+            "rooms": self.rooms_command,
+            "users": self.users_command,
+            "digest": self.digest_command,
+            "history": self.history_command,
+            "delete": self.delete_command,
+            "admin": self.admin_command,
+            "realusers": self.real_users_command,
+            "kickuser": self.kick_user_command,
+            "resetuser": self.reset_user_command,
+        }
+        # Edited messages are only propagated, never treated as new commands or messages
+        new_message = filters.UpdateType.MESSAGE
+        for command, callback in commands.items():
+            self.application.add_handler(
+                CommandHandler(command, self.timed(command, callback), filters=new_message)
+            )
+        self.application.add_handler(MessageHandler(
+            new_message & filters.TEXT & ~filters.COMMAND, self.timed("message", self.handle_message)
+        ))
+        self.application.add_handler(
+            MessageHandler(new_message & MEDIA_FILTER, self.timed("media", self.handle_media))
+        )
+        self.application.add_handler(CallbackQueryHandler(
+            self.timed("roster_page", self.handle_roster_page), pattern=r"^(users|rooms|realusers):"
+        ))
+        self.application.add_handler(CallbackQueryHandler(
+            self.timed("history_page", self.handle_history_page), pattern=r"^history:"
+        ))
+        self.application.add_handler(MessageHandler(
+            filters.UpdateType.EDITED_MESSAGE & (filters.TEXT | filters.CAPTION) & ~filters.COMMAND,
+            self.timed("edit", self.handle_edit)
+        ))
+
+    @staticmethod
+    def timed(label: str, callback):
+        """Wrap a handler callback so its latency is recorded under ``label``"""
+        histogram = HANDLER_LATENCY.labels(label)
+        
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            started = time.perf_counter()
+            try:
+                await callback(update, context)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        
+        return wrapper
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /start command - join the anonymous group"""
         user_id = update.effective_user.id
-        chat_id = update.effective_chat.id
         
         # Check if user is already in the group
-        if self.user_manager.is_user_active(user_id):
-            current_name = self.user_manager.get_user_name(user_id)
+        room = self.rooms.room_for_user(user_id)
+        if room:
+            current_name = room.user_manager.get_user_name(user_id)
+            woke = room.user_manager.touch(user_id)
             await update.message.reply_text(
+                ("🔔 Vuelves a recibir los mensajes del grupo.\n" if woke else "") +
                 f"Ya estás en el grupo anónimo como: {current_name}\n"
                 f"Envía un mensaje y se retransmitirá a todos los miembros."
             )
             return
         
-        # Get current used names
-        used_names = self.user_manager.get_used_names()
+        await self.join_room(update, self.rooms.get_room(RoomManager.DEFAULT_ROOM))
+
+    async def join_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /join command - switch to (or create) a named room"""
+        user_id = update.effective_user.id
         
-        # Try to get a unique name
-        anonymous_name = self.name_generator.get_unique_name(used_names, user_id)
+        if not context.args:
+            await update.message.reply_text(
+                "❌ Uso: /join [sala]\n"
+                "Ejemplo: /join musica"
+            )
+            return
         
-        if not anonymous_name:
+        room_name = normalize_room_name(context.args[0])
+        if not room_name:
             await update.message.reply_text(
-                "❌ Lo siento, no hay nombres disponibles en este momento. "
-                "Intenta de nuevo más tarde."
+                "❌ Nombre de sala inválido. Usa letras, números, '-' o '_' (máx. 32)."
             )
             return
         
-        # Add user to the group
-        success = self.user_manager.add_user(user_id, chat_id, anonymous_name)
+        if not self.rooms.is_local(room_name):
+            await update.message.reply_text(
+                f"❌ La sala '{room_name}' no está disponible en este momento. Intenta más tarde."
+            )
+            return
         
-        if success:
+        current_room = self.rooms.room_for_user(user_id)
+        if current_room and current_room.name == room_name:
+            await update.message.reply_text(f"Ya estás en la sala '{room_name}'.")
+            return
+        
+        room, refused = self.rooms.create_room(room_name, user_id)
+        if refused == ROOM_LIMIT:
+            await update.message.reply_text(
+                "❌ Se alcanzó el número máximo de salas. Usa /rooms para unirte a una existente."
+            )
+            return
+        if refused == CREATE_THROTTLED:
+            await update.message.reply_text(
+                "⏳ Ya creaste una sala hace poco. Espera un poco antes de crear otra "
+                "o usa /rooms para unirte a una existente."
+            )
+            return
+        
+        if current_room:
+            await self.leave_room(user_id, current_room)
+        
+        await self.join_room(update, room)
+        # Don't keep a room created for a join that failed
+        self.rooms.delete_room(room)
+
+    async def join_room(self, update: Update, room: Room) -> None:
+        """Give the user an anonymous name in the room and announce them"""
+        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+        
+        # Allocate a unique name and add the user to the group in one step
+        anonymous_name = await self.rooms.add_member(room, user_id, chat_id)
+        
+        if anonymous_name:
             await update.message.reply_text(
                 f"🎭 ¡Bienvenido al grupo anónimo!\n\n"
+                f"Sala: {room.name}\n"
                 f"Tu identidad anónima es: **{anonymous_name}**\n\n"
                 f"Ahora puedes enviar mensajes y se retransmitirán a todos los miembros "
                 f"del grupo con tu nombre anónimo.\n\n"
                 f"Comandos disponibles:\n"
                 f"• /users - Ver usuarios conectados\n"
+                f"• /rooms - Ver salas\n"
+                f"• /join [sala] - Cambiar de sala\n"
+                f"• /history - Ver los mensajes recientes\n"
+                f"• /digest - Recibir los mensajes agrupados\n"
+                f"• /delete - Responde a un mensaje tuyo para borrarlo\n"
                 f"• /leave - Salir del grupo\n"
                 f"• Envía cualquier mensaje para chatear"
             )
             
+            await self.send_catchup(update, room)
+            
             # Notify other users
-            notification = f"📢 {anonymous_name} se ha unido al grupo anónimo"
-            await self.broadcast_message(notification, exclude_user_id=user_id)
-        else:
+            self.announce(room, JOINED, anonymous_name, user_id)
+        elif room.user_manager.is_user_active(user_id):
             await update.message.reply_text(
                 "❌ Error al unirte al grupo. Intenta de nuevo."
             )
+        else:
+            await update.message.reply_text(
+                "❌ Lo siento, no hay nombres disponibles en este momento. "
+                "Intenta de nuevo más tarde."
+            )
+
+    async def leave_room(self, user_id: int, room: Room) -> Optional[str]:
+        """
+        Remove a user from a room, release their name and tell the room
+        
+        Returns:
+            The anonymous name the user had, or None if they weren't in the room
+        """
+        # Release the name back to the pool (but keep permanent assignment)
+        anonymous_name = self.rooms.remove_member(room, user_id)
+        if anonymous_name is None:
+            return None
+        
+        # Notify other users
+        self.announce(room, LEFT, anonymous_name, user_id)
+        return anonymous_name
+
+    def evict_member(self, user_id: int, chat_id: int, reason: str) -> None:
+        """Remove a member the bot can no longer reach (blocked, deleted, failing)"""
+        room = self.rooms.room_for_user(user_id)
+        # Ignore stale deliveries for members who already left or rejoined elsewhere
+        if not room or room.user_manager.get_user_chat_id(user_id) != chat_id:
+            return
+        self.rooms.remove_member(room, user_id)
+        MEMBERS_EVICTED.labels(reason).inc()
+        # No room notice: a wave of blocked users would otherwise fan out one
+        # announcement per eviction
+        logger.info("Evicted unreachable user %s from room %s (%s)", user_id, room.name, reason)
 
     async def leave_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /leave command - leave the anonymous group"""
         user_id = update.effective_user.id
         
-        if not self.user_manager.is_user_active(user_id):
+        room = self.rooms.room_for_user(user_id)
+        if not room:
             await update.message.reply_text(
                 "❌ No estás en el grupo anónimo. Usa /start para unirte."
             )
             return
         
-        # Get user's anonymous name before removing
-        anonymous_name = self.user_manager.get_user_name(user_id)
-        
-        # Remove user from the group
-        success = self.user_manager.remove_user(user_id)
-        
-        if success:
-            # Release the name back to the pool (but keep permanent assignment)
-            if anonymous_name:
-                self.name_generator.release_name(anonymous_name, user_id)
-            
+        if await self.leave_room(user_id, room):
             await update.message.reply_text(
                 f"👋 Has salido del grupo anónimo.\n"
                 f"Usa /start para volver a unirte cuando quieras."
             )
-            
-            # Notify other users
-            if anonymous_name:
-                notification = f"📢 {anonymous_name} ha salido del grupo anónimo"
-                await self.broadcast_message(notification, exclude_user_id=user_id)
         else:
             await update.message.reply_text("❌ Error al salir del grupo.")
 
+    async def rooms_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /rooms command - list rooms and their member counts, one page at a time"""
+        user_id = update.effective_user.id
+        
+        page = int(context.args[0]) - 1 if context.args and context.args[0].isdigit() else 0
+        text, markup = self.render_rooms_page(user_id, page)
+        await update.message.reply_text(text, reply_markup=markup)
+
+    def render_rooms_page(self, user_id: int, page: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Text and navigation keyboard for one page of the room list, busiest rooms first"""
+        current_room = self.rooms.room_for_user(user_id)
+        
+        room_list = []
+        for room in sorted(self.rooms.rooms.values(), key=lambda r: -r.user_manager.get_active_user_count()):
+            marker = " ⬅️" if current_room is room else ""
+            room_list.append(f"• {room.name} ({room.user_manager.get_active_user_count()}){marker}")
+        
+        pages = paginate(room_list, "\n")
+        page = min(max(page, 0), len(pages) - 1)
+        footer = f"\n\nPágina {page + 1}/{len(pages)}" if len(pages) > 1 else ""
+        text = (
+            f"🏠 **Salas ({len(room_list)}):**\n\n{pages[page]}\n\n"
+            f"Usa /join [sala] para entrar o crear una sala.{footer}"
+        )
+        return text, page_keyboard("rooms", page, len(pages))
+
     async def users_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle /users command - show connected users"""
+        """Handle /users command - show connected users, one page at a time"""
         user_id = update.effective_user.id
         
-        if not self.user_manager.is_user_active(user_id):
+        room = self.rooms.room_for_user(user_id)
+        if not room:
             await update.message.reply_text(
                 "❌ Debes estar en el grupo para ver esta información. Usa /start para unirte."
             )
             return
         
-        active_users = self.user_manager.get_active_users()
-        user_count = len(active_users)
-        
-        if user_count == 0:
+        if room.user_manager.get_active_user_count() == 0:
             await update.message.reply_text("👥 No hay usuarios conectados.")
             return
         
-        # Create list of anonymous names
-        user_list = []
-        for uid, user_info in active_users.items():
-            user_list.append(f"• {user_info['name']}")
+        page = int(context.args[0]) - 1 if context.args and context.args[0].isdigit() else 0
+        text, markup = self.render_users_page(room, page)
+        await update.message.reply_text(text, reply_markup=markup)
+
+    def render_users_page(self, room: Room, page: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Text and navigation keyboard for one page of a room's member list"""
+        body, page, page_count = self.roster.member_page(room, page)
+        footer = f"\n\nPágina {page + 1}/{page_count}" if page_count > 1 else ""
+        text = (
+            f"👥 **Usuarios conectados ({room.user_manager.get_active_user_count()}):**\n\n{body}{footer}"
+        )
+        return text, page_keyboard("users", page, page_count)
+
+    async def digest_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /digest command - toggle batched delivery of group messages"""
+        user_id = update.effective_user.id
         
-        users_text = "\n".join(user_list)
+        choice = context.args[0].lower() if context.args else None
+        if choice in ('on', 'si', 'sí'):
+            enabled = True
+        elif choice in ('off', 'no'):
+            enabled = False
+        elif choice is None:
+            enabled = not self.digest.is_enabled(user_id)
+        else:
+            await update.message.reply_text("❌ Uso: /digest [on|off]")
+            return
         
-        await update.message.reply_text(
-            f"👥 **Usuarios conectados ({user_count}):**\n\n{users_text}"
-        )
+        self.digest.set_enabled(user_id, enabled)
+        if enabled:
+            await update.message.reply_text(
+                f"📰 Modo resumen activado: recibirás los mensajes del grupo agrupados "
+                f"cada {self.digest.window:g} segundos.\n"
+                f"Usa /digest off para volver a recibirlos uno a uno."
+            )
+        else:
+            await update.message.reply_text("📨 Modo resumen desactivado: recibirás cada mensaje al momento.")
 
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle regular messages - broadcast to all users anonymously"""
+    async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /history command - show the room's recent messages, newest page first"""
+        user_id = update.effective_user.id
+        
+        room = self.rooms.room_for_user(user_id)
+        if not room:
+            await update.message.reply_text(
+                "❌ Debes estar en el grupo para ver esta información. Usa /start para unirte."
+            )
+            return
+        
+        text, markup = self.render_history_page(room, None)
+        await update.message.reply_text(text, reply_markup=markup)
+
+    def history_pages(self, room: Room, limit: Optional[int] = None) -> List[str]:
+        """A room's recent messages, oldest first, batched into as few messages as fit"""
+        entries = self.history.get(room.name).recent(limit)
+        lines = [f"[{time.strftime('%H:%M', time.localtime(at))}] {line}" for at, line in entries]
+        # A single relayed message can be as long as a whole Telegram message
+        lines = [line if len(line) <= MAX_PAGE_CHARS else line[:MAX_PAGE_CHARS - 1] + "…" for line in lines]
+        if not lines:
+            return []
+        # Fill pages from the newest message back so the latest page is a full one
+        lines.reverse()
+        pages = chunk_lines(lines, "\n", page_size=len(lines))
+        return ["\n".join(reversed(page)) for page in reversed(pages)]
+
+    def render_history_page(self, room: Room, page: Optional[int]) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Text and navigation keyboard for one page of /history (None = the newest page)"""
+        pages = self.history_pages(room)
+        if not pages:
+            return "🕘 Todavía no hay mensajes recientes en esta sala.", None
+        page = len(pages) - 1 if page is None else min(max(page, 0), len(pages) - 1)
+        footer = f"\n\nPágina {page + 1}/{len(pages)}" if len(pages) > 1 else ""
+        text = f"🕘 **Historial de {room.name}:**\n\n{pages[page]}{footer}"
+        return text, page_keyboard("history", page, len(pages))
+
+    async def handle_history_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle the page buttons under /history"""
+        query = update.callback_query
+        room = self.rooms.room_for_user(query.from_user.id)
+        if not room:
+            await query.answer("❌ Ya no estás en el grupo.")
+            return
+        
+        page = query.data.partition(":")[2]
+        text, markup = self.render_history_page(room, int(page) if page.isdigit() else None)
+        await query.answer()
+        try:
+            await query.edit_message_text(text, reply_markup=markup)
+        except BadRequest as e:
+            # Same page as already shown; nothing to update
+            if "not modified" not in e.message.lower():
+                raise
+
+    async def send_catchup(self, update: Update, room: Room) -> None:
+        """Send a member who just joined the room's latest messages"""
+        if self.history_catchup <= 0:
+            return
+        pages = self.history_pages(room, self.history_catchup)
+        for index, page in enumerate(pages):
+            header = "🕘 Lo último en la sala:\n\n" if index == 0 else ""
+            await update.message.reply_text(f"{header}{page}")
+
+    async def get_sender(self, update: Update) -> Tuple[Optional[Room], Optional[str]]:
+        """
+        Resolve the room and anonymous name of a member relaying a message,
+        replying with the reason when they cannot relay
+        
+        Returns:
+            (room, anonymous_name), or (None, None)
+        """
         user_id = update.effective_user.id
-        message_text = update.message.text
         
         # Check if user is in the anonymous group
-        if not self.user_manager.is_user_active(user_id):
+        room = self.rooms.room_for_user(user_id)
+        if not room:
             await update.message.reply_text(
                 "❌ Debes unirte al grupo anónimo primero.\n"
                 "Usa /start para comenzar."
             )
-            return
+            return None, None
         
         # Get user's anonymous name
-        anonymous_name = self.user_manager.get_user_name(user_id)
+        anonymous_name = room.user_manager.get_user_name(user_id)
         
         if not anonymous_name:
             await update.message.reply_text("❌ Error al obtener tu nombre anónimo.")
+            return None, None
+        
+        # Any message counts as activity and wakes a dormant member
+        room.user_manager.touch(user_id)
+        return room, anonymous_name
+
+    async def admit(self, update: Update, content: str) -> bool:
+        """Run inbound flood protection, telling the sender when a message is dropped"""
+        user_id = update.effective_user.id
+        decision = self.admission.admit(user_id, content)
+        if decision == ADMIT:
+            return True
+        
+        # One notice per throttling episode, not one per dropped message
+        if self.admission.should_notify(user_id):
+            if decision == DUPLICATE:
+                notice = "🔁 Mensaje repetido: no se ha reenviado."
+            elif decision == THROTTLED_GLOBAL:
+                notice = "⏳ El grupo está muy activo ahora mismo. Tu mensaje no se ha enviado; inténtalo en unos segundos."
+            else:
+                notice = "⏳ Estás enviando mensajes demasiado rápido. Espera unos segundos antes de volver a escribir."
+            await update.effective_message.reply_text(notice)
+        return False
+
+    async def moderate(self, room: Room, user_id: int, chat_id: int, anonymous_name: str, text: str,
+                 blocked_notice: str = "🚫 Tu mensaje no se ha enviado porque contiene contenido no permitido."
+                 ) -> Optional[str]:
+        """
+        Run the content filter over text about to be relayed, flagging it to
+        the admin and telling the sender when it is blocked
+        
+        Returns:
+            The text to relay, with masked matches hidden, or None if it is blocked
+        """
+        result = self.content_filter.check(text)
+        if result.action is None:
+            return text
+        
+        if result.blocked:
+            CONTENT_FILTERED.labels('block').inc()
+        if result.masked:
+            CONTENT_FILTERED.labels('mask').inc()
+        if result.flagged:
+            CONTENT_FILTERED.labels('flag').inc()
+            if self.admin_user_id is not None:
+                status = "bloqueado" if result.blocked else "enviado"
+                await self.enqueue_message(
+                    [(self.admin_user_id, self.admin_user_id)],
+                    f"🚩 Mensaje marcado ({status})\n"
+                    f"De: {anonymous_name} (ID: {user_id}) en la sala {room.name}\n"
+                    f"Coincidencias: {', '.join(dict.fromkeys(result.flagged))}\n\n"
+                    f"{text}"
+                )
+        
+        if result.blocked:
+            await self.enqueue_message([(user_id, chat_id)], blocked_notice)
+            return None
+        return result.text
+
+    def track(self, update: Update) -> Tuple[int, Optional[int]]:
+        """
+        Start tracking an admitted message for reply threading
+        
+        Returns:
+            (ref, reply_to): the message's logical ID, and that of the relayed
+            message it replies to (None if it is not a reply to one)
+        """
+        message = update.message
+        chat_id = update.effective_chat.id
+        reply_to = None
+        if message.reply_to_message:
+            reply_to = self.message_map.resolve(chat_id, message.reply_to_message.message_id)
+        ref = self.message_map.register(update.effective_user.id, chat_id, message.message_id)
+        return ref, reply_to
+
+    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle regular messages - broadcast to all users anonymously"""
+        user_id = update.effective_user.id
+        message_text = update.message.text
+        
+        room, anonymous_name = await self.get_sender(update)
+        if not room or not await self.admit(update, message_text):
+            return
+        message_text = await self.moderate(room, user_id, update.effective_chat.id, anonymous_name, message_text)
+        if message_text is None:
             return
         
         # Format the message
         formatted_message = f"{anonymous_name}: {message_text}"
+        ref, reply_to = self.track(update)
         
         # Broadcast to all users except the sender
-        broadcast_count = await self.broadcast_message(formatted_message, exclude_user_id=user_id)
+        broadcast_count = await self.broadcast_message(
+            room, formatted_message, exclude_user_id=user_id, ref=ref, reply_to=reply_to
+        )
+        self.history.get(room.name).add(formatted_message, ref)
         
         # Confirm message sent
         await update.message.reply_text(
             f"✅ Mensaje enviado como {anonymous_name} a {broadcast_count} usuario(s)"
         )
 
-    async def broadcast_message(self, message: str, exclude_user_id: int = None) -> int:
-        """Broadcast a message to all active users except the excluded one"""
-        active_users = self.user_manager.get_active_users()
-        sent_count = 0
+    async def handle_media(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle photos, stickers, voice notes, videos and documents - relay by file_id"""
+        user_id = update.effective_user.id
+        message = update.message
+        media = extract_media(message)
+        if not media:
+            return
+        
+        if message.media_group_id:
+            group = self.media_groups.pending.get(message.media_group_id)
+            if group is None:
+                # First item of an album: check membership and admission once per
+                # album, so a non-member is told to join once rather than per item
+                room, anonymous_name = await self.get_sender(update)
+                group = self.media_groups.add(
+                    message.media_group_id, user_id, update.effective_chat.id,
+                    room.name if room else '', anonymous_name or '', media
+                )
+                group.rejected = not room or not await self.admit(update, f"album:{media['file_id']}")
+                if not group.rejected:
+                    group.ref, group.reply_to = self.track(update)
+            else:
+                self.media_groups.add(
+                    message.media_group_id, user_id, update.effective_chat.id,
+                    group.room_name, group.anonymous_name, media
+                )
+            self.media_groups_pending.set()
+            return
+        
+        room, anonymous_name = await self.get_sender(update)
+        if not room or not await self.admit(update, f"{media['type']}:{media['file_id']}"):
+            return
+        
+        caption = media['caption']
+        if caption:
+            caption = media['caption'] = await self.moderate(
+                room, user_id, update.effective_chat.id, anonymous_name, caption
+            )
+            if caption is None:
+                return
+        
+        label, sent = MEDIA_LABELS[media['type']]
+        ref, reply_to = self.track(update)
+        if media['type'] == 'sticker':
+            # Stickers have no caption, so the name goes out as a line just before
+            # it, carrying the reply if there is one
+            await self.broadcast_message(room, f"{anonymous_name}:", exclude_user_id=user_id, reply_to=reply_to)
+            reply_to = None
+        else:
+            media['caption'] = attribute(media['caption'], anonymous_name)
+        description = f"[{label} de {anonymous_name}]"
+        broadcast_count = await self.broadcast_message(
+            room, description, exclude_user_id=user_id, media=media, ref=ref, reply_to=reply_to
+        )
+        self.history.get(room.name).add(f"{description} {caption}" if caption else description, ref)
+        
+        await message.reply_text(
+            f"✅ {label} {sent} como {anonymous_name} a {broadcast_count} usuario(s)"
+        )
+
+    async def broadcast_message(self, room: Room, message: str, exclude_user_id: int = None,
+                                media: Optional[Dict] = None, ref: Optional[int] = None,
+                                reply_to: Optional[int] = None) -> int:
+        """
+        Queue a message for all awake users of a room except the excluded one;
+        members in digest mode get text buffered into their next digest
         
+        Args:
+            room: Room to broadcast to
+            message: Message text
+            exclude_user_id: Member who does not receive it (usually the sender)
+            media: Media to send by file_id instead of the text
+            ref: Logical ID the delivered copies are recorded against
+            reply_to: Logical ID of the relayed message this one replies to
+        """
+        active_users = room.user_manager.get_active_users()
+        digest = self.digest
+        recipients = []
+        overflow = []
+        buffered = 0
         for user_id, user_info in active_users.items():
-            # Skip the excluded user
-            if exclude_user_id and user_id == exclude_user_id:
+            if user_info.dormant or (exclude_user_id and user_id == exclude_user_id):
                 continue
-            
-            try:
-                await self.application.bot.send_message(
-                    chat_id=user_info['chat_id'],
-                    text=message
-                )
-                sent_count += 1
-            except Exception as e:
-                logger.warning(f"Failed to send message to user {user_id}: {e}")
+            if user_id in digest.enabled:
+                if media is None:
+                    ready = digest.add(user_id, user_info.chat_id, message)
+                    buffered += 1
+                else:
+                    # Media cannot join a digest; send what is buffered first to keep order
+                    ready = digest.pop_user(user_id)
+                    recipients.append((user_id, user_info.chat_id))
+                if ready:
+                    overflow.append(ready)
+            else:
+                recipients.append((user_id, user_info.chat_id))
+        BROADCAST_SIZE.observe(len(recipients) + buffered)
+        
+        if overflow:
+            # Full digests go out now, ahead of what did not fit
+            await self.send_digests(overflow)
+        if buffered:
+            self.digest_pending.set()
+        return await self.enqueue_message(recipients, message, media, ref=ref, reply_to=reply_to) + buffered
+
+    async def enqueue_message(self, recipients, message: str, media: Optional[Dict] = None,
+                              ref: Optional[int] = None, reply_to: Optional[int] = None,
+                              edit: Optional[str] = None) -> int:
+        """
+        Journal a message (or an edit, see OutboundItem) for the given
+        (user_id, chat_id) pairs and wake the workers; raises if the queue's
+        backend could not store it
+        """
+        queued = await self.outbound_queue.call(
+            self.outbound_queue.enqueue, recipients, message, media, ref, reply_to, edit
+        )
+        if queued:
+            self.delivery_workers.notify()
+        return queued
+
+    async def handle_edit(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle edited messages - apply the edit to every relayed copy"""
+        user_id = update.effective_user.id
+        message = update.edited_message
+        
+        room = self.rooms.room_for_user(user_id)
+        if not room:
+            return
+        
+        if self.shared_backend is not None:
+            # The message map lives in this process, while copies may have been
+            # delivered, and recorded, by any worker
+            await message.reply_text(
+                "⚠️ Las ediciones no se pueden reenviar al grupo en este momento. "
+                "Envía el mensaje corregido como uno nuevo."
+            )
+            return
+        
+        logical_id = self.message_map.resolve(update.effective_chat.id, message.message_id)
+        if logical_id is None or self.message_map.sender(logical_id) != user_id:
+            await message.reply_text(
+                "⚠️ Esta edición no se ha podido aplicar a las copias enviadas al grupo."
+            )
+            return
+        
+        new_text = message.text or message.caption
+        if not await self.admit(update, new_text):
+            return
+        anonymous_name = room.user_manager.get_user_name(user_id)
+        text = await self.moderate(
+            room, user_id, update.effective_chat.id, anonymous_name, new_text,
+            blocked_notice="🚫 La edición no se ha aplicado porque contiene contenido no permitido."
+        )
+        if text is None:
+            return
+        # Copies still queued or in flight are edited too: each chat's copy is looked
+        # up when the edit is delivered, and an edit whose copy is not recorded yet
+        # is retried until it is (or max_attempts runs out, for chats that never get one)
+        chat_ids = dict.fromkeys(chat_id for chat_id, _ in self.message_map.copies(logical_id))
+        chat_ids.update(
+            (user_info.chat_id, None) for user_info in room.user_manager.get_active_users().values()
+            if not user_info.dormant
+        )
+        chat_ids.pop(update.effective_chat.id, None)
+        recipients = [(None, chat_id) for chat_id in chat_ids]
+        if message.text is not None:
+            line = f"{anonymous_name}: {text}"
+            self.history.replace(logical_id, line)
+            await self.enqueue_message(recipients, line, ref=logical_id, edit=EDIT_TEXT)
+        else:
+            # History keeps the media description with the old caption
+            await self.enqueue_message(recipients, attribute(text, anonymous_name), ref=logical_id, edit=EDIT_CAPTION)
+
+    async def delete_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /delete command - delete a relayed message in every chat (sent as a reply to it)"""
+        user_id = update.effective_user.id
+        replied = update.message.reply_to_message
+        
+        if not replied:
+            await update.message.reply_text(
+                "❌ Uso: responde con /delete al mensaje que quieres borrar."
+            )
+            return
+        
+        logical_id = self.message_map.resolve(update.effective_chat.id, replied.message_id)
+        if logical_id is None:
+            await update.message.reply_text(
+                "❌ No se puede borrar: no es un mensaje del grupo o es demasiado antiguo."
+            )
+            return
         
-        return sent_count
+        if self.message_map.sender(logical_id) != user_id and not self.is_admin(user_id):
+            await update.message.reply_text("❌ Solo puedes borrar tus propios mensajes.")
+            return
+        
+        copies = self.message_map.copies(logical_id, include_original=True)
+        self.message_map.forget(logical_id)
+        self.history.remove(logical_id)
+        context.application.create_task(self.broadcaster.delete_copies(copies), update=update)
+        await update.message.reply_text(f"🗑️ Mensaje borrado para {len(copies) - 1} usuario(s).")
 
     def is_admin(self, user_id: int) -> bool:
         """Check if user is admin"""
@@ -227,95 +1109,263 @@ class AnonymousChatBot:
             await update.message.reply_text("❌ No tienes permisos de administrador.")
             return
         
-        active_users = self.user_manager.get_active_users()
-        total_names = self.name_generator.get_total_count()
-        available_names = self.name_generator.get_available_count()
+        if context.args and context.args[0].lower() == 'limit':
+            await self.admin_set_limit(update, context.args[1:])
+            return
+        if context.args and context.args[0].lower() == 'filter':
+            await self.admin_filter(update, context.args[1:])
+            return
+        if context.args and context.args[0].lower() == 'names':
+            await self.admin_names(update, context.args[1:])
+            return
+        
+        default_room = self.rooms.get_room(RoomManager.DEFAULT_ROOM)
+        total_names = default_room.name_generator.get_total_count()
+        available_names = default_room.name_generator.get_available_count()
+        
+        dormant_users = sum(room.user_manager.get_dormant_count() for room in self.rooms.rooms.values())
+        limits_text = "\n".join(f"• {name} = {value:g}" for name, value in self.admission.get_limits().items())
+        rejected = self.admission.rejected
         
         admin_text = (
             f"🔧 **Panel de Administrador**\n\n"
-            f"👥 Usuarios activos: {len(active_users)}\n"
-            f"🎭 Nombres disponibles: {available_names}/{total_names}\n\n"
+            f"👥 Usuarios activos: {self.rooms.get_total_user_count()}\n"
+            f"💤 Inactivos (sin difusión): {dormant_users}\n"
+            f"🏠 Salas: {len(self.rooms.rooms)}\n"
+            f"🎭 Nombres disponibles ({RoomManager.DEFAULT_ROOM}): {available_names}/{total_names} "
+            f"(catálogo v{default_room.name_generator.catalog.version})\n\n"
+            f"**Límites de entrada:**\n{limits_text}\n"
+            f"🚫 Rechazados: {rejected[THROTTLED_USER]} por usuario, "
+            f"{rejected[THROTTLED_GLOBAL]} globales, {rejected[DUPLICATE]} duplicados\n\n"
             f"**Comandos de admin:**\n"
-            f"• /realusers - Ver información real de usuarios\n"
-            f"• /kickuser [nombre] - Expulsar usuario por nombre anónimo\n"
-            f"• /resetuser [nombre] - Resetear asignación permanente"
+            f"• /realusers [recientes|antiguos] [búsqueda] - Ver información real de usuarios\n"
+            f"• /kickuser [#sala] [nombre] - Expulsar usuario por nombre anónimo\n"
+            f"• /resetuser [#sala] [nombre] - Resetear asignación permanente\n"
+            f"• /admin limit [nombre] [valor] - Ajustar un límite de entrada\n"
+            f"• /admin filter [reload] - Ver o recargar el filtro de contenido\n"
+            f"• /admin names reload - Recargar el catálogo de nombres"
         )
         
         await update.message.reply_text(admin_text)
 
-    async def real_users_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle /realusers command - show real user information"""
-        user_id = update.effective_user.id
+    async def admin_set_limit(self, update: Update, args: List[str]) -> None:
+        """Handle /admin limit [name] [value] - adjust an inbound rate limit"""
+        if len(args) != 2:
+            await update.message.reply_text(
+                "❌ Uso: /admin limit [nombre] [valor]\n"
+                f"Límites: {', '.join(self.admission.LIMITS)}"
+            )
+            return
         
-        if not self.is_admin(user_id):
-            await update.message.reply_text("❌ No tienes permisos de administrador.")
+        name, value = args
+        try:
+            self.admission.set_limit(name, value)
+        except ValueError:
+            await update.message.reply_text(
+                f"❌ Valor inválido para '{name}'. Límites: {', '.join(self.admission.LIMITS)}"
+            )
             return
         
-        active_users = self.user_manager.get_active_users()
+        logger.info("Admin %s set ingress limit %s=%s", update.effective_user.id, name, value)
+        await update.message.reply_text(f"✅ Límite '{name}' actualizado a {value}.")
+
+    async def admin_filter(self, update: Update, args: List[str]) -> None:
+        """Handle /admin filter [reload] - show or recompile the content filter rules"""
+        if not args:
+            source = self.content_filter_path or "sin archivo (CONTENT_FILTER_PATH)"
+            await update.message.reply_text(
+                f"🛡️ Filtro de contenido: {len(self.content_filter)} regla(s)\n"
+                f"Archivo: {source}\n"
+                f"Usa /admin filter reload para recargarlo."
+            )
+            return
         
-        if not active_users:
-            await update.message.reply_text("👥 No hay usuarios activos.")
+        if args[0].lower() != 'reload' or len(args) != 1:
+            await update.message.reply_text("❌ Uso: /admin filter [reload]")
+            return
+        if not self.content_filter_path:
+            await update.message.reply_text("❌ No hay archivo de filtro configurado (CONTENT_FILTER_PATH).")
             return
         
-        user_list = []
-        for uid, user_info in active_users.items():
-            user_list.append(
-                f"• {user_info['name']}\n"
-                f"  ID: {uid}\n"
-                f"  Unido: {time.strftime('%Y-%m-%d %H:%M', time.localtime(user_info['joined_at']))}"
+        # Compile off the event loop; messages keep using the old rules until the swap
+        try:
+            content_filter = await asyncio.to_thread(
+                ContentFilter.from_file, self.content_filter_path, self.content_filter_default_action
             )
+        except (OSError, ValueError) as e:
+            logger.warning("Content filter reload failed: %s", e)
+            await update.message.reply_text(f"❌ No se pudo recargar el filtro: {e}")
+            return
         
-        users_text = "\n\n".join(user_list)
+        self.content_filter = content_filter
+        logger.info("Admin %s reloaded the content filter (%d rules)",
+                    update.effective_user.id, len(content_filter))
+        await update.message.reply_text(f"✅ Filtro recargado: {len(content_filter)} regla(s).")
+
+    async def admin_names(self, update: Update, args: List[str]) -> None:
+        """Handle /admin names reload - switch to the current name catalog on disk"""
+        if [arg.lower() for arg in args] != ['reload']:
+            await update.message.reply_text("❌ Uso: /admin names reload")
+            return
+        
+        try:
+            catalog = await asyncio.to_thread(load_catalog)
+        except (OSError, ValueError) as e:
+            logger.warning("Name catalog reload failed: %s", e)
+            await update.message.reply_text(f"❌ No se pudo recargar el catálogo: {e}")
+            return
         
+        # Members keep their names, even ones the new version no longer lists
+        self.rooms.set_catalog(catalog)
+        logger.info("Admin %s loaded name catalog v%d (%d names)",
+                    update.effective_user.id, catalog.version, len(catalog))
         await update.message.reply_text(
-            f"🔍 **Información real de usuarios:**\n\n{users_text}"
+            f"✅ Catálogo de nombres v{catalog.version} cargado: {len(catalog)} nombres."
         )
 
-    async def kick_user_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle /kickuser command - kick user by anonymous name"""
+    async def real_users_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /realusers command - show real user information, searchable and paginated"""
         user_id = update.effective_user.id
         
         if not self.is_admin(user_id):
             await update.message.reply_text("❌ No tienes permisos de administrador.")
             return
         
-        if not context.args:
+        if not self.rooms.get_total_user_count():
+            await update.message.reply_text("👥 No hay usuarios activos.")
+            return
+        
+        # /realusers [recientes|antiguos] [búsqueda]
+        args = list(context.args or [])
+        newest_first = False
+        if args and args[0].lower() in ('recientes', 'antiguos'):
+            newest_first = args.pop(0).lower() == 'recientes'
+        query = normalize_name(" ".join(args))
+        # The query travels in callback_data, which Telegram caps at 64 bytes
+        query = query.encode("utf-8")[:40].decode("utf-8", errors="ignore").strip()
+        
+        text, markup = self.render_real_users_page(0, newest_first, query)
+        await update.message.reply_text(text, reply_markup=markup)
+
+    def render_real_users_page(self, page: int, newest_first: bool,
+                               query: str) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Text and navigation keyboard for one page of the admin member list"""
+        body, page, page_count, matches = self.roster.admin_page(
+            self.rooms.rooms.values(), page, newest_first=newest_first, query=query
+        )
+        if not matches:
+            return f"❌ Ningún usuario coincide con '{query}'.", None
+        
+        order = "recientes primero" if newest_first else "antiguos primero"
+        search = f", búsqueda '{query}'" if query else ""
+        footer = f"\n\nPágina {page + 1}/{page_count}" if page_count > 1 else ""
+        text = f"🔍 **Información real de usuarios ({matches}, {order}{search}):**\n\n{body}{footer}"
+        prefix = f"realusers:{'n' if newest_first else 'o'}:{query}"
+        return text, page_keyboard(prefix, page, page_count)
+
+    async def handle_roster_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle the page buttons under /users, /rooms and /realusers"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        view, _, rest = query.data.partition(":")
+        options, _, page = rest.rpartition(":")
+        page = int(page) if page.isdigit() else 0
+        
+        if view == 'users':
+            room = self.rooms.room_for_user(user_id)
+            if not room:
+                await query.answer("❌ Ya no estás en el grupo.")
+                return
+            text, markup = self.render_users_page(room, page)
+        elif view == 'rooms':
+            text, markup = self.render_rooms_page(user_id, page)
+        else:
+            if not self.is_admin(user_id):
+                await query.answer("❌ No tienes permisos de administrador.")
+                return
+            order, _, search = options.partition(":")
+            text, markup = self.render_real_users_page(page, order == 'n', search)
+        
+        await query.answer()
+        try:
+            await query.edit_message_text(text, reply_markup=markup)
+        except BadRequest as e:
+            # Same page as already shown (e.g. the list shrank); nothing to update
+            if "not modified" not in e.message.lower():
+                raise
+
+    async def find_target(self, update: Update, args: List[str],
+                          command: str) -> Tuple[Optional[Room], Optional[int]]:
+        """
+        Resolve the member named in an admin command, ``/<command> [#sala] nombre``,
+        replying with the reason when there is no single match
+        
+        Returns:
+            (room, user_id), or (None, None)
+        """
+        room_name = None
+        if args and args[0].startswith('#'):
+            room_name = normalize_room_name(args[0][1:])
+            if not room_name or not self.rooms.get_room(room_name):
+                await update.message.reply_text(f"❌ La sala '{args[0][1:]}' no existe.")
+                return None, None
+            args = args[1:]
+        
+        if not args:
             await update.message.reply_text(
-                "❌ Uso: /kickuser [nombre_anónimo]\n"
-                "Ejemplo: /kickuser 🐺 Lobo Misterioso"
+                f"❌ Uso: /{command} [#sala] [nombre_anónimo]\n"
+                f"Ejemplo: /{command} #general 🐺 Lobo Misterioso"
             )
-            return
+            return None, None
+        
+        target_name = " ".join(args)
+        matches = self.rooms.find_users_by_name(target_name, room_name)
+        if not matches:
+            where = f" en la sala '{room_name}'" if room_name else ""
+            await update.message.reply_text(f"❌ Usuario '{target_name}' no encontrado{where}.")
+            return None, None
+        if len(matches) > 1:
+            room_names = ", ".join(sorted(room.name for room, _ in matches))
+            await update.message.reply_text(
+                f"❌ Hay un usuario '{target_name}' en varias salas ({room_names}).\n"
+                f"Indica la sala: /{command} #sala {target_name}"
+            )
+            return None, None
+        return matches[0]
+
+    async def kick_user_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /kickuser command - kick user by anonymous name"""
+        user_id = update.effective_user.id
         
-        target_name = " ".join(context.args)
-        target_user_id = self.user_manager.get_user_by_name(target_name)
+        if not self.is_admin(user_id):
+            await update.message.reply_text("❌ No tienes permisos de administrador.")
+            return
         
+        target_room, target_user_id = await self.find_target(update, list(context.args or []), "kickuser")
         if not target_user_id:
-            await update.message.reply_text(f"❌ Usuario '{target_name}' no encontrado.")
             return
         
-        # Remove user
-        success = self.user_manager.remove_user(target_user_id)
+        # The lookup is lenient, so continue with the exact stored name
+        target_name = target_room.user_manager.get_user_name(target_user_id)
+        
+        target_chat_id = target_room.user_manager.get_user_chat_id(target_user_id)
+        
+        # Remove user and release name
+        success = self.rooms.remove_member(target_room, target_user_id) is not None
         
         if success:
-            # Release name
-            self.name_generator.release_name(target_name, target_user_id)
-            
             # Notify admin
             await update.message.reply_text(f"✅ Usuario '{target_name}' expulsado del grupo.")
             
             # Notify user
-            try:
-                target_chat_id = self.user_manager.get_user_chat_id(target_user_id)
-                if target_chat_id:
-                    await self.application.bot.send_message(
-                        chat_id=target_chat_id,
-                        text="❌ Has sido expulsado del grupo anónimo por un administrador."
-                    )
-            except Exception as e:
-                logger.warning(f"Could not notify kicked user: {e}")
+            if target_chat_id:
+                await self.enqueue_message(
+                    [(target_user_id, target_chat_id)],
+                    "❌ Has sido expulsado del grupo anónimo por un administrador."
+                )
             
             # Notify group
-            await self.broadcast_message(f"📢 {target_name} ha sido expulsado del grupo")
+            self.announce(target_room, KICKED, target_name, target_user_id)
         else:
             await update.message.reply_text("❌ Error al expulsar usuario.")
 
@@ -327,22 +1377,15 @@ class AnonymousChatBot:
             await update.message.reply_text("❌ No tienes permisos de administrador.")
             return
         
-        if not context.args:
-            await update.message.reply_text(
-                "❌ Uso: /resetuser [nombre_anónimo]\n"
-                "Ejemplo: /resetuser 🐺 Lobo Misterioso"
-            )
-            return
-        
-        target_name = " ".join(context.args)
-        target_user_id = self.user_manager.get_user_by_name(target_name)
-        
+        target_room, target_user_id = await self.find_target(update, list(context.args or []), "resetuser")
         if not target_user_id:
-            await update.message.reply_text(f"❌ Usuario '{target_name}' no encontrado.")
             return
         
+        # The lookup is lenient, so continue with the exact stored name
+        target_name = target_room.user_manager.get_user_name(target_user_id)
+        
         # Reset permanent assignment
-        reset_success = self.name_generator.remove_permanent_assignment(target_user_id)
+        reset_success = target_room.name_generator.remove_permanent_assignment(target_user_id)
         
         if reset_success:
             await update.message.reply_text(
@@ -352,11 +1395,61 @@ class AnonymousChatBot:
         else:
             await update.message.reply_text(f"❌ No se encontró asignación permanente para '{target_name}'.")
 
+    # Update types each handler class can receive
+    HANDLER_UPDATE_TYPES = {
+        CommandHandler: (Update.MESSAGE,),
+        MessageHandler: (Update.MESSAGE, Update.EDITED_MESSAGE),
+        CallbackQueryHandler: (Update.CALLBACK_QUERY,),
+    }
+
+    def get_allowed_updates(self) -> List[str]:
+        """Update types the registered handlers can actually process"""
+        allowed = []
+        for group in self.application.handlers.values():
+            for handler in group:
+                for handler_class, update_types in self.HANDLER_UPDATE_TYPES.items():
+                    if isinstance(handler, handler_class):
+                        allowed.extend(t for t in update_types if t not in allowed)
+                        break
+        return allowed
+
+    async def run_webhook(self) -> None:
+        """
+        Serve updates from the local webhook endpoint until SIGINT/SIGTERM.
+        Delivery-only workers run the same lifecycle without receiving updates.
+        """
+        application = self.application
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        
+        await application.initialize()
+        await self.post_init(application)
+        try:
+            if self.worker_role != 'delivery':
+                await application.bot.set_webhook(
+                    url=f"{self.webhook_url.rstrip('/')}/{self.webhook_path.strip('/')}",
+                    secret_token=self.webhook_secret,
+                    allowed_updates=self.get_allowed_updates(),
+                )
+                await application.start()
+            await stop_event.wait()
+        finally:
+            if application.running:
+                await application.stop()
+            await self.post_shutdown(application)
+            await application.shutdown()
+
     def run(self):
         """Start the bot"""
         # Start the bot
-        logging.info("Starting Anonymous Chat Bot for Render...")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        logging.info(f"Starting Anonymous Chat Bot for Render ({self.mode} mode)...")
+        if self.mode == 'webhook' or self.worker_role == 'delivery':
+            # Delivery-only workers never fetch updates; they just drain the queue
+            asyncio.run(self.run_webhook())
+        else:
+            self.application.run_polling(allowed_updates=self.get_allowed_updates())
 
 def main():
     """Main function"""
@@ -0,0 +1,156 @@
+"""
+Media Module
+
+Relaying of photos, stickers, voice notes, videos and documents. Media is
+always re-sent by Telegram file_id, so nothing is downloaded or uploaded by
+the bot. Albums arrive as one update per item and are collected here into a
+single media group before being relayed.
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+from telegram import InputMediaDocument, InputMediaPhoto, InputMediaVideo, Message
+
+# Telegram's maximum caption length
+MAX_CAPTION_CHARS = 1024
+
+# Media types relayed, in the order they are looked up on a message
+MEDIA_TYPES = ('photo', 'video', 'document', 'voice', 'sticker')
+
+# Types that can be part of an album, and their InputMedia classes
+INPUT_MEDIA = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+}
+
+
+def extract_media(message: Message) -> Optional[Dict[str, Any]]:
+    """
+    Describe the media attached to a message
+
+    Args:
+        message: Incoming message
+
+    Returns:
+        {"type", "file_id", "caption"} (caption as sent, may be None), or None
+        if the message carries no relayable media
+    """
+    for media_type in MEDIA_TYPES:
+        attachment = getattr(message, media_type, None)
+        if not attachment:
+            continue
+        if media_type == 'photo':
+            # Several sizes of the same photo; the last one is the largest
+            attachment = attachment[-1]
+        return {'type': media_type, 'file_id': attachment.file_id, 'caption': message.caption}
+    return None
+
+
+def attribute(caption: Optional[str], anonymous_name: str) -> str:
+    """Prefix a caption with the sender's anonymous name, within the caption limit"""
+    text = f"{anonymous_name}: {caption}" if caption else anonymous_name
+    return text[:MAX_CAPTION_CHARS]
+
+
+async def send_media(bot, chat_id: int, media: Dict[str, Any], reply_parameters=None):
+    """
+    Send media described by extract_media() (or a media group) by file_id
+
+    Args:
+        bot: Bot to send with
+        chat_id: Destination chat ID
+        media: Media description
+        reply_parameters: Optional ReplyParameters for the sent message
+
+    Returns:
+        The sent Message (the first one for a media group)
+    """
+    media_type = media['type']
+    if media_type == 'media_group':
+        items = [
+            INPUT_MEDIA[item['type']](media=item['file_id'], caption=item.get('caption'))
+            for item in media['items']
+        ]
+        messages = await bot.send_media_group(chat_id=chat_id, media=items, reply_parameters=reply_parameters)
+        return messages[0] if messages else None
+    if media_type == 'sticker':
+        # Stickers cannot carry a caption
+        return await bot.send_sticker(chat_id=chat_id, sticker=media['file_id'],
+                                      reply_parameters=reply_parameters)
+    send = getattr(bot, f"send_{media_type}")
+    return await send(chat_id=chat_id, caption=media.get('caption'), reply_parameters=reply_parameters,
+                      **{media_type: media['file_id']})
+
+
+class PendingGroup:
+    __slots__ = ('user_id', 'chat_id', 'room_name', 'anonymous_name', 'items', 'deadline', 'rejected',
+                 'ref', 'reply_to')
+
+    def __init__(self, user_id: int, chat_id: int, room_name: str, anonymous_name: str, deadline: float):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.room_name = room_name
+        self.anonymous_name = anonymous_name
+        self.items: List[Dict[str, Any]] = []
+        self.deadline = deadline
+        # Set when the album may not be relayed (the sender is not a member, or
+        # admission refused it); its items are then discarded
+        self.rejected = False
+        # Logical IDs (see message_map.py) of the album and of the message it replies to
+        self.ref: Optional[int] = None
+        self.reply_to: Optional[int] = None
+
+    def build(self) -> Dict[str, Any]:
+        """Media group payload with the sender's name on the first item"""
+        items = [dict(item) for item in self.items]
+        items[0]['caption'] = attribute(items[0].get('caption'), self.anonymous_name)
+        return {'type': 'media_group', 'items': items}
+
+
+class MediaGroupCollector:
+    # Telegram allows at most this many items per media group
+    MAX_ITEMS = 10
+
+    def __init__(self, delay: float = 1.0):
+        """
+        Args:
+            delay: Seconds without a new item after which an album is complete
+        """
+        self.delay = delay
+        self.pending: Dict[str, PendingGroup] = {}
+
+    def add(self, media_group_id: str, user_id: int, chat_id: int, room_name: str,
+            anonymous_name: str, item: Dict[str, Any], now: Optional[float] = None) -> PendingGroup:
+        """
+        Add one album item
+
+        Returns:
+            The album it belongs to; it has a single item if the album is new
+        """
+        now = time.monotonic() if now is None else now
+        group = self.pending.get(media_group_id)
+        if group is None:
+            group = PendingGroup(user_id, chat_id, room_name, anonymous_name, now + self.delay)
+            self.pending[media_group_id] = group
+        if item['type'] in INPUT_MEDIA and len(group.items) < self.MAX_ITEMS:
+            group.items.append(item)
+        group.deadline = now + self.delay
+        return group
+
+    def next_deadline(self) -> Optional[float]:
+        """Monotonic time at which the next album is complete, or None"""
+        return min((group.deadline for group in self.pending.values()), default=None)
+
+    def pop_due(self, now: Optional[float] = None) -> List[PendingGroup]:
+        """Take every album that has stopped receiving items"""
+        now = time.monotonic() if now is None else now
+        due = [key for key, group in self.pending.items() if group.deadline <= now]
+        return [self.pending.pop(key) for key in due]
+
+    def pop_all(self) -> List[PendingGroup]:
+        """Take every album regardless of its deadline (e.g. at shutdown)"""
+        groups = list(self.pending.values())
+        self.pending.clear()
+        return groups
@@ -0,0 +1,191 @@
+"""
+Message Map Module
+
+Bounded mapping between relayed messages and their copies. Every relayed
+message gets a logical ID; the sender's original and each recipient's copy
+are recorded against it so replies, edits and deletes made in one chat can be
+applied to the matching message in every other chat.
+"""
+
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+
+def _key(chat_id: int, message_id: int) -> int:
+    """Pack a (chat_id, message_id) pair into one int; message IDs fit in 32 bits"""
+    return (chat_id << 32) | message_id
+
+
+class MessageMap:
+    """
+    Ring of the most recent relayed messages, bounded by message count, total
+    copies and age. Per-message data lives in flat arrays indexed by slot;
+    the only per-copy Python object is the reverse index entry.
+    """
+
+    def __init__(self, capacity: int = 4096, max_copies: int = 200000, ttl: float = 48 * 3600,
+                 first_id: Optional[int] = None):
+        """
+        Initialize an empty map
+
+        Args:
+            capacity: Relayed messages remembered; the oldest is forgotten first
+            max_copies: Copies remembered across all messages
+            ttl: Seconds after which a message can no longer be replied to, edited
+                or deleted (Telegram refuses edits and deletes after 48 hours)
+            first_id: First logical ID (defaults to the current time in ms, so IDs
+                journaled by a previous process never match new messages)
+        """
+        self.capacity = max(1, capacity)
+        self.max_copies = max_copies
+        self.ttl = ttl
+        self.next_id = int(time.time() * 1000) if first_id is None else first_id
+        # Logical IDs in [oldest_id, next_id) are in the ring, at slot id % capacity
+        self.oldest_id = self.next_id
+        self.copy_count = 0
+        self._sender = array('q', bytes(8 * self.capacity))
+        self._origin_chat = array('q', bytes(8 * self.capacity))
+        self._origin_message = array('q', bytes(8 * self.capacity))
+        self._created = array('d', bytes(8 * self.capacity))
+        # Per-slot copy arrays, chat IDs and message IDs in delivery order
+        self._copy_chats: List[Optional[array]] = [None] * self.capacity
+        self._copy_messages: List[Optional[array]] = [None] * self.capacity
+        # slot -> {chat_id: message_id}, built only for messages being replied to
+        self._by_chat: Dict[int, Dict[int, int]] = {}
+        # _key(chat_id, message_id) -> logical ID, for originals and copies
+        self._index: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self.next_id - self.oldest_id
+
+    def _live(self, logical_id: int, now: float) -> bool:
+        if not self.oldest_id <= logical_id < self.next_id:
+            return False
+        slot = logical_id % self.capacity
+        return self._copy_chats[slot] is not None and now - self._created[slot] < self.ttl
+
+    def _clear(self, logical_id: int) -> None:
+        """Drop a message's copies and index entries, leaving its slot empty"""
+        slot = logical_id % self.capacity
+        chats = self._copy_chats[slot]
+        if chats is None:
+            return
+        index = self._index
+        keys = [_key(self._origin_chat[slot], self._origin_message[slot])]
+        keys.extend(_key(chat_id, message_id) for chat_id, message_id in zip(chats, self._copy_messages[slot]))
+        for key in keys:
+            # A reused message ID may already point at a newer message
+            if index.get(key) == logical_id:
+                del index[key]
+        self.copy_count -= len(chats)
+        self._copy_chats[slot] = None
+        self._copy_messages[slot] = None
+        self._by_chat.pop(slot, None)
+
+    def _evict_oldest(self) -> None:
+        self._clear(self.oldest_id)
+        self.oldest_id += 1
+
+    def register(self, user_id: int, chat_id: int, message_id: int, now: Optional[float] = None) -> int:
+        """
+        Start tracking a message about to be relayed
+
+        Args:
+            user_id: Sender
+            chat_id: Sender's chat
+            message_id: Sender's original message
+
+        Returns:
+            Logical ID to record copies against
+        """
+        now = time.time() if now is None else now
+        while self.oldest_id < self.next_id and (
+                len(self) >= self.capacity
+                or now - self._created[self.oldest_id % self.capacity] >= self.ttl):
+            self._evict_oldest()
+        logical_id = self.next_id
+        self.next_id += 1
+        slot = logical_id % self.capacity
+        self._sender[slot] = user_id
+        self._origin_chat[slot] = chat_id
+        self._origin_message[slot] = message_id
+        self._created[slot] = now
+        self._copy_chats[slot] = array('q')
+        self._copy_messages[slot] = array('q')
+        self._index[_key(chat_id, message_id)] = logical_id
+        return logical_id
+
+    def add_copy(self, logical_id: int, chat_id: int, message_id: int) -> None:
+        """Record a delivered copy; ignored if the message was already forgotten"""
+        if not self.oldest_id <= logical_id < self.next_id:
+            return
+        slot = logical_id % self.capacity
+        chats = self._copy_chats[slot]
+        if chats is None:
+            return
+        chats.append(chat_id)
+        self._copy_messages[slot].append(message_id)
+        self._index[_key(chat_id, message_id)] = logical_id
+        by_chat = self._by_chat.get(slot)
+        if by_chat is not None:
+            by_chat[chat_id] = message_id
+        self.copy_count += 1
+        while self.copy_count > self.max_copies and self.oldest_id < logical_id:
+            self._evict_oldest()
+
+    def resolve(self, chat_id: int, message_id: int, now: Optional[float] = None) -> Optional[int]:
+        """Get the logical ID of a message (original or copy) seen in a chat, or None"""
+        logical_id = self._index.get(_key(chat_id, message_id))
+        if logical_id is None or not self._live(logical_id, time.time() if now is None else now):
+            return None
+        return logical_id
+
+    def is_tracked(self, logical_id: int) -> bool:
+        """Check whether a message is still tracked (not deleted, forgotten or expired)"""
+        return self._live(logical_id, time.time())
+
+    def sender(self, logical_id: int) -> Optional[int]:
+        """Get the user who sent a tracked message"""
+        if not self._live(logical_id, time.time()):
+            return None
+        return self._sender[logical_id % self.capacity]
+
+    def copy_in(self, logical_id: int, chat_id: int) -> Optional[int]:
+        """
+        Get the message ID a tracked message has in a chat
+
+        Returns:
+            The copy's (or the original's) message ID, or None if it has none there
+        """
+        if not self._live(logical_id, time.time()):
+            return None
+        slot = logical_id % self.capacity
+        by_chat = self._by_chat.get(slot)
+        if by_chat is None:
+            # One pass per replied-to message; later lookups are O(1)
+            by_chat = dict(zip(self._copy_chats[slot], self._copy_messages[slot]))
+            by_chat[self._origin_chat[slot]] = self._origin_message[slot]
+            self._by_chat[slot] = by_chat
+        return by_chat.get(chat_id)
+
+    def copies(self, logical_id: int, include_original: bool = False) -> List[Tuple[int, int]]:
+        """
+        Get every (chat_id, message_id) a tracked message was delivered as
+
+        Args:
+            logical_id: Message to look up
+            include_original: Also include the sender's own message
+        """
+        if not self._live(logical_id, time.time()):
+            return []
+        slot = logical_id % self.capacity
+        copies = list(zip(self._copy_chats[slot], self._copy_messages[slot]))
+        if include_original:
+            copies.append((self._origin_chat[slot], self._origin_message[slot]))
+        return copies
+
+    def forget(self, logical_id: int) -> None:
+        """Stop tracking a message (e.g. once it was deleted everywhere)"""
+        if self.oldest_id <= logical_id < self.next_id:
+            self._clear(logical_id)
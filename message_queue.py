@@ -0,0 +1,405 @@
+"""
+Message Queue Module
+
+Durable outbound message journal and the background workers that drain it.
+Handlers enqueue deliveries and return immediately; workers deliver them at
+whatever pace the rate limits allow and resume pending work after a restart.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from telegram.error import RetryAfter
+
+from broadcaster import (
+    FAILURE_TRANSIENT, RETRYABLE_FAILURES, UNREACHABLE_FAILURES, Broadcaster, _retry_seconds
+)
+from message_map import MessageMap
+from metrics import DELIVERIES_DROPPED, SampledLog
+
+logger = logging.getLogger(__name__)
+# Drops can happen once per recipient during a large broadcast
+drop_log = SampledLog(logger)
+
+# Eviction reason for members that keep failing with transient errors
+EVICT_REPEATED_FAILURES = 'repeated_failures'
+
+# What an edit item replaces in the copy it targets
+EDIT_TEXT = 'text'
+EDIT_CAPTION = 'caption'
+
+
+class OutboundItem:
+    __slots__ = ('id', 'user_id', 'chat_id', 'text', 'attempts', 'media', 'ref', 'reply_to', 'edit')
+
+    def __init__(self, id: int, user_id: Optional[int], chat_id: int, text: str, attempts: int,
+                 media: Optional[Dict[str, Any]] = None, ref: Optional[int] = None,
+                 reply_to: Optional[int] = None, edit: Optional[str] = None):
+        self.id = id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.text = text
+        self.attempts = attempts
+        # Media description (see media.py); None for plain text messages
+        self.media = media
+        # Logical IDs (see message_map.py) of the relayed message this delivery
+        # is a copy of, and of the message it replies to
+        self.ref = ref
+        self.reply_to = reply_to
+        # EDIT_TEXT or EDIT_CAPTION: instead of sending a new message, apply
+        # ``text`` to the chat's copy of ``ref``
+        self.edit = edit
+
+
+class OutboundQueue:
+    def __init__(self, path: str = ":memory:"):
+        """
+        Open (or create) the outbound journal
+
+        Args:
+            path: SQLite database file, or ":memory:" for a non-durable queue
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id INTEGER,"
+            " chat_id INTEGER NOT NULL,"
+            " text TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " available_at REAL NOT NULL,"
+            " claimed INTEGER NOT NULL DEFAULT 0,"
+            " media TEXT,"
+            " ref INTEGER,"
+            " reply_to INTEGER,"
+            " edit TEXT)"
+        )
+        # Journals created by earlier versions lack the newer columns
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(outbox)")}
+        for column, column_type in (("media", "TEXT"), ("ref", "INTEGER"), ("reply_to", "INTEGER"),
+                                    ("edit", "TEXT")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {column_type}")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (claimed, available_at)"
+        )
+        # Finds the item at the head of each chat's queue (see claim)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_chat ON outbox (chat_id, id)"
+        )
+
+    def enqueue(self, recipients: Iterable[Tuple[Optional[int], int]], text: str,
+                media: Optional[Dict[str, Any]] = None, ref: Optional[int] = None,
+                reply_to: Optional[int] = None, edit: Optional[str] = None) -> int:
+        """
+        Journal one message for many recipients in a single transaction
+
+        Args:
+            recipients: Iterable of (user_id, chat_id) pairs
+            text: Message text (for media, a short description used in logs)
+            media: Media to send by file_id instead of the text
+            ref: Logical ID to record delivered copies against (the message to
+                change, for edits)
+            reply_to: Logical ID of the message to reply to in each chat
+            edit: EDIT_TEXT or EDIT_CAPTION to edit each chat's copy of ``ref``
+
+        Returns:
+            Number of deliveries enqueued
+        """
+        now = time.time()
+        encoded = json.dumps(media) if media is not None else None
+        rows = [(user_id, chat_id, text, now, encoded, ref, reply_to, edit) for user_id, chat_id in recipients]
+        if not rows:
+            return 0
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO outbox (user_id, chat_id, text, available_at, media, ref, reply_to, edit)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def claim(self, limit: int) -> List[OutboundItem]:
+        """
+        Take up to ``limit`` ready deliveries and mark them in flight
+
+        Only the oldest item of each chat can be claimed, so a chat's messages
+        go out one at a time and in order, even when one is waiting for a retry.
+
+        Args:
+            limit: Maximum number of items to claim
+
+        Returns:
+            List of claimed items, oldest first
+        """
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            rows = self.conn.execute(
+                "SELECT id, user_id, chat_id, text, attempts, media, ref, reply_to, edit FROM outbox AS item"
+                # Walk the table in id order so LIMIT stops the scan early
+                " NOT INDEXED WHERE claimed = 0 AND available_at <= ? AND NOT EXISTS ("
+                "  SELECT 1 FROM outbox AS earlier WHERE earlier.chat_id = item.chat_id AND earlier.id < item.id)"
+                " ORDER BY id LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+            if rows:
+                self.conn.executemany(
+                    "UPDATE outbox SET claimed = 1 WHERE id = ?", [(row[0],) for row in rows]
+                )
+        return [
+            OutboundItem(*row[:5], media=json.loads(row[5]) if row[5] else None, ref=row[6], reply_to=row[7],
+                         edit=row[8])
+            for row in rows
+        ]
+
+    def ack(self, item_ids: Iterable[int]) -> None:
+        """Remove delivered (or permanently failed) items from the journal"""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in item_ids])
+
+    def retry(self, item_id: int, delay: float) -> None:
+        """Return an item to the queue to be attempted again after ``delay`` seconds"""
+        self.conn.execute(
+            "UPDATE outbox SET claimed = 0, attempts = attempts + 1, available_at = ? WHERE id = ?",
+            (time.time() + delay, item_id)
+        )
+
+    def recover(self) -> int:
+        """
+        Release items left in flight by a previous process
+
+        Returns:
+            Number of items returned to the queue
+        """
+        cursor = self.conn.execute("UPDATE outbox SET claimed = 0 WHERE claimed = 1")
+        return cursor.rowcount
+
+    def next_available_in(self) -> Optional[float]:
+        """Seconds until the next pending item becomes ready, or None if empty"""
+        row = self.conn.execute(
+            "SELECT MIN(available_at) FROM outbox WHERE claimed = 0"
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    async def call(self, fn: Callable, *args) -> Any:
+        """Run a queue method from a coroutine (the shared queue runs it off the event loop)"""
+        return fn(*args)
+
+    def depth(self) -> int:
+        """Get the number of deliveries not yet completed"""
+        return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the underlying database"""
+        self.conn.close()
+
+
+class DeliveryWorkers:
+    def __init__(self, queue: OutboundQueue, broadcaster: Broadcaster, worker_count: int = 4,
+                 batch_size: int = 50, max_attempts: int = 5, idle_interval: float = 1.0,
+                 on_unreachable: Optional[Callable[[int, int, str], None]] = None,
+                 evict_after: int = 5, health_window: float = 60.0,
+                 message_map: Optional[MessageMap] = None):
+        """
+        Initialize the delivery worker pool
+
+        Args:
+            queue: Journal to drain
+            broadcaster: Rate-limited sender used for each delivery
+            worker_count: Number of concurrent worker tasks
+            batch_size: Items claimed and sent concurrently by a worker at a time
+            max_attempts: Attempts before a transiently failing item is dropped
+            idle_interval: Maximum sleep when the queue is empty
+            on_unreachable: Called with (user_id, chat_id, reason) for members to evict
+            evict_after: Consecutive transient failures before a member is evicted
+            health_window: Transient failures only count against a member if some
+                delivery succeeded within this many seconds (i.e. not an outage)
+            message_map: Records delivered copies and resolves reply targets
+        """
+        self.queue = queue
+        self.broadcaster = broadcaster
+        self.worker_count = max(1, worker_count)
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max_attempts
+        self.idle_interval = idle_interval
+        self.on_unreachable = on_unreachable
+        self.evict_after = max(1, evict_after)
+        self.health_window = health_window
+        self.message_map = message_map
+        # user_id -> consecutive failed deliveries; only members currently failing
+        self.failure_counts: Dict[int, int] = {}
+        self.last_success = 0.0
+        self.wakeup = asyncio.Event()
+        self.tasks: List[asyncio.Task] = []
+        # Finished items whose acknowledgement failed, acknowledged again next iteration
+        self.unacked: List[int] = []
+
+    def notify(self) -> None:
+        """Wake idle workers because new items were enqueued"""
+        self.wakeup.set()
+
+    async def start(self) -> None:
+        """Resume any journaled work and start the worker tasks"""
+        recovered = await self.queue.call(self.queue.recover)
+        if recovered:
+            logger.info("Resuming %d pending deliveries from the outbound journal", recovered)
+        self.tasks = [asyncio.create_task(self._run()) for _ in range(self.worker_count)]
+        self.notify()
+
+    async def stop(self) -> None:
+        """Stop the workers; unfinished items stay in the journal"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def _backoff(self, item: OutboundItem, error: Exception) -> float:
+        """Delay before retrying a failed item"""
+        if isinstance(error, RetryAfter):
+            return _retry_seconds(error.retry_after)
+        return min(2.0 ** item.attempts, 300.0)
+
+    async def _deliver(self, item: OutboundItem) -> bool:
+        """
+        Attempt one delivery and update the journal
+
+        Returns:
+            True if the item is finished (delivered or dropped)
+        """
+        message_map = self.message_map
+        if item.edit:
+            copy_id = message_map.copy_in(item.ref, item.chat_id) if message_map is not None else None
+            if copy_id is None:
+                if (message_map is None or not message_map.is_tracked(item.ref)
+                        or item.attempts + 1 >= self.max_attempts):
+                    # Deleted or forgotten since the edit was queued, or the
+                    # chat never got a copy
+                    return True
+                # The copy may still be queued or in flight: look again later
+                await self.queue.call(self.queue.retry, item.id, min(2.0 ** item.attempts, 300.0))
+                return False
+            result = await self.broadcaster.edit(
+                item.chat_id, copy_id, item.text, caption=item.edit == EDIT_CAPTION, user_id=item.user_id
+            )
+        else:
+            reply_to_message_id = None
+            if item.reply_to and message_map is not None:
+                # Resolved at send time: the replied-to copy may have been delivered since enqueue
+                reply_to_message_id = message_map.copy_in(item.reply_to, item.chat_id)
+            result = await self.broadcaster.send(
+                item.chat_id, item.text, user_id=item.user_id, media=item.media,
+                reply_to_message_id=reply_to_message_id
+            )
+        if result.ok:
+            self.last_success = time.monotonic()
+            self.failure_counts.pop(item.user_id, None)
+            if item.ref and not item.edit and message_map is not None and result.message_id:
+                message_map.add_copy(item.ref, item.chat_id, result.message_id)
+            return True
+        if result.failure in UNREACHABLE_FAILURES:
+            self._evict(item, result.failure)
+        elif result.failure == FAILURE_TRANSIENT and self._count_failure(item.user_id):
+            self._evict(item, EVICT_REPEATED_FAILURES)
+        elif result.failure in RETRYABLE_FAILURES and item.attempts + 1 < self.max_attempts:
+            await self.queue.call(self.queue.retry, item.id, self._backoff(item, result.error))
+            return False
+        DELIVERIES_DROPPED.inc()
+        drop_log.warning("Dropping delivery to user %s: %s", item.user_id, result.error)
+        return True
+
+    def _count_failure(self, user_id: Optional[int]) -> bool:
+        """
+        Record a transient failure for a member
+
+        Returns:
+            True if the member has now failed often enough to be evicted
+        """
+        if user_id is None or time.monotonic() - self.last_success > self.health_window:
+            # Nothing is getting through, so the member is not the problem
+            return False
+        count = self.failure_counts.get(user_id, 0) + 1
+        self.failure_counts[user_id] = count
+        return count >= self.evict_after
+
+    def _evict(self, item: OutboundItem, reason: str) -> None:
+        """Report a member who can no longer be reached"""
+        self.failure_counts.pop(item.user_id, None)
+        if self.on_unreachable is not None and item.user_id is not None:
+            self.on_unreachable(item.user_id, item.chat_id, reason)
+
+    async def _attempt(self, item: OutboundItem) -> bool:
+        """
+        Deliver one item, logging unexpected errors instead of stopping the worker
+
+        Returns:
+            True if the item is finished; an item whose delivery raised may not
+            have been sent, so it is attempted again later
+        """
+        try:
+            return await self._deliver(item)
+        except Exception:
+            logger.exception("Unexpected error delivering outbound item %s", item.id)
+        if item.attempts + 1 >= self.max_attempts:
+            DELIVERIES_DROPPED.inc()
+            drop_log.warning("Dropping delivery to user %s after repeated errors", item.user_id)
+            return True
+        await self.queue.call(self.queue.retry, item.id, min(2.0 ** item.attempts, 300.0))
+        return False
+
+    async def _ack(self, item_ids: List[int]) -> None:
+        """Acknowledge finished items, plus any whose acknowledgement failed before"""
+        item_ids, self.unacked = self.unacked + item_ids, []
+        try:
+            # Shielded: a stop() landing here must not leave delivered items to be resent
+            await asyncio.shield(self.queue.call(self.queue.ack, item_ids))
+        except Exception:
+            self.unacked.extend(item_ids)
+            raise
+
+    async def _run(self) -> None:
+        """Worker loop: claim a batch, deliver it, repeat"""
+        while True:
+            try:
+                await self._run_once()
+            except Exception:
+                # E.g. the queue's backend is unreachable: keep the worker alive
+                logger.exception("Delivery worker iteration failed")
+                await asyncio.sleep(1.0)
+
+    async def _run_once(self) -> None:
+        """One worker iteration: deliver a claimed batch, or wait for work"""
+        if self.unacked:
+            await self._ack([])
+        # Cleared before claiming: a notify() arriving while the claim is
+        # in flight must not be lost
+        self.wakeup.clear()
+        items = await self.queue.call(self.queue.claim, self.batch_size)
+        if not items:
+            wait = await self.queue.call(self.queue.next_available_in)
+            timeout = self.idle_interval if wait is None else min(wait, self.idle_interval)
+            # asyncio.timeout rather than wait_for: on 3.11, wait_for swallows a
+            # cancel that lands as notify() wakes the worker, hanging stop()
+            try:
+                async with asyncio.timeout(timeout):
+                    await self.wakeup.wait()
+            except TimeoutError:
+                pass
+            return
+
+        results = await asyncio.gather(*(self._attempt(item) for item in items), return_exceptions=True)
+        await self._ack([item.id for item, finished in zip(items, results) if finished is True])
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
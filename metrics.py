@@ -0,0 +1,285 @@
+"""
+Metrics Module
+
+Minimal in-process counters, gauges and histograms rendered in the
+Prometheus text exposition format. Updates are plain integer/float
+arithmetic so they are cheap enough for per-recipient hot paths; the text
+is only built when /metrics is scraped.
+"""
+
+import bisect
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Recipient-count buckets for fan-out sizes
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value != value:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        """
+        Args:
+            name: Metric name (Prometheus naming rules)
+            documentation: HELP text
+            labels: Label names; use labels() to get a child per label set
+            registry: Registry to register with (defaults to REGISTRY)
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values: str):
+        """Get the child metric for one set of label values"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._new_child()
+            self._children[values] = child
+        return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        """(suffix, label string, value) for every sample of this metric"""
+        if not self.label_names:
+            return self._child_samples((), self)
+        samples = []
+        for values, child in self._children.items():
+            samples.extend(self._child_samples(values, child))
+        return samples
+
+    def _child_samples(self, values, child) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def __init__(self, *args, **kwargs):
+        self.value = 0
+        super().__init__(*args, **kwargs)
+
+    def inc(self, amount: float = 1) -> None:
+        """Increase the (unlabelled) counter"""
+        self.value += amount
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _child_samples(self, values, child):
+        return [("", _format_labels(self.label_names, values), child.value)]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        self.function: Optional[Callable[[], float]] = None
+        super().__init__(*args, **kwargs)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the value at scrape time instead of tracking it"""
+        self.function = function
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def _child_samples(self, values, child):
+        value = child.value
+        if child is self and self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                logging.getLogger(__name__).debug("Gauge %s callback failed", self.name, exc_info=True)
+                value = float("nan")
+        return [("", _format_labels(self.label_names, values), value)]
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bound plus +Inf; cumulated only when rendering
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional["Registry"] = None):
+        self.bounds = tuple(sorted(buckets))
+        self._unlabelled = _HistogramChild(self.bounds)
+        super().__init__(name, documentation, labels, registry)
+
+    def observe(self, value: float) -> None:
+        """Record one observation in the (unlabelled) histogram"""
+        self._unlabelled.observe(value)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.bounds)
+
+    def _child_samples(self, values, child):
+        if child is self:
+            child = self._unlabelled
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            samples.append(("_bucket", _format_labels(self.label_names, values, le), cumulative))
+        labels = _format_labels(self.label_names, values)
+        samples.append(("_sum", labels, child.sum))
+        samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        if any(existing.name == metric.name for existing in self.metrics):
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format"""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+class SampledLog:
+    def __init__(self, logger: logging.Logger, first: int = 10, every: int = 100):
+        """
+        Rate-limit a repetitive log line: the first ``first`` occurrences are
+        logged, then one in every ``every``
+
+        Args:
+            logger: Logger to write to
+            first: Occurrences always logged
+            every: Sampling interval after that
+        """
+        self.logger = logger
+        self.first = first
+        self.every = max(1, every)
+        self.count = 0
+
+    def warning(self, msg: str, *args) -> None:
+        """Log with lazy %-formatting; arguments are only formatted when sampled"""
+        self.count += 1
+        if self.count <= self.first or self.count % self.every == 0:
+            if self.logger.isEnabledFor(logging.WARNING):
+                self.logger.warning(msg + " [occurrence %d]", *args, self.count)
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = Histogram(
+    "anonbot_handler_seconds", "Time spent handling an update, by command", labels=("command",)
+)
+SEND_LATENCY = Histogram(
+    "anonbot_send_seconds", "Bot API sendMessage round-trip time per recipient attempt"
+)
+SEND_FAILURES = Counter(
+    "anonbot_send_failures_total", "Failed send attempts, by error class", labels=("error",)
+)
+DELIVERIES_DROPPED = Counter(
+    "anonbot_deliveries_dropped_total", "Deliveries given up after permanent errors or retries"
+)
+BROADCAST_SIZE = Histogram(
+    "anonbot_broadcast_recipients", "Recipients per broadcast", buckets=SIZE_BUCKETS
+)
+MEMBERS_EVICTED = Counter(
+    "anonbot_members_evicted_total", "Unreachable members removed from their room, by reason",
+    labels=("reason",)
+)
+INGRESS_REJECTED = Counter(
+    "anonbot_ingress_rejected_total", "Inbound messages not relayed, by reason", labels=("reason",)
+)
+NAME_POOL_EXHAUSTED = Counter(
+    "anonbot_name_pool_exhausted_total", "Joins refused because no anonymous name was available"
+)
+QUEUE_DEPTH = Gauge(
+    "anonbot_outbound_queue_depth", "Deliveries journaled but not yet completed"
+)
+ACTIVE_USERS = Gauge(
+    "anonbot_active_users", "Users currently in a room"
+)
+CONTENT_FILTERED = Counter(
+    "anonbot_content_filtered_total", "Messages that matched a content filter rule, by action",
+    labels=("action",)
+)
+HTTP_IN_FLIGHT = Gauge(
+    "anonbot_http_in_flight", "Bot API requests in flight, by connection pool", labels=("pool",)
+)
+HTTP_POOL_CAPACITY = Gauge(
+    "anonbot_http_pool_capacity",
+    "Requests a connection pool serves at once (connections, times streams per connection for HTTP/2)",
+    labels=("pool",)
+)
+HTTP_POOL_SATURATED = Counter(
+    "anonbot_http_pool_saturated_total",
+    "Bot API requests that found every pooled connection busy and had to wait", labels=("pool",)
+)
+HTTP_POOL_TIMEOUTS = Counter(
+    "anonbot_http_pool_timeouts_total",
+    "Bot API requests not sent because no pooled connection freed up in time", labels=("pool",)
+)
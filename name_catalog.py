@@ -0,0 +1,181 @@
+"""
+Name Catalog Module
+
+The curated anonymous names live in a versioned data file (names.tsv) that
+is compiled at build time into a compact binary index (names.bin):
+
+    python name_catalog.py [names.tsv] [names.bin]
+
+The index is deduplicated, stores every emoji once and keeps each full name
+("🐺 Lobo Misterioso") ready to use, the base name being the part after the
+emoji. It is read through mmap the first time a NameGenerator needs it and
+shared by every room; set_catalog() swaps in a new version at runtime.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'names.tsv')
+
+# magic, index format, catalog version, entry count, emoji count
+_HEADER = struct.Struct('<4sHIII')
+# Entry: full name offset and length in bytes, emoji number.
+# Emoji: offset and length in bytes of its first occurrence, unused.
+_SLOT = struct.Struct('<IHH')
+_MAGIC = b'ANNC'
+_FORMAT = 1
+
+
+class NameCatalog:
+    def __init__(self, version: int, pool: Sequence[Tuple[str, str]], full_names: Sequence[str]):
+        """
+        Args:
+            version: Catalog version from the data file
+            pool: (name, emoji) per entry
+            full_names: "emoji name" per entry, in the same order
+        """
+        self.version = version
+        self.pool: List[Tuple[str, str]] = list(pool)
+        # Interned so UserManager records share the catalog's strings
+        self.full_names: List[str] = [sys.intern(full_name) for full_name in full_names]
+        self.index: Dict[str, int] = {full_name: index for index, full_name in enumerate(self.full_names)}
+        self.valid_names: FrozenSet[str] = frozenset(self.full_names).union(name for name, _ in self.pool)
+
+    def __len__(self) -> int:
+        return len(self.pool)
+
+
+def _fold(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+def parse_catalog(text: str) -> NameCatalog:
+    """
+    Parse a catalog data file, dropping duplicate names
+
+    The file has one ``version <n>`` line and one ``emoji<TAB>name`` line per
+    name; blank lines and lines starting with ``#`` are ignored.
+    """
+    version = None
+    pool = []
+    seen = set()
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('version '):
+            version = int(line.split()[1])
+            continue
+        emoji, _, name = line.partition('\t')
+        emoji, name = emoji.strip(), " ".join(name.split())
+        if not emoji or not name:
+            raise ValueError(f"Line {number}: expected 'emoji<TAB>name', got {line!r}")
+        # A base name may appear only once, whatever its emoji
+        if _fold(name) in seen:
+            logger.warning("Line %d: duplicate name %r skipped", number, name)
+            continue
+        seen.add(_fold(name))
+        pool.append((name, emoji))
+    if version is None:
+        raise ValueError("Catalog has no 'version' line")
+    return NameCatalog(version, pool, [f"{emoji} {name}" for name, emoji in pool])
+
+
+def compile_catalog(catalog: NameCatalog) -> bytes:
+    """Serialize a catalog into the binary index read by read_index"""
+    blob = bytearray()
+    entries = []
+    emojis: Dict[str, int] = {}
+    emoji_slots = []
+    for (name, emoji), full_name in zip(catalog.pool, catalog.full_names):
+        encoded = full_name.encode('utf-8')
+        if emoji not in emojis:
+            emojis[emoji] = len(emoji_slots)
+            emoji_slots.append(_SLOT.pack(len(blob), len(emoji.encode('utf-8')), 0))
+        entries.append(_SLOT.pack(len(blob), len(encoded), emojis[emoji]))
+        blob += encoded
+    header = _HEADER.pack(_MAGIC, _FORMAT, catalog.version, len(entries), len(emoji_slots))
+    return header + b''.join(entries) + b''.join(emoji_slots) + bytes(blob)
+
+
+def read_index(data) -> NameCatalog:
+    """Load a catalog from a compiled index (bytes or an mmap)"""
+    magic, index_format, version, count, emoji_count = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or index_format != _FORMAT:
+        raise ValueError("Not a compiled name catalog, or compiled by another version")
+    view = memoryview(data)
+    blob = _HEADER.size + (count + emoji_count) * _SLOT.size
+    emojis = []
+    for offset, length, _ in _SLOT.iter_unpack(view[_HEADER.size + count * _SLOT.size:blob]):
+        emojis.append(str(view[blob + offset:blob + offset + length], 'utf-8'))
+    pool = []
+    full_names = []
+    for offset, length, emoji_number in _SLOT.iter_unpack(view[_HEADER.size:_HEADER.size + count * _SLOT.size]):
+        full_name = str(view[blob + offset:blob + offset + length], 'utf-8')
+        emoji = emojis[emoji_number]
+        pool.append((full_name[len(emoji) + 1:], emoji))
+        full_names.append(full_name)
+    view.release()
+    return NameCatalog(version, pool, full_names)
+
+
+def load_catalog(path: Optional[str] = None) -> NameCatalog:
+    """
+    Load a catalog, preferring the compiled index next to the data file
+
+    Args:
+        path: Data file (defaults to NAME_CATALOG_PATH, then names.tsv); a
+            ``.bin`` path loads that index directly
+
+    The data file is parsed instead when its index is missing or older, so an
+    edited catalog is picked up by a reload before it is recompiled.
+    """
+    path = path or os.getenv('NAME_CATALOG_PATH') or DEFAULT_PATH
+    compiled = path if path.endswith('.bin') else os.path.splitext(path)[0] + '.bin'
+    if os.path.exists(compiled) and (
+        compiled == path or not os.path.exists(path) or os.path.getmtime(compiled) >= os.path.getmtime(path)
+    ):
+        with open(compiled, 'rb') as index_file:
+            with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return read_index(data)
+    with open(path, encoding='utf-8') as data_file:
+        return parse_catalog(data_file.read())
+
+
+_current: Optional[NameCatalog] = None
+
+
+def get_catalog() -> NameCatalog:
+    """The catalog in use, loaded on first call"""
+    global _current
+    if _current is None:
+        _current = load_catalog()
+    return _current
+
+
+def set_catalog(catalog: NameCatalog) -> None:
+    """Make ``catalog`` the one new name generators use"""
+    global _current
+    _current = catalog
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + '.bin'
+    logging.basicConfig(format='%(levelname)s - %(message)s')
+    with open(source, encoding='utf-8') as data_file:
+        catalog = parse_catalog(data_file.read())
+    data = compile_catalog(catalog)
+    with open(target, 'wb') as index_file:
+        index_file.write(data)
+    print(f"{target}: catalog version {catalog.version}, {len(catalog)} names, {len(data)} bytes")
+
+
+if __name__ == '__main__':
+    main()
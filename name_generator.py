@@ -5,124 +5,258 @@ Handles generation and management of unique anonymous names for users.
 """
 
 import random
-from typing import Set, Optional, Dict
+import sys
+import unicodedata
+from typing import Set, Optional, Dict, List
+from storage import MemoryStorage
+from name_space import CombinatorialNameSpace
+from name_catalog import NameCatalog, get_catalog
+from metrics import NAME_POOL_EXHAUSTED
+
+def normalize_name(name: str) -> str:
+    """
+    Fold a name for lenient matching: drop emoji and accents, ignore case
+    and collapse whitespace, so "🐺 Lobo Misterioso" -> "lobo misterioso".
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    kept = [
+        char for char in decomposed
+        if char.isalnum() or char.isspace() or char == '-'
+    ]
+    return " ".join("".join(kept).casefold().split())
 
 class NameGenerator:
-    def __init__(self):
-        """Initialize with a pool of creative anonymous names"""
-        self.name_pool = [
-            # Animals
-            ("Lobo Misterioso", "🐺"), ("Gato Sombra", "🐱"), ("Águila Nocturna", "🦅"), ("Zorro Astuto", "🦊"),
-            ("Oso Silencioso", "🐻"), ("Tigre Fantasma", "🐅"), ("León Oculto", "🦁"), ("Puma Secreto", "🐾"),
-            ("Halcón Negro", "🦅"), ("Serpiente Sabia", "🐍"), ("Ciervo Veloz", "🦌"), ("Búho Sabio", "🦉"),
-            ("Pantera Rosa", "🐆"), ("Delfín Azul", "🐬"), ("Cobra Dorada", "🐍"), ("Jaguar Plateado", "🐯"),
-            ("Rana Verde", "🐸"), ("Tortuga Sabia", "🐢"), ("Conejo Rápido", "🐰"), ("Elefante Gris", "🐘"),
-            ("Pingüino Frío", "🐧"), ("Koala Dormilón", "🐨"), ("Mono Travieso", "🐵"), ("Hipopótamo Gordo", "🦛"),
-            ("Rinoceronte Fuerte", "🦏"), ("Jirafa Alta", "🦒"), ("Cebra Rayada", "🦓"), ("Murciélago Negro", "🦇"),
-            
-            # Colors + Adjectives
-            ("Sombra Violeta", "🌫️"), ("Fuego Esmeralda", "🔥"), ("Hielo Carmesí", "❄️"), ("Rayo Dorado", "⚡"),
-            ("Brisa Plateada", "🌬️"), ("Tormenta Azul", "⛈️"), ("Aurora Roja", "🌅"), ("Niebla Gris", "🌫️"),
-            ("Cristal Verde", "💎"), ("Viento Negro", "💨"), ("Luna Blanca", "🌙"), ("Sol Naranja", "☀️"),
-            ("Estrella Púrpura", "⭐"), ("Mar Turquesa", "🌊"), ("Cielo Rosa", "🌸"), ("Tierra Marrón", "🌍"),
-            ("Nube Suave", "☁️"), ("Roca Dura", "🪨"), ("Flor Bella", "🌺"), ("Lluvia Fresca", "🌧️"),
-            ("Nevada Blanca", "🌨️"), ("Arcoíris Colorido", "🌈"), ("Cometa Brillante", "☄️"), ("Galaxia Infinita", "🌌"),
-            
-            # Mystical/Fantasy
-            ("Mago Anónimo", "🧙‍♂️"), ("Ninja Silencioso", "🥷"), ("Fantasma Amable", "👻"), ("Espíritu Libre", "🕊️"),
-            ("Alma Errante", "👤"), ("Sombra Danzante", "💃"), ("Eco Perdido", "📢"), ("Susurro Nocturno", "🌙"),
-            ("Guardián Secreto", "🛡️"), ("Viajero Oculto", "🎒"), ("Ermitaño Sabio", "🧙‍♂️"), ("Nómada Digital", "💻"),
-            ("Poeta Invisible", "📝"), ("Soñador Eterno", "💭"), ("Pensador Profundo", "🤔"), ("Observador Callado", "👁️"),
-            ("Hechicero Mudo", "🪄"), ("Brujo Verde", "🧙‍♀️"), ("Elfo Perdido", "🧝"), ("Duende Travieso", "🧚"),
-            ("Vampiro Nocturno", "🧛"), ("Zombi Amistoso", "🧟"), ("Robot Inteligente", "🤖"), ("Alien Curioso", "👽"),
-            
-            # Elements
-            ("Fuego Danzante", "🔥"), ("Agua Cristalina", "💧"), ("Aire Puro", "🌬️"), ("Tierra Firme", "🌍"),
-            ("Rayo Brillante", "⚡"), ("Trueno Lejano", "⛈️"), ("Lluvia Suave", "🌧️"), ("Nieve Blanca", "❄️"),
-            ("Volcán Dormido", "🌋"), ("Río Sereno", "🏞️"), ("Montaña Alta", "⛰️"), ("Valle Profundo", "🏔️"),
-            ("Lava Caliente", "🌶️"), ("Hielo Frío", "🧊"), ("Arena Dorada", "🏖️"), ("Bosque Verde", "🌲"),
-            ("Desierto Seco", "🏜️"), ("Océano Azul", "🌊"), ("Playa Tranquila", "🏝️"), ("Cueva Oscura", "🕳️"),
-            
-            # Abstract Concepts
-            ("Enigma Viviente", "❓"), ("Misterio Andante", "🔍"), ("Secreto Susurrante", "🤫"), ("Incógnita Alegre", "❓"),
-            ("Paradoja Sonriente", "🤹"), ("Dilema Danzante", "🤷"), ("Acertijo Amistoso", "🧩"), ("Puzzle Parlante", "🧩"),
-            ("Laberinto Mental", "🌀"), ("Código Cifrado", "🔐"), ("Señal Perdida", "📡"), ("Mensaje Oculto", "💌"),
-            ("Idea Brillante", "💡"), ("Sueño Profundo", "😴"), ("Memoria Perdida", "🧠"), ("Tiempo Eterno", "⏰"),
-            ("Espacio Infinito", "🌌"), ("Silencio Total", "🤐"), ("Caos Ordenado", "🌪️"), ("Paz Interior", "☮️"),
-            
-            # Professions (Anonymous)
-            ("Artista Nocturno", "🎨"), ("Músico Fantasma", "🎵"), ("Escritor Sombra", "✍️"), ("Pintor Invisible", "🖌️"),
-            ("Chef Secreto", "👨‍🍳"), ("Jardinero Oculto", "🌱"), ("Arquitecto Misterioso", "🏗️"), ("Piloto Fantasma", "✈️"),
-            ("Capitán Anónimo", "⚓"), ("Doctor Invisible", "⚕️"), ("Profesor Secreto", "📚"), ("Inventor Oculto", "🔬"),
-            ("Soldado Valiente", "🪖"), ("Bombero Heroico", "🚒"), ("Policía Justo", "👮"), ("Astronauta Perdido", "👨‍🚀"),
-            ("Científico Loco", "🥽"), ("Programador Ninja", "👨‍💻"), ("Diseñador Creativo", "🎭"), ("Fotógrafo Oculto", "📸"),
-            
-            # Time-related
-            ("Medianoche Azul", "🌃"), ("Amanecer Dorado", "🌅"), ("Atardecer Rojo", "🌆"), ("Crepúsculo Violeta", "🌇"),
-            ("Aurora Boreal", "🌌"), ("Solsticio Verde", "🌞"), ("Equinoccio Gris", "⚖️"), ("Eclipse Negro", "🌑"),
-            ("Eternidad Breve", "♾️"), ("Momento Infinito", "⏰"), ("Segundo Eterno", "⏱️"), ("Minuto Mágico", "🎯"),
-            ("Hora Perdida", "🕐"), ("Día Gris", "📅"), ("Semana Larga", "📆"), ("Mes Corto", "🗓️"),
-            ("Año Nuevo", "🎊"), ("Siglo Pasado", "📜"), ("Futuro Incierto", "🔮"), ("Presente Eterno", "🎁"),
-            
-            # Nature Elements
-            ("Bosque Susurrante", "🌲"), ("Océano Profundo", "🌊"), ("Desierto Infinito", "🏜️"), ("Glaciar Eterno", "🧊"),
-            ("Pradera Verde", "🌾"), ("Selva Densa", "🌿"), ("Lago Espejo", "🪞"), ("Cascada Cantarina", "💦"),
-            ("Cueva Misteriosa", "🕳️"), ("Isla Perdida", "🏝️"), ("Coral Colorido", "🪸"), ("Arena Dorada", "🏖️"),
-            
-            # Food & Objects
-            ("Pizza Caliente", "🍕"), ("Café Negro", "☕"), ("Helado Frío", "🍦"), ("Taco Sabroso", "🌮"),
-            ("Hamburguesa Grande", "🍔"), ("Sushi Fresco", "🍣"), ("Chocolate Dulce", "🍫"), ("Cerveza Fría", "🍺"),
-            ("Libro Viejo", "📖"), ("Llave Dorada", "🔑"), ("Espada Brillante", "⚔️"), ("Escudo Fuerte", "🛡️"),
-            ("Corona Real", "👑"), ("Anillo Mágico", "💍"), ("Botella Misteriosa", "🍶"), ("Mapa Antiguo", "🗺️"),
-            
-            # Emotions & Actions
-            ("Risa Contagiosa", "😂"), ("Llanto Silencioso", "😭"), ("Abrazo Cálido", "🤗"), ("Beso Dulce", "😘"),
-            ("Sonrisa Tímida", "😊"), ("Guiño Travieso", "😉"), ("Salto Alto", "🤸"), ("Baile Loco", "💃"),
-            ("Carrera Rápida", "🏃"), ("Caminar Lento", "🚶"), ("Dormir Profundo", "😴"), ("Despertar Temprano", "⏰"),
-            
-            # Technology & Modern
-            ("Wi-Fi Perdido", "📶"), ("Batería Baja", "🔋"), ("Pantalla Rota", "📱"), ("Código Oculto", "💻"),
-            ("App Misteriosa", "📲"), ("Chat Secreto", "💬"), ("Email Fantasma", "📧"), ("Video Viral", "📹"),
-            ("Meme Divertido", "😂"), ("Selfie Perfecto", "🤳"), ("Like Perdido", "👍"), ("Follow Falso", "👥"),
-            
-            # Space & Universe
-            ("Planeta Azul", "🌍"), ("Estrella Fugaz", "🌠"), ("Luna Llena", "🌕"), ("Sol Brillante", "🌞"),
-            ("Meteoro Veloz", "☄️"), ("Satélite Perdido", "🛰️"), ("Cohete Espacial", "🚀"), ("Ovni Misterioso", "🛸"),
-            ("Astronauta Solo", "👨‍🚀"), ("Galaxia Lejana", "🌌"), ("Agujero Negro", "🕳️"), ("Big Bang", "💥")
-        ]
+    STORAGE_NAMESPACE = 'assignments'
+
+    def __init__(self, storage: Optional[MemoryStorage] = None, seed: int = 0, namespace: Optional[str] = None,
+                 catalog: Optional[NameCatalog] = None):
+        """
+        Initialize with the curated name catalog and restore saved assignments.
         
+        Once the curated pool is exhausted, names are drawn lazily from a
+        combinatorial space whose order is reproducible from ``seed``.
+        ``catalog`` defaults to the shared one (see name_catalog.py).
+        """
+        self.storage = storage or MemoryStorage()
+        self.storage_namespace = namespace or self.STORAGE_NAMESPACE
         # Keep track of used names to ensure uniqueness
         self.used_names: Set[str] = set()
         # Store permanent assignments: {user_id: (name, emoji)}
-        self.user_assignments: Dict[int, tuple] = {}
+        self.user_assignments: Dict[int, tuple] = {
+            int(user_id): tuple(assignment)
+            for user_id, assignment in self.storage.load(self.storage_namespace).items()
+        }
+        
+        # Overflow space: a cursor walks its seeded permutation; generated names
+        # that are in use or permanently assigned are tracked explicitly
+        self._space = CombinatorialNameSpace(seed)
+        self._space_cursor = 0
+        self.set_catalog(catalog or get_catalog())
+        
+        # With shared storage, names are also claimed in the backend so workers
+        # sharing the room never hand out the same name: full name -> owner
+        self._claims_namespace = f"{self.storage_namespace}:names"
+        self._claim_owners: Dict[str, str] = {}
+        if self.storage.shared:
+            for user_id, (name, emoji) in self.user_assignments.items():
+                self._claim_owners[f"{emoji} {name}"] = str(user_id)
     
-    def get_unique_name(self, current_used_names: Set[str], user_id: int = None) -> Optional[str]:
-        """Get a unique random name or return existing name for user"""
-        # Check if user already has an assigned name
-        if user_id and user_id in self.user_assignments:
-            assigned_name, assigned_emoji = self.user_assignments[user_id]
-            return f"{assigned_emoji} {assigned_name}"
+    def set_catalog(self, catalog: NameCatalog) -> None:
+        """
+        Switch to a catalog version, keeping every name that is in use or
+        permanently assigned, even if the new catalog no longer lists it
+        """
+        self.catalog = catalog
+        # Shared, read-only catalog structures: the pool, canonical (interned)
+        # full names, full name -> pool index and full/base names for O(1)
+        # validity checks
+        self.name_pool = catalog.pool
+        self._full_names = catalog.full_names
+        self._index_by_name = catalog.index
+        self._valid_names = catalog.valid_names
+        # Catalog names the combinatorial space can also generate; the space
+        # skips them (see _next_generated), so they count only once
+        self._space_overlap = sum(1 for full_name in self._full_names if self._space.contains(full_name))
         
-        # Update internal used names set
-        self.used_names = current_used_names.copy()
+        assigned = {f"{emoji} {name}" for name, emoji in self.user_assignments.values()}
+        held = assigned | self.used_names
+        # Allocator state: a free-list of pool indices that are neither in use nor
+        # permanently assigned, with each index's position in the list so it can
+        # be removed by swapping with the last element
+        self._assigned_indices: Set[int] = {
+            self._index_by_name[full_name] for full_name in assigned if full_name in self._index_by_name
+        }
+        taken = {self._index_by_name[full_name] for full_name in held if full_name in self._index_by_name}
+        self._free: List[int] = [index for index in range(len(self.name_pool)) if index not in taken]
+        self._free_position: Dict[int, int] = {index: pos for pos, index in enumerate(self._free)}
+        # Names outside the catalog (generated, or dropped from it by a reload)
+        # that are in use or permanently assigned are tracked explicitly
+        self._generated_assigned: Set[str] = {
+            full_name for full_name in assigned if full_name not in self._index_by_name
+        }
+        self._generated_held: Set[str] = {full_name for full_name in held if full_name not in self._index_by_name}
+    
+    def _claim(self, full_name: str, user_id: Optional[int]) -> bool:
+        """Claim a name in shared storage; False if another worker holds it"""
+        if not self.storage.shared:
+            return True
+        owner = str(user_id or '')
+        if self.storage.claim(self._claims_namespace, full_name, owner):
+            self._claim_owners[full_name] = owner
+            return True
+        return False
+    
+    async def _claim_async(self, full_name: str, user_id: Optional[int]) -> bool:
+        """_claim without blocking the event loop"""
+        if not self.storage.shared:
+            return True
+        owner = str(user_id or '')
+        if await self.storage.claim_async(self._claims_namespace, full_name, owner):
+            self._claim_owners[full_name] = owner
+            return True
+        return False
+    
+    def _unclaim(self, full_name: str) -> None:
+        """Drop this process's claim on a name that became free"""
+        owner = self._claim_owners.pop(full_name, None)
+        if owner is not None:
+            self.storage.release_claim(self._claims_namespace, full_name, owner)
+    
+    def _next_generated(self) -> Optional[tuple]:
+        """Advance the cursor to the next free generated (name, emoji) pair"""
+        for _ in range(self._space.size):
+            if self._space_cursor >= self._space.size:
+                self._space_cursor = 0
+            name, emoji = self._space.name_at(self._space_cursor)
+            self._space_cursor += 1
+            full_name = f"{emoji} {name}"
+            if full_name not in self._generated_held and full_name not in self._index_by_name:
+                return name, emoji
+        return None
+    
+    def _take(self, index: int) -> None:
+        """Remove a pool index from the free-list in O(1)"""
+        pos = self._free_position.pop(index, None)
+        if pos is None:
+            return
+        last = self._free.pop()
+        if last != index:
+            self._free[pos] = last
+            self._free_position[last] = pos
+    
+    def _release_index(self, index: int) -> None:
+        """Return a pool index to the free-list if nothing holds it anymore"""
+        if index in self._free_position or index in self._assigned_indices:
+            return
+        full_name = self._full_names[index]
+        if full_name in self.used_names:
+            return
+        self._free_position[index] = len(self._free)
+        self._free.append(index)
+        self._unclaim(full_name)
+    
+    def mark_used(self, name: str) -> None:
+        """Record a name as in use (e.g. for users restored from storage)"""
+        self.used_names.add(name)
+        index = self._index_by_name.get(name)
+        if index is not None:
+            self._take(index)
+        else:
+            self._generated_held.add(name)
+    
+    def sync_used_names(self, current_used_names: Set[str]) -> None:
+        """Replace the set of in-use names, updating the free-list incrementally"""
+        for name in self.used_names - current_used_names:
+            self.release_name(name)
+        for name in current_used_names - self.used_names:
+            self.mark_used(name)
+    
+    def get_unique_name(self, current_used_names: Optional[Set[str]] = None, user_id: int = None) -> Optional[str]:
+        """
+        Get a unique random name or return existing name for user.
         
-        # Find available names (excluding permanently assigned ones)
-        assigned_base_names = {name for name, emoji in self.user_assignments.values()}
-        available_names = [
-            (name, emoji) for name, emoji in self.name_pool 
-            if f"{emoji} {name}" not in self.used_names and name not in assigned_base_names
-        ]
+        The generator tracks names in use itself; passing ``current_used_names``
+        resynchronizes that state first and is only needed by legacy callers.
+        """
+        if current_used_names is not None:
+            self.sync_used_names(current_used_names)
         
-        if not available_names:
-            return None
+        # Check if user already has an assigned name
+        assigned = self._assigned_name(user_id)
+        if assigned:
+            self._claim(assigned, user_id)
+            self.mark_used(assigned)
+            return assigned
         
-        # Select random name from available ones
-        selected_name, selected_emoji = random.choice(available_names)
-        full_name = f"{selected_emoji} {selected_name}"
+        while True:
+            candidate = self._next_candidate()
+            if candidate is None:
+                return None
+            if self._claim(candidate[2], user_id):
+                return self._commit(candidate, user_id)
+            # Another worker holds it; keep it out of the free-list until its release reaches us
+            self.used_names.add(candidate[2])
+    
+    async def claim_unique_name(self, user_id: int = None) -> Optional[str]:
+        """
+        get_unique_name for coroutines: shared name claims are awaited rather
+        than blocking the event loop. A candidate is off the free-list while
+        its claim is pending, so nothing else here can hand it out meanwhile.
+        """
+        assigned = self._assigned_name(user_id)
+        if assigned:
+            await self._claim_async(assigned, user_id)
+            self.mark_used(assigned)
+            return assigned
         
-        # Store permanent assignment for this user
+        while True:
+            candidate = self._next_candidate()
+            if candidate is None:
+                return None
+            if await self._claim_async(candidate[2], user_id):
+                return self._commit(candidate, user_id)
+            self.used_names.add(candidate[2])
+    
+    def _assigned_name(self, user_id: Optional[int]) -> Optional[str]:
+        """Full name permanently assigned to a user, if any"""
+        if user_id and user_id in self.user_assignments:
+            assigned_name, assigned_emoji = self.user_assignments[user_id]
+            return f"{assigned_emoji} {assigned_name}"
+        return None
+    
+    def _next_candidate(self) -> Optional[tuple]:
+        """Take a free name off the free-list: (name, emoji, full name, pool index or None)"""
+        if self._free:
+            # Select a random free slot and drop it from the free-list
+            index = self._free[random.randrange(len(self._free))]
+            self._take(index)
+            selected_name, selected_emoji = self.name_pool[index]
+            return selected_name, selected_emoji, self._full_names[index], index
+        # Curated pool exhausted: fall back to the combinatorial space
+        generated = self._next_generated()
+        if not generated:
+            NAME_POOL_EXHAUSTED.inc()
+            return None
+        selected_name, selected_emoji = generated
+        full_name = sys.intern(f"{selected_emoji} {selected_name}")
+        self._generated_held.add(full_name)
+        return selected_name, selected_emoji, full_name, None
+    
+    def _commit(self, candidate: tuple, user_id: Optional[int]) -> str:
+        """Record a claimed candidate as in use and permanently assigned to the user"""
+        selected_name, selected_emoji, full_name, index = candidate
+        if index is None:
+            self._generated_held.add(full_name)
+        else:
+            # A catalog switch while the claim was pending may have freed it again
+            self._take(index)
         if user_id:
             self.user_assignments[user_id] = (selected_name, selected_emoji)
+            if index is None:
+                self._generated_assigned.add(full_name)
+            else:
+                self._assigned_indices.add(index)
+            self.storage.put(self.storage_namespace, user_id, [selected_name, selected_emoji])
         
         self.used_names.add(full_name)
         return full_name
@@ -131,29 +265,86 @@ class NameGenerator:
         """Release a name back to the available pool (but keep permanent assignment)"""
         if name in self.used_names:
             self.used_names.remove(name)
+            index = self._index_by_name.get(name)
+            if index is not None:
+                self._release_index(index)
+            elif name not in self._generated_assigned:
+                self._generated_held.discard(name)
+                self._unclaim(name)
+    
+    def clear_claims(self) -> None:
+        """Give up every shared name claim of this namespace (its room is being deleted)"""
+        self._claim_owners.clear()
+        self.storage.clear_claims(self._claims_namespace)
     
     def get_available_count(self) -> int:
-        """Get the number of available names"""
-        return len(self.name_pool) - len(self.used_names)
+        """Get the number of names that are neither in use nor permanently assigned"""
+        # Held names outside the catalog may not be in the space either (dropped by a catalog reload)
+        generated_held = sum(1 for full_name in self._generated_held if self._space.contains(full_name))
+        return len(self._free) + self._space.size - self._space_overlap - generated_held
     
     def get_total_count(self) -> int:
-        """Get the total number of names in the pool"""
-        return len(self.name_pool)
+        """Get the total number of distinct names in the pool and the combinatorial space"""
+        return len(self.name_pool) + self._space.size - self._space_overlap
     
     def is_name_valid(self, name: str) -> bool:
-        """Check if a name exists in the name pool"""
-        for base_name, emoji in self.name_pool:
-            if f"{emoji} {base_name}" == name or base_name == name:
-                return True
-        return False
+        """Check if a name exists in the name pool or the combinatorial space"""
+        return name in self._valid_names or self._space.contains(name)
     
     def get_user_assignment(self, user_id: int) -> Optional[tuple]:
         """Get the permanent name assignment for a user"""
         return self.user_assignments.get(user_id)
     
+    def _forget_assignment(self, user_id: int) -> bool:
+        """Drop a permanent assignment from the allocator state"""
+        if user_id not in self.user_assignments:
+            return False
+        name, emoji = self.user_assignments.pop(user_id)
+        full_name = f"{emoji} {name}"
+        index = self._index_by_name.get(full_name)
+        if index is not None:
+            self._assigned_indices.discard(index)
+            self._release_index(index)
+        else:
+            self._generated_assigned.discard(full_name)
+            if full_name not in self.used_names:
+                self._generated_held.discard(full_name)
+                self._unclaim(full_name)
+        return True
+    
     def remove_permanent_assignment(self, user_id: int) -> bool:
         """Remove permanent assignment for a user (for admin actions)"""
-        if user_id in self.user_assignments:
-            del self.user_assignments[user_id]
+        if self._forget_assignment(user_id):
+            self.storage.delete(self.storage_namespace, user_id)
             return True
-        return False
\ No newline at end of file
+        return False
+    
+    def apply_assignment(self, user_id: int, assignment: Optional[List[str]]) -> None:
+        """
+        Apply an assignment changed in storage by another worker, without writing it back
+        
+        Args:
+            user_id: Telegram user ID
+            assignment: Stored [name, emoji], or None if it was removed
+        """
+        current = self.user_assignments.get(user_id)
+        if assignment is not None and current == tuple(assignment):
+            return
+        if current is not None:
+            # The claim belongs to whichever worker made the change
+            self._claim_owners.pop(f"{current[1]} {current[0]}", None)
+            self._forget_assignment(user_id)
+        if assignment is None:
+            return
+        name, emoji = assignment
+        full_name = sys.intern(f"{emoji} {name}")
+        self.user_assignments[user_id] = (name, emoji)
+        index = self._index_by_name.get(full_name)
+        if index is not None:
+            self._assigned_indices.add(index)
+            self._take(index)
+        else:
+            self._generated_assigned.add(full_name)
+            self._generated_held.add(full_name)
+        if self.storage.shared:
+            self._claim_owners[full_name] = str(user_id)
\ No newline at end of file
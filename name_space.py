@@ -0,0 +1,151 @@
+"""
+Name Space Module
+
+Combinatorial anonymous names (noun × adjective × emoji × numeric suffix)
+generated lazily. Names are visited in a seeded pseudo-random order by
+permuting the index space, so the space is never materialized.
+"""
+
+from typing import Optional, Tuple
+
+# (noun, is_feminine)
+NOUNS = [
+    ("Lobo", False), ("Zorro", False), ("Halcón", False), ("Búho", False), ("Tigre", False),
+    ("León", False), ("Oso", False), ("Cuervo", False), ("Delfín", False), ("Dragón", False),
+    ("Fénix", False), ("Viajero", False), ("Guardián", False), ("Poeta", False), ("Mago", False),
+    ("Ninja", False), ("Pirata", False), ("Cometa", False), ("Trueno", False), ("Río", False),
+    ("Volcán", False), ("Bosque", False), ("Eco", False), ("Espíritu", False), ("Fantasma", False),
+    ("Explorador", False), ("Navegante", False), ("Alquimista", False), ("Centinela", False), ("Vagabundo", False),
+    ("Pantera", True), ("Águila", True), ("Serpiente", True), ("Tortuga", True), ("Gacela", True),
+    ("Ballena", True), ("Medusa", True), ("Luna", True), ("Estrella", True), ("Sombra", True),
+    ("Brisa", True), ("Tormenta", True), ("Aurora", True), ("Niebla", True), ("Llama", True),
+    ("Ola", True), ("Nube", True), ("Montaña", True), ("Isla", True), ("Perla", True),
+    ("Brújula", True), ("Linterna", True), ("Máscara", True), ("Melodía", True), ("Chispa", True),
+    ("Pluma", True), ("Raíz", True), ("Hoja", True), ("Cascada", True), ("Galaxia", True),
+]
+
+# (masculine, feminine)
+ADJECTIVES = [
+    ("Misterioso", "Misteriosa"), ("Silencioso", "Silenciosa"), ("Astuto", "Astuta"), ("Veloz", "Veloz"),
+    ("Sabio", "Sabia"), ("Dorado", "Dorada"), ("Plateado", "Plateada"), ("Nocturno", "Nocturna"),
+    ("Oculto", "Oculta"), ("Secreto", "Secreta"), ("Errante", "Errante"), ("Brillante", "Brillante"),
+    ("Sereno", "Serena"), ("Valiente", "Valiente"), ("Curioso", "Curiosa"), ("Travieso", "Traviesa"),
+    ("Tranquilo", "Tranquila"), ("Eterno", "Eterna"), ("Lejano", "Lejana"), ("Invisible", "Invisible"),
+    ("Amable", "Amable"), ("Salvaje", "Salvaje"), ("Feliz", "Feliz"), ("Risueño", "Risueña"),
+    ("Soñador", "Soñadora"), ("Fugaz", "Fugaz"), ("Antiguo", "Antigua"), ("Carmesí", "Carmesí"),
+    ("Azul", "Azul"), ("Verde", "Verde"), ("Violeta", "Violeta"), ("Gris", "Gris"),
+    ("Escarlata", "Escarlata"), ("Celeste", "Celeste"), ("Dormido", "Dormida"), ("Perdido", "Perdida"),
+    ("Infinito", "Infinita"), ("Profundo", "Profunda"), ("Callado", "Callada"), ("Alegre", "Alegre"),
+]
+
+EMOJIS = [
+    "🐺", "🦊", "🦅", "🦉", "🐅", "🦁", "🐻", "🐬", "🐉", "🐢",
+    "🌙", "⭐", "🌊", "🔥", "⚡", "❄️", "🌪️", "🌈", "☄️", "🌌",
+    "🎭", "🎩", "🗝️", "🧭", "🔮", "🪶", "🍃", "🌵", "🌸", "🍄",
+    "🎲", "🎯", "🎨", "🎵", "🧩", "💎", "🛡️", "⚓", "🚀", "🛸",
+]
+
+_MASK64 = (1 << 64) - 1
+
+
+class CombinatorialNameSpace:
+    FEISTEL_ROUNDS = 4
+
+    def __init__(self, seed: int = 0, max_suffix: int = 99):
+        """
+        Initialize the name space
+
+        Args:
+            seed: Seed for the visiting order; equal seeds give equal sequences
+            max_suffix: Largest numeric suffix (0 disables suffixes)
+        """
+        self.seed = seed
+        self.suffix_count = max_suffix + 1  # suffix 0 means "no suffix"
+        self.size = len(NOUNS) * len(ADJECTIVES) * len(EMOJIS) * self.suffix_count
+
+        # Feistel permutation over the smallest even-bit domain covering the space
+        half_bits = (max(self.size - 1, 1).bit_length() + 1) // 2
+        self._half_bits = half_bits
+        self._half_mask = (1 << half_bits) - 1
+        self._round_keys = [self._mix(seed * 0x100 + r) for r in range(self.FEISTEL_ROUNDS)]
+
+        # Reverse lookups for parsing names back into components
+        self._nouns = {noun: feminine for noun, feminine in NOUNS}
+        self._adjectives = {}
+        for masculine, feminine in ADJECTIVES:
+            self._adjectives.setdefault(masculine, set()).add(False)
+            self._adjectives.setdefault(feminine, set()).add(True)
+        self._emojis = set(EMOJIS)
+
+    @staticmethod
+    def _mix(value: int) -> int:
+        """64-bit integer hash (splitmix64 finalizer)"""
+        value = (value + 0x9E3779B97F4A7C15) & _MASK64
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return value ^ (value >> 31)
+
+    def _feistel(self, value: int) -> int:
+        left, right = value >> self._half_bits, value & self._half_mask
+        for key in self._round_keys:
+            left, right = right, left ^ (self._mix(right ^ key) & self._half_mask)
+        return (left << self._half_bits) | right
+
+    def permute(self, position: int) -> int:
+        """
+        Map a position in the visiting order to an index in the space
+
+        Cycle-walks the Feistel permutation until it lands inside the space,
+        which keeps the mapping a bijection on [0, size).
+        """
+        index = self._feistel(position)
+        while index >= self.size:
+            index = self._feistel(index)
+        return index
+
+    def decode(self, index: int) -> Tuple[str, str]:
+        """
+        Turn an index into a (base_name, emoji) pair
+
+        Args:
+            index: Index in [0, size)
+
+        Returns:
+            Tuple of base name and emoji
+        """
+        index, suffix = divmod(index, self.suffix_count)
+        index, emoji_index = divmod(index, len(EMOJIS))
+        noun_index, adjective_index = divmod(index, len(ADJECTIVES))
+        noun, feminine = NOUNS[noun_index]
+        adjective = ADJECTIVES[adjective_index][1 if feminine else 0]
+        base_name = f"{noun} {adjective}"
+        if suffix:
+            base_name = f"{base_name} {suffix}"
+        return base_name, EMOJIS[emoji_index]
+
+    def name_at(self, position: int) -> Tuple[str, str]:
+        """Get the (base_name, emoji) pair visited at ``position``"""
+        return self.decode(self.permute(position))
+
+    def contains(self, name: str) -> bool:
+        """
+        Check whether a full ("emoji Base Name") or base name belongs to the space
+
+        Args:
+            name: Name to check
+
+        Returns:
+            True if the name can be generated by this space
+        """
+        parts = name.split(" ")
+        if parts and parts[0] in self._emojis:
+            parts = parts[1:]
+        if len(parts) == 3:
+            suffix = parts.pop()
+            if not suffix.isdigit() or suffix.startswith("0") or int(suffix) >= self.suffix_count:
+                return False
+        if len(parts) != 2:
+            return False
+        noun, adjective = parts
+        feminine: Optional[bool] = self._nouns.get(noun)
+        return feminine is not None and feminine in self._adjectives.get(adjective, ())
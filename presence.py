@@ -0,0 +1,126 @@
+"""
+Presence Module
+
+Coalescing of join/leave announcements. Instead of one broadcast per event,
+a room's events within a short window are summarized into a single notice,
+so a wave of rejoins after a restart costs one message per member rather
+than one per member per joiner.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Presence events
+JOINED = 'joined'
+LEFT = 'left'
+KICKED = 'kicked'
+
+# (single-event notice, summary lead) per event, in summary order
+_NOTICES = {
+    JOINED: ("📢 {name} se ha unido al grupo anónimo", "📢 {count} usuarios se unieron: {names}"),
+    LEFT: ("📢 {name} ha salido del grupo anónimo", "📢 {count} usuarios salieron: {names}"),
+    KICKED: ("📢 {name} ha sido expulsado del grupo", "📢 {count} usuarios fueron expulsados: {names}"),
+}
+
+
+class _PendingPresence:
+    __slots__ = ('deadline', 'events')
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        # (event, anonymous name, user_id) in arrival order
+        self.events: List[Tuple[str, str, int]] = []
+
+
+class PresenceCoalescer:
+    def __init__(self, window: float = 5.0, max_names: int = 10, quiet_room_size: int = 0):
+        """
+        Args:
+            window: Seconds between a room's first event and its summary
+            max_names: Names listed per event type before "y N más"
+            quiet_room_size: Rooms with more members than this get no presence
+                notices at all (0 never suppresses)
+        """
+        self.window = window
+        self.max_names = max_names
+        self.quiet_room_size = quiet_room_size
+        self.pending: Dict[str, _PendingPresence] = {}
+
+    def add(self, room_name: str, event: str, anonymous_name: str, user_id: int,
+            room_size: int, now: Optional[float] = None) -> bool:
+        """
+        Record a presence event for a room's next summary
+
+        Args:
+            room_name: Room the event happened in
+            event: JOINED, LEFT or KICKED
+            anonymous_name: Member the event is about
+            user_id: That member's user ID
+            room_size: Current member count of the room
+
+        Returns:
+            True if the event was buffered, False if the room is too large for notices
+        """
+        if self.quiet_room_size and room_size > self.quiet_room_size:
+            return False
+        now = time.monotonic() if now is None else now
+        pending = self.pending.get(room_name)
+        if pending is None:
+            pending = self.pending[room_name] = _PendingPresence(now + self.window)
+        if event != JOINED:
+            # Joining and leaving within one window is not worth announcing
+            for index, (earlier, name, earlier_user) in enumerate(pending.events):
+                if earlier == JOINED and earlier_user == user_id and name == anonymous_name:
+                    del pending.events[index]
+                    return True
+        pending.events.append((event, anonymous_name, user_id))
+        return True
+
+    def next_deadline(self) -> Optional[float]:
+        """Monotonic time at which the next summary is due, or None"""
+        return min((pending.deadline for pending in self.pending.values()), default=None)
+
+    def _summarize(self, events: List[Tuple[str, str, int]]) -> Tuple[str, Optional[int]]:
+        """
+        Build the notice for a room's events
+
+        Returns:
+            (text, user_id to exclude); a lone join is not announced to the joiner
+        """
+        if len(events) == 1:
+            event, name, user_id = events[0]
+            return _NOTICES[event][0].format(name=name), user_id if event == JOINED else None
+        lines = []
+        for event, (single, summary) in _NOTICES.items():
+            names = [name for kind, name, _ in events if kind == event]
+            if len(names) == 1:
+                lines.append(single.format(name=names[0]))
+            elif names:
+                listed = ", ".join(names[:self.max_names])
+                if len(names) > self.max_names:
+                    listed += f" y {len(names) - self.max_names} más"
+                lines.append(summary.format(count=len(names), names=listed))
+        return "\n".join(lines), None
+
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[str, str, Optional[int]]]:
+        """
+        Take every room summary whose window has elapsed
+
+        Returns:
+            (room_name, text, user_id to exclude) per summary to broadcast
+        """
+        now = time.monotonic() if now is None else now
+        due = [name for name, pending in self.pending.items() if pending.deadline <= now]
+        return self._take(due)
+
+    def pop_all(self) -> List[Tuple[str, str, Optional[int]]]:
+        """Take every pending summary regardless of its window (e.g. at shutdown)"""
+        return self._take(list(self.pending))
+
+    def _take(self, room_names: List[str]) -> List[Tuple[str, str, Optional[int]]]:
+        ready = []
+        for room_name in room_names:
+            events = self.pending.pop(room_name).events
+            if events:
+                ready.append((room_name, *self._summarize(events)))
+        return ready
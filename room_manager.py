@@ -0,0 +1,379 @@
+"""
+Room Manager Module
+
+Named anonymous rooms, each with its own membership registry and name
+allocator, and consistent-hash assignment of rooms to shards so rooms can be
+spread across worker processes. Rooms other than the default one are
+created on /join and deleted once their last member leaves.
+"""
+
+import bisect
+import hashlib
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from name_generator import NameGenerator
+from name_catalog import NameCatalog, set_catalog
+from storage import MemoryStorage
+from user_manager import UserManager
+
+ROOM_NAME_PATTERN = re.compile(r"^[a-z0-9_-]{1,32}$")
+
+# Reasons a user may not create a room
+ROOM_LIMIT = 'room_limit'
+CREATE_THROTTLED = 'create_throttled'
+
+
+def normalize_room_name(name: str) -> Optional[str]:
+    """
+    Canonicalize a room name typed by a user
+
+    Returns:
+        Lowercase room name, or None if it contains invalid characters
+    """
+    name = name.strip().lower()
+    return name if ROOM_NAME_PATTERN.match(name) else None
+
+
+class HashRing:
+    def __init__(self, shards: List[str], replicas: int = 64):
+        """
+        Consistent hash ring
+
+        Args:
+            shards: Shard identifiers
+            replicas: Virtual nodes per shard (more = smoother distribution)
+        """
+        self.replicas = replicas
+        self._ring: List[Tuple[int, str]] = []
+        for shard in shards:
+            self.add_shard(shard)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def add_shard(self, shard: str) -> None:
+        """Add a shard; only keys adjacent to its virtual nodes move"""
+        for replica in range(self.replicas):
+            bisect.insort(self._ring, (self._hash(f"{shard}#{replica}"), shard))
+
+    def remove_shard(self, shard: str) -> None:
+        """Remove a shard; its keys move to the next shards on the ring"""
+        self._ring = [node for node in self._ring if node[1] != shard]
+
+    def get_shard(self, key: str) -> Optional[str]:
+        """Get the shard owning a key"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._ring, (self._hash(key), "")) % len(self._ring)
+        return self._ring[index][1]
+
+
+class Room:
+    def __init__(self, name: str, user_manager: UserManager, name_generator: NameGenerator):
+        self.name = name
+        self.user_manager = user_manager
+        self.name_generator = name_generator
+        # Joins waiting for a name claim; the room is not deleted meanwhile
+        self.pending_joins = 0
+
+
+class RoomManager:
+    DEFAULT_ROOM = 'general'
+    STORAGE_NAMESPACE = 'rooms'
+    # Prune room creation times once this many users are tracked
+    PRUNE_THRESHOLD = 10000
+
+    def __init__(self, storage: Optional[MemoryStorage] = None, seed: int = 0,
+                 shards: Optional[List[str]] = None, shard_id: Optional[str] = None,
+                 max_rooms: int = 0, create_interval: float = 0.0):
+        """
+        Initialize rooms, restoring any that were persisted
+
+        Args:
+            storage: Persistence backend shared by every room
+            seed: Name-space seed for each room's NameGenerator
+            shards: All shard identifiers (defaults to a single shard)
+            shard_id: Shard hosted by this process
+            max_rooms: Rooms that may exist at once, the default one included (0 = no limit)
+            create_interval: Minimum seconds between two rooms created by the same user
+        """
+        self.storage = storage or MemoryStorage()
+        self.seed = seed
+        shards = shards or ['0']
+        self.shard_id = shard_id if shard_id is not None else shards[0]
+        self.ring = HashRing(shards)
+        self.max_rooms = max_rooms
+        self.create_interval = create_interval
+        self.rooms: Dict[str, Room] = {}
+        # user_id -> name of the room the user is currently in
+        self.user_rooms: Dict[int, str] = {}
+        # user_id -> monotonic time of the last room they created
+        self.created_at: Dict[int, float] = {}
+        # Called with the name of each deleted room, to drop per-room state kept elsewhere
+        self.deletion_listeners: List[Callable[[str], None]] = []
+
+        self._build_room(self.DEFAULT_ROOM)
+        for room_name in self.storage.load(self.STORAGE_NAMESPACE):
+            self._build_room(room_name)
+
+    def _namespace(self, prefix: str, room_name: str) -> str:
+        """Storage namespace for a room; the default room keeps the legacy names"""
+        return prefix if room_name == self.DEFAULT_ROOM else f"{prefix}:{room_name}"
+
+    def get_room(self, room_name: str, create: bool = False) -> Optional[Room]:
+        """
+        Get a room by name
+
+        Args:
+            room_name: Canonical room name
+            create: Create the room if it does not exist
+
+        Returns:
+            The room, or None if it does not exist and create is False
+        """
+        room = self.rooms.get(room_name)
+        if room is None and create:
+            room = self._build_room(room_name)
+            if room_name != self.DEFAULT_ROOM:
+                self.storage.put(self.STORAGE_NAMESPACE, room_name, True)
+        return room
+
+    def _build_room(self, room_name: str) -> Room:
+        """Load a room from storage into this process"""
+        room = self.rooms.get(room_name)
+        if room is not None:
+            return room
+        user_manager = UserManager(
+            self.storage, namespace=self._namespace(UserManager.STORAGE_NAMESPACE, room_name)
+        )
+        name_generator = NameGenerator(
+            self.storage, seed=self.seed,
+            namespace=self._namespace(NameGenerator.STORAGE_NAMESPACE, room_name)
+        )
+        name_generator.sync_used_names(user_manager.get_used_names())
+        room = Room(room_name, user_manager, name_generator)
+        self.rooms[room_name] = room
+        for user_id in user_manager.get_active_users():
+            self.user_rooms[user_id] = room_name
+        return room
+
+    def create_room(self, room_name: str, user_id: int,
+                    now: Optional[float] = None) -> Tuple[Optional[Room], Optional[str]]:
+        """
+        Get a room, creating it on behalf of a user if it does not exist yet
+
+        Args:
+            room_name: Canonical room name
+            user_id: User asking for the room
+            now: Current monotonic time
+
+        Returns:
+            (room, None), or (None, ROOM_LIMIT or CREATE_THROTTLED) if the
+            room does not exist and the user may not create it now
+        """
+        room = self.rooms.get(room_name)
+        if room is not None:
+            return room, None
+        if self.max_rooms and len(self.rooms) >= self.max_rooms:
+            return None, ROOM_LIMIT
+        now = time.monotonic() if now is None else now
+        last = self.created_at.get(user_id)
+        if last is not None and now - last < self.create_interval:
+            return None, CREATE_THROTTLED
+        if len(self.created_at) >= self.PRUNE_THRESHOLD:
+            for stale in [u for u, at in self.created_at.items() if now - at >= self.create_interval]:
+                del self.created_at[stale]
+        self.created_at[user_id] = now
+        return self.get_room(room_name, create=True), None
+
+    def delete_room(self, room: Room) -> bool:
+        """
+        Delete an empty room other than the default one, with its stored state
+
+        Returns:
+            True if the room was deleted
+        """
+        if room.name == self.DEFAULT_ROOM or room.user_manager.get_active_user_count() or room.pending_joins:
+            return False
+        self._forget_room(room.name)
+        room.name_generator.clear_claims()
+        self.storage.delete(self.STORAGE_NAMESPACE, room.name)
+        self.storage.clear(self._namespace(UserManager.STORAGE_NAMESPACE, room.name))
+        self.storage.clear(self._namespace(NameGenerator.STORAGE_NAMESPACE, room.name))
+        return True
+
+    def _forget_room(self, room_name: str) -> None:
+        """Drop a room from this process only"""
+        if self.rooms.pop(room_name, None) is None:
+            return
+        self.storage.unload(self._namespace(UserManager.STORAGE_NAMESPACE, room_name))
+        self.storage.unload(self._namespace(NameGenerator.STORAGE_NAMESPACE, room_name))
+        for listener in self.deletion_listeners:
+            listener(room_name)
+
+    def apply_changes(self, changes: Dict[str, Tuple[bool, Dict[str, object]]]) -> None:
+        """
+        Apply records changed in storage by another worker, touching only the
+        users and assignments that changed
+
+        Args:
+            changes: namespace -> (full, records), see SharedStorage.fetch_changes
+        """
+        stored = changes.get(self.STORAGE_NAMESPACE)
+        if stored is not None:
+            for room_name, present in stored[1].items():
+                if present is not None:
+                    self._build_room(room_name)
+
+        for namespace, (full, records) in changes.items():
+            prefix, _, room_name = namespace.partition(':')
+            room = self.rooms.get(room_name or self.DEFAULT_ROOM)
+            if room is None:
+                continue
+            if prefix == UserManager.STORAGE_NAMESPACE:
+                if full:
+                    records = {**dict.fromkeys(map(str, room.user_manager.get_active_users())), **records}
+                for user_id, data in records.items():
+                    self._apply_member(room, int(user_id), data)
+            elif prefix == NameGenerator.STORAGE_NAMESPACE:
+                if full:
+                    records = {**dict.fromkeys(map(str, room.name_generator.user_assignments)), **records}
+                for user_id, assignment in records.items():
+                    room.name_generator.apply_assignment(int(user_id), assignment)
+
+        if stored is not None:
+            full, records = stored
+            if full:
+                deleted = [room_name for room_name in self.rooms if room_name not in records]
+            else:
+                deleted = [room_name for room_name, present in records.items() if present is None]
+            # Rooms another worker deleted, unless members joined here meanwhile
+            for room_name in deleted:
+                room = self.rooms.get(room_name)
+                if (room is not None and room_name != self.DEFAULT_ROOM
+                        and not room.user_manager.get_active_user_count() and not room.pending_joins):
+                    self._forget_room(room_name)
+
+    def _apply_member(self, room: Room, user_id: int, data: Optional[Dict]) -> None:
+        """Apply one changed user record to a room and keep names and the user -> room index in step"""
+        previous = room.user_manager.apply_record(user_id, data)
+        current = room.user_manager.get_user_info(user_id)
+        if previous is not None and (current is None or current.name != previous.name):
+            room.name_generator.release_name(previous.name)
+            if current is None and self.user_rooms.get(user_id) == room.name:
+                del self.user_rooms[user_id]
+        if current is not None:
+            room.name_generator.mark_used(current.name)
+            self.user_rooms[user_id] = room.name
+
+    def set_catalog(self, catalog: NameCatalog) -> None:
+        """Switch every room to a new name catalog without touching current assignments"""
+        set_catalog(catalog)
+        for room in self.rooms.values():
+            room.name_generator.set_catalog(catalog)
+
+    def room_for_user(self, user_id: int) -> Optional[Room]:
+        """Get the room a user is currently in"""
+        room_name = self.user_rooms.get(user_id)
+        return self.rooms.get(room_name) if room_name else None
+
+    def set_user_room(self, user_id: int, room: Optional[Room]) -> None:
+        """Record which room a user is in (None when they leave)"""
+        if room is None:
+            self.user_rooms.pop(user_id, None)
+        else:
+            self.user_rooms[user_id] = room.name
+
+    async def add_member(self, room: Room, user_id: int, chat_id: int) -> Optional[str]:
+        """
+        Allocate a unique name in a room and register the user under it
+
+        Registration and the user -> room index are updated in one synchronous
+        step once the name is allocated. The only await is a shared name
+        claim, during which the name is already off the free-list, so other
+        updates can never hand it out again (updates from one user are
+        handled in order, see UserOrderedUpdateProcessor).
+
+        Args:
+            room: Room to join
+            user_id: Telegram user ID
+            chat_id: Telegram chat ID
+
+        Returns:
+            The anonymous name, or None if the user is already a member or no
+            name is available
+        """
+        if room.user_manager.is_user_active(user_id):
+            return None
+        room.pending_joins += 1
+        try:
+            anonymous_name = await room.name_generator.claim_unique_name(user_id=user_id)
+        finally:
+            room.pending_joins -= 1
+        if not anonymous_name:
+            return None
+        if not room.user_manager.add_user(user_id, chat_id, anonymous_name):
+            room.name_generator.release_name(anonymous_name, user_id)
+            return None
+        self.set_user_room(user_id, room)
+        return anonymous_name
+
+    def remove_member(self, room: Room, user_id: int) -> Optional[str]:
+        """
+        Unregister a user from a room and release their name, in one synchronous step
+
+        The permanent name assignment is kept, so the user gets the same name
+        back, unless they were the last member of a room other than the
+        default one: the room is then deleted.
+
+        Returns:
+            The anonymous name the user had, or None if they weren't in the room
+        """
+        anonymous_name = room.user_manager.cleanup_user(user_id)
+        if anonymous_name is None:
+            return None
+        if self.user_rooms.get(user_id) == room.name:
+            self.set_user_room(user_id, None)
+        room.name_generator.release_name(anonymous_name, user_id)
+        self.delete_room(room)
+        return anonymous_name
+
+    def shard_for(self, room_name: str) -> Optional[str]:
+        """Get the shard a room is assigned to"""
+        return self.ring.get_shard(room_name)
+
+    def is_local(self, room_name: str) -> bool:
+        """Check whether this process hosts the given room"""
+        return self.shard_for(room_name) == self.shard_id
+
+    def find_users_by_name(self, anonymous_name: str,
+                           room_name: Optional[str] = None) -> List[Tuple[Room, int]]:
+        """
+        Look up an anonymous name; each room hands out names independently,
+        so the same name can be held in several rooms
+
+        Args:
+            anonymous_name: Name to look up (matched leniently, see UserManager.get_user_by_name)
+            room_name: Only look in this room
+
+        Returns:
+            (room, user_id) per room where the name is held
+        """
+        if room_name is not None:
+            room = self.rooms.get(room_name)
+            rooms = [room] if room else []
+        else:
+            rooms = self.rooms.values()
+        matches = []
+        for room in rooms:
+            user_id = room.user_manager.get_user_by_name(anonymous_name)
+            if user_id:
+                matches.append((room, user_id))
+        return matches
+
+    def get_total_user_count(self) -> int:
+        """Get the number of users across all rooms"""
+        return len(self.user_rooms)
@@ -0,0 +1,201 @@
+"""
+Roster Module
+
+Paginated member lists for /users and /realusers. Lines are rendered once
+and split into pages that stay cached until the room's membership changes,
+so repeated requests and page flips do no per-member formatting.
+"""
+
+import heapq
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from name_generator import normalize_name
+
+# Page body budget; leaves room for the header and footer within Telegram's
+# 4096-character message limit
+MAX_PAGE_CHARS = 3500
+PAGE_SIZE = 50
+# Telegram's maximum callback_data size in bytes
+MAX_CALLBACK_BYTES = 64
+
+
+def chunk_lines(lines: Sequence[str], separator: str, page_size: int = PAGE_SIZE,
+                max_chars: int = MAX_PAGE_CHARS) -> List[List[str]]:
+    """
+    Split lines into pages of at most ``page_size`` lines and ``max_chars``
+    characters once joined with ``separator``
+
+    Returns:
+        Lists of lines, one per page (at least one, possibly empty)
+    """
+    pages = []
+    start = 0
+    size = 0
+    for index, line in enumerate(lines):
+        added = len(line) + (len(separator) if index > start else 0)
+        if index > start and (index - start >= page_size or size + added > max_chars):
+            pages.append(list(lines[start:index]))
+            start = index
+            added = len(line)
+            size = 0
+        size += added
+    pages.append(list(lines[start:]))
+    return pages
+
+
+def paginate(lines: Sequence[str], separator: str, page_size: int = PAGE_SIZE,
+             max_chars: int = MAX_PAGE_CHARS) -> List[str]:
+    """
+    Join lines into pages of at most ``page_size`` lines and ``max_chars`` characters
+
+    Returns:
+        Page bodies (at least one, possibly empty)
+    """
+    return [separator.join(page) for page in chunk_lines(lines, separator, page_size, max_chars)]
+
+
+def page_keyboard(prefix: str, page: int, page_count: int) -> Optional[InlineKeyboardMarkup]:
+    """
+    Previous/next buttons for a paginated message
+
+    Args:
+        prefix: callback_data prefix; the target page number is appended
+        page: Current page (0-based)
+        page_count: Total pages
+
+    Returns:
+        The keyboard, or None if everything fits on one page
+    """
+    if page_count <= 1:
+        return None
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Anterior", callback_data=f"{prefix}:{page - 1}"))
+    if page < page_count - 1:
+        buttons.append(InlineKeyboardButton("Siguiente ▶️", callback_data=f"{prefix}:{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
+
+
+def _clamp(page: int, page_count: int) -> int:
+    return min(max(page, 0), page_count - 1)
+
+
+class _AdminEntry:
+    __slots__ = ('joined_at', 'user_id', 'folded_name', 'line')
+
+    def __init__(self, joined_at: float, user_id: int, folded_name: str, line: str):
+        self.joined_at = joined_at
+        self.user_id = user_id
+        self.folded_name = folded_name
+        self.line = line
+
+
+class RosterCache:
+    # Admin searches/orderings whose pages are kept per roster state
+    MAX_ADMIN_VIEWS = 16
+
+    def __init__(self, page_size: int = PAGE_SIZE, max_chars: int = MAX_PAGE_CHARS):
+        """
+        Args:
+            page_size: Members per page
+            max_chars: Maximum characters in one page body
+        """
+        self.page_size = page_size
+        self.max_chars = max_chars
+        # room name -> (user manager, its version, page bodies)
+        self._member_pages: Dict[str, Tuple[object, int, List[str]]] = {}
+        # user_id -> admin entry, rendered once per membership (keyed by joined_at)
+        self._admin_entries: Dict[int, _AdminEntry] = {}
+        self._admin_state: Optional[Tuple] = None
+        # Every member ordered by join time, rebuilt when _admin_state changes
+        self._admin_order: List[_AdminEntry] = []
+        # (newest_first, query) -> (matching members, page bodies)
+        self._admin_views: Dict[Tuple[bool, str], Tuple[int, List[str]]] = {}
+
+    def member_page(self, room, page: int) -> Tuple[str, int, int]:
+        """
+        Get one page of a room's member list
+
+        Args:
+            room: Room whose members are listed
+            page: Requested page (0-based, clamped to the valid range)
+
+        Returns:
+            (page body, page actually shown, page count)
+        """
+        user_manager = room.user_manager
+        cached = self._member_pages.get(room.name)
+        if cached is None or cached[0] is not user_manager or cached[1] != user_manager.version:
+            lines = [
+                f"• {user_info.name}{' 💤' if user_info.dormant else ''}"
+                for _, user_info in user_manager.get_users_by_join_time()
+            ]
+            cached = (user_manager, user_manager.version, paginate(lines, "\n", self.page_size, self.max_chars))
+            self._member_pages[room.name] = cached
+        pages = cached[2]
+        page = _clamp(page, len(pages))
+        return pages[page], page, len(pages)
+
+    def discard(self, room_name: str) -> None:
+        """Forget a deleted room's cached pages"""
+        self._member_pages.pop(room_name, None)
+
+    def _admin_entry(self, room_name: str, user_id: int, user_info) -> _AdminEntry:
+        entry = self._admin_entries.get(user_id)
+        if entry is None or entry.joined_at != user_info.joined_at:
+            joined = time.strftime('%Y-%m-%d %H:%M', time.localtime(user_info.joined_at))
+            entry = _AdminEntry(
+                user_info.joined_at, user_id, normalize_name(user_info.name),
+                f"• {user_info.name}\n  ID: {user_id}\n  Sala: {room_name}\n  Unido: {joined}"
+            )
+            self._admin_entries[user_id] = entry
+        return entry
+
+    def _refresh_admin(self, rooms) -> None:
+        """Rebuild the join-ordered admin list if any room changed since last time"""
+        state = tuple((room.name, id(room.user_manager), room.user_manager.version) for room in rooms)
+        if state == self._admin_state:
+            return
+        per_room = [
+            [self._admin_entry(room.name, user_id, user_info)
+             for user_id, user_info in room.user_manager.get_users_by_join_time()]
+            for room in rooms
+        ]
+        self._admin_order = list(heapq.merge(*per_room, key=lambda entry: entry.joined_at))
+        # Forget members who left so the entry table stays bounded
+        present = {entry.user_id for entry in self._admin_order}
+        for user_id in [u for u in self._admin_entries if u not in present]:
+            del self._admin_entries[user_id]
+        self._admin_state = state
+        self._admin_views.clear()
+
+    def admin_page(self, rooms, page: int, newest_first: bool = False,
+                   query: str = "") -> Tuple[str, int, int, int]:
+        """
+        Get one page of the admin view of every member
+
+        Args:
+            rooms: Rooms to list
+            page: Requested page (0-based, clamped to the valid range)
+            newest_first: Order by most recent join first
+            query: Folded name fragment to filter by (see normalize_name)
+
+        Returns:
+            (page body, page actually shown, page count, matching members)
+        """
+        self._refresh_admin(list(rooms))
+        key = (newest_first, query)
+        view = self._admin_views.get(key)
+        if view is None:
+            entries = reversed(self._admin_order) if newest_first else self._admin_order
+            lines = [entry.line for entry in entries if query in entry.folded_name]
+            view = (len(lines), paginate(lines, "\n\n", self.page_size, self.max_chars))
+            if len(self._admin_views) >= self.MAX_ADMIN_VIEWS:
+                self._admin_views.clear()
+            self._admin_views[key] = view
+        matches, pages = view
+        page = _clamp(page, len(pages))
+        return pages[page], page, len(pages), matches
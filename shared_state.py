@@ -0,0 +1,926 @@
+"""
+Shared State Module
+
+Lets several bot processes share rooms, members, name assignments and the
+outbound queue. A small Redis-shaped backend interface has an in-process
+implementation (one process, useful for development) and a Redis-protocol
+implementation. The Redis client is synchronous, so its round trips run on
+one backend thread, in submission order, and coroutines await them there
+instead of blocking the event loop. On top of it:
+
+- SharedStorage: storage backend (see storage.py) whose records live in the
+  shared backend, with atomic name claims so two workers never hand out the
+  same name. Each namespace has a version counter and records the version at
+  which each key last changed, so workers fetch only the keys changed since
+  they last looked.
+- SharedOutboundQueue: drop-in replacement for message_queue.OutboundQueue
+  that lets every delivery worker pull from one queue, one item per chat at
+  a time.
+- SharedTokenBucket: the broadcaster's global rate limit and 429 pause, held
+  in the backend so they apply to every worker together.
+- StateSync: background task that applies other workers' changes to rooms.
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import socket
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from message_queue import OutboundItem
+from storage import BatchedStorage
+
+logger = logging.getLogger(__name__)
+
+# Change-set member marking that a namespace was cleared at that version
+_CLEARED = "\x00cleared"
+
+
+def _take_tokens(state: Tuple[float, float, float], rate: float, capacity: float, want: int,
+                 now: float) -> Tuple[int, float, Tuple[float, float, float]]:
+    """
+    Token bucket step shared by the backends
+
+    Args:
+        state: (tokens, updated_at, blocked_until)
+        want: Tokens to take at most
+
+    Returns:
+        (tokens granted, seconds to wait if none were, new state)
+    """
+    tokens, updated_at, blocked_until = state
+    if now < blocked_until:
+        return 0, blocked_until - now, state
+    # Workers' clocks may disagree slightly; never refill for negative time
+    now = max(now, updated_at)
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    granted = min(want, int(tokens))
+    if granted:
+        return granted, 0.0, (tokens - granted, now, blocked_until)
+    return 0, (1 - tokens) / rate, (tokens, now, blocked_until)
+
+
+def _log_failure(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning(f"Shared backend write failed: {future.exception()}")
+
+
+class InProcessBackend:
+    """Backend kept in this process's memory; calls run inline"""
+
+    def __init__(self):
+        self.hashes: Dict[str, Dict[str, str]] = {}
+        self.counters: Dict[str, int] = {}
+        self.lists: Dict[str, List[str]] = {}
+        # key -> sorted list of (score, member)
+        self.zsets: Dict[str, List[Tuple[float, str]]] = {}
+        # key -> {member: version}, for change sets (see write_changes)
+        self.change_sets: Dict[str, Dict[str, int]] = {}
+        # key -> (tokens, updated_at, blocked_until), for token buckets
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}
+        # key -> (holder, expires_at), for leases
+        self.leases: Dict[str, Tuple[str, float]] = {}
+
+    async def run(self, fn: Callable, *args) -> Any:
+        return fn(*args)
+
+    def submit(self, fn: Callable, *args) -> None:
+        fn(*args)
+
+    def call(self, fn: Callable, *args) -> Any:
+        return fn(*args)
+
+    def close(self) -> None:
+        pass
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        return dict(self.hashes.get(key, {}))
+
+    def hget(self, key: str, field: str) -> Optional[str]:
+        return self.hashes.get(key, {}).get(field)
+
+    def hsetnx(self, key: str, field: str, value: str) -> bool:
+        values = self.hashes.setdefault(key, {})
+        if field in values:
+            return False
+        values[field] = value
+        return True
+
+    def hdel_if_equal(self, key: str, field: str, value: str) -> bool:
+        values = self.hashes.get(key, {})
+        if values.get(field) != value:
+            return False
+        del values[field]
+        return True
+
+    def hmget(self, key: str, fields: List[str]) -> List[Optional[str]]:
+        values = self.hashes.get(key, {})
+        return [values.get(field) for field in fields]
+
+    def write_changes(self, records_key: str, changes_key: str, version_key: str,
+                      changes: Dict[str, Optional[str]], cleared: bool = False) -> int:
+        version = self.counters.get(version_key, 0) + 1
+        self.counters[version_key] = version
+        if cleared:
+            self.hashes.pop(records_key, None)
+            self.change_sets[changes_key] = {_CLEARED: version}
+        records = self.hashes.setdefault(records_key, {})
+        change_set = self.change_sets.setdefault(changes_key, {})
+        for key, value in changes.items():
+            if value is None:
+                records.pop(key, None)
+            else:
+                records[key] = value
+            change_set[key] = version
+        return version
+
+    def changed_since(self, key: str, after: int, upto: int) -> List[str]:
+        return [member for member, version in self.change_sets.get(key, {}).items() if after < version <= upto]
+
+    def delete(self, key: str) -> None:
+        self.hashes.pop(key, None)
+        self.lists.pop(key, None)
+        self.zsets.pop(key, None)
+        self.change_sets.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        self.counters[key] = self.counters.get(key, 0) + amount
+        return self.counters[key]
+
+    def get_int(self, key: str) -> int:
+        return self.counters.get(key, 0)
+
+    def get_ints(self, keys: List[str]) -> List[int]:
+        return [self.counters.get(key, 0) for key in keys]
+
+    def rpush(self, key: str, values: List[str]) -> None:
+        self.lists.setdefault(key, []).extend(values)
+
+    def lmove_many(self, source: str, destination: str, count: int) -> List[str]:
+        items = self.lists.get(source, [])
+        moved, self.lists[source] = items[:count], items[count:]
+        self.lists.setdefault(destination, []).extend(moved)
+        return moved
+
+    def lrem(self, key: str, value: str) -> None:
+        items = self.lists.get(key, [])
+        if value in items:
+            items.remove(value)
+
+    def lrange(self, key: str) -> List[str]:
+        return list(self.lists.get(key, []))
+
+    def llen(self, key: str) -> int:
+        return len(self.lists.get(key, []))
+
+    def push_keyed(self, ready_key: str, entries: List[Tuple[str, str, str]]) -> None:
+        for list_key, member, value in entries:
+            items = self.lists.setdefault(list_key, [])
+            items.append(value)
+            if len(items) == 1:
+                self.lists.setdefault(ready_key, []).append(member)
+
+    def heads(self, keys: List[str]) -> List[Optional[str]]:
+        return [self.lists[key][0] if self.lists.get(key) else None for key in keys]
+
+    def pop_head(self, list_key: str, processing_key: str, member: str, ready_key: str) -> None:
+        items = self.lists.get(list_key, [])
+        if items:
+            items.pop(0)
+        self.lrem(processing_key, member)
+        if items:
+            self.lists.setdefault(ready_key, []).append(member)
+        else:
+            self.lists.pop(list_key, None)
+
+    def delay_head(self, list_key: str, value: str, processing_key: str, member: str,
+                   delayed_key: str, due: float) -> None:
+        items = self.lists.get(list_key)
+        if items:
+            items[0] = value
+        self.lrem(processing_key, member)
+        self.zadd(delayed_key, member, due)
+
+    def zadd(self, key: str, member: str, score: float) -> None:
+        bisect.insort(self.zsets.setdefault(key, []), (score, member))
+
+    def zpop_due(self, key: str, max_score: float, limit: int) -> List[str]:
+        entries = self.zsets.get(key, [])
+        due = 0
+        while due < len(entries) and due < limit and entries[due][0] <= max_score:
+            due += 1
+        popped, self.zsets[key] = entries[:due], entries[due:]
+        return [member for score, member in popped]
+
+    def zcard(self, key: str) -> int:
+        return len(self.zsets.get(key, []))
+
+    def zmin_score(self, key: str) -> Optional[float]:
+        entries = self.zsets.get(key)
+        return entries[0][0] if entries else None
+
+    def acquire_lease(self, key: str, holder: str, ttl: float) -> Optional[str]:
+        current, expires_at = self.leases.get(key, (None, 0.0))
+        if current not in (None, holder) and expires_at > time.time():
+            return current
+        self.leases[key] = (holder, time.time() + ttl)
+        return None
+
+    def release_lease(self, key: str, holder: str) -> None:
+        if self.leases.get(key, (None, 0.0))[0] == holder:
+            del self.leases[key]
+
+    def take_tokens(self, key: str, rate: float, capacity: float, want: int, now: float) -> Tuple[int, float]:
+        granted, wait, self.buckets[key] = _take_tokens(
+            self.buckets.get(key, (capacity, now, 0.0)), rate, capacity, want, now
+        )
+        return granted, wait
+
+    def block_tokens(self, key: str, until: float) -> None:
+        tokens, updated_at, blocked_until = self.buckets.get(key, (0.0, until, 0.0))
+        self.buckets[key] = (0.0, updated_at, max(blocked_until, until))
+
+
+class RedisBackend:
+    """Backend speaking the Redis protocol (Redis, Valkey, fakeredis, ...)"""
+
+    def __init__(self, url: Optional[str] = None, client=None):
+        """
+        Args:
+            url: Redis URL, e.g. redis://localhost:6379/0
+            client: Pre-built client with decode_responses=True (overrides url)
+        """
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("The redis package is required for the Redis state backend") from e
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0", decode_responses=True)
+        self.client = client
+        # One thread, so queued writes reach the server in the order they were made
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="redis")
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) on the backend thread and await its result"""
+        return await asyncio.wrap_future(self.executor.submit(fn, *args))
+
+    def submit(self, fn: Callable, *args) -> None:
+        """Queue fn(*args) on the backend thread without waiting; failures are logged"""
+        self.executor.submit(fn, *args).add_done_callback(_log_failure)
+
+    def call(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) on the backend thread and block until it (and everything queued before it) is done"""
+        return self.executor.submit(fn, *args).result()
+
+    def close(self) -> None:
+        """Finish queued calls and stop the backend thread"""
+        self.executor.shutdown(wait=True)
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        return self.client.hgetall(key)
+
+    def hget(self, key: str, field: str) -> Optional[str]:
+        return self.client.hget(key, field)
+
+    def hsetnx(self, key: str, field: str, value: str) -> bool:
+        return bool(self.client.hsetnx(key, field, value))
+
+    def hdel_if_equal(self, key: str, field: str, value: str) -> bool:
+        from redis.exceptions import WatchError
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    if pipe.hget(key, field) != value:
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    pipe.hdel(key, field)
+                    pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    def hmget(self, key: str, fields: List[str]) -> List[Optional[str]]:
+        return self.client.hmget(key, fields) if fields else []
+
+    def write_changes(self, records_key: str, changes_key: str, version_key: str,
+                      changes: Dict[str, Optional[str]], cleared: bool = False) -> int:
+        """
+        Apply record changes and stamp each key with the namespace's next
+        version, atomically, so a reader that sees a version also sees every
+        key changed up to it
+        """
+        from redis.exceptions import WatchError
+        written = {key: value for key, value in changes.items() if value is not None}
+        deleted = [key for key, value in changes.items() if value is None]
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(version_key)
+                    version = int(pipe.get(version_key) or 0) + 1
+                    pipe.multi()
+                    if cleared:
+                        pipe.delete(records_key, changes_key)
+                        pipe.zadd(changes_key, {_CLEARED: version})
+                    if written:
+                        pipe.hset(records_key, mapping=written)
+                    if deleted:
+                        pipe.hdel(records_key, *deleted)
+                    if changes:
+                        pipe.zadd(changes_key, dict.fromkeys(changes, version))
+                    pipe.set(version_key, version)
+                    pipe.execute()
+                    return version
+                except WatchError:
+                    continue
+
+    def changed_since(self, key: str, after: int, upto: int) -> List[str]:
+        return self.client.zrangebyscore(key, f"({after}", upto)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return self.client.incr(key, amount)
+
+    def get_int(self, key: str) -> int:
+        return int(self.client.get(key) or 0)
+
+    def get_ints(self, keys: List[str]) -> List[int]:
+        return [int(value or 0) for value in self.client.mget(keys)] if keys else []
+
+    def rpush(self, key: str, values: List[str]) -> None:
+        if values:
+            self.client.rpush(key, *values)
+
+    def lmove_many(self, source: str, destination: str, count: int) -> List[str]:
+        # Each LMOVE is atomic, so concurrent workers never receive the same item
+        with self.client.pipeline(transaction=False) as pipe:
+            for _ in range(count):
+                pipe.lmove(source, destination, "LEFT", "RIGHT")
+            return [item for item in pipe.execute() if item is not None]
+
+    def lrem(self, key: str, value: str) -> None:
+        self.client.lrem(key, 1, value)
+
+    def lrange(self, key: str) -> List[str]:
+        return self.client.lrange(key, 0, -1)
+
+    def llen(self, key: str) -> int:
+        return self.client.llen(key)
+
+    def push_keyed(self, ready_key: str, entries: List[Tuple[str, str, str]]) -> None:
+        """
+        Append each value to its list and queue the member of every list that
+        was empty on ready_key, atomically, so a member is queued exactly when
+        its list gains its first value
+        """
+        from redis.exceptions import WatchError
+        list_keys = list(dict.fromkeys(list_key for list_key, member, value in entries))
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(*list_keys)
+                    # The lengths are read on another connection to batch them; the watch still covers them
+                    with self.client.pipeline(transaction=False) as reads:
+                        for list_key in list_keys:
+                            reads.llen(list_key)
+                        lengths = dict(zip(list_keys, reads.execute()))
+                    pipe.multi()
+                    started = []
+                    for list_key, member, value in entries:
+                        pipe.rpush(list_key, value)
+                        if not lengths[list_key]:
+                            started.append(member)
+                        lengths[list_key] += 1
+                    if started:
+                        pipe.rpush(ready_key, *started)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def heads(self, keys: List[str]) -> List[Optional[str]]:
+        with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.lindex(key, 0)
+            return pipe.execute()
+
+    def pop_head(self, list_key: str, processing_key: str, member: str, ready_key: str) -> None:
+        """Drop a list's first value and release its member: queued again on ready_key if values remain"""
+        from redis.exceptions import WatchError
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(list_key)
+                    remaining = pipe.llen(list_key) - 1
+                    pipe.multi()
+                    pipe.lpop(list_key)
+                    pipe.lrem(processing_key, 1, member)
+                    if remaining > 0:
+                        pipe.rpush(ready_key, member)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def delay_head(self, list_key: str, value: str, processing_key: str, member: str,
+                   delayed_key: str, due: float) -> None:
+        """Replace a list's first value and park its member on delayed_key until ``due``"""
+        with self.client.pipeline() as pipe:
+            pipe.lset(list_key, 0, value)
+            pipe.lrem(processing_key, 1, member)
+            pipe.zadd(delayed_key, {member: due})
+            pipe.execute()
+
+    def zadd(self, key: str, member: str, score: float) -> None:
+        self.client.zadd(key, {member: score})
+
+    def zpop_due(self, key: str, max_score: float, limit: int) -> List[str]:
+        members = self.client.zrangebyscore(key, "-inf", max_score, start=0, num=limit)
+        # ZREM tells us whether this worker or a concurrent one took the member
+        return [member for member in members if self.client.zrem(key, member)]
+
+    def zcard(self, key: str) -> int:
+        return self.client.zcard(key)
+
+    def zmin_score(self, key: str) -> Optional[float]:
+        entries = self.client.zrange(key, 0, 0, withscores=True)
+        return entries[0][1] if entries else None
+
+    def acquire_lease(self, key: str, holder: str, ttl: float) -> Optional[str]:
+        """
+        Take or renew a lease that expires ``ttl`` seconds from now
+
+        Returns:
+            None if ``holder`` now holds the lease, else the current holder
+        """
+        from redis.exceptions import WatchError
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    current = pipe.get(key)
+                    if current not in (None, holder):
+                        pipe.unwatch()
+                        return current
+                    pipe.multi()
+                    pipe.set(key, holder, px=int(ttl * 1000))
+                    pipe.execute()
+                    return None
+                except WatchError:
+                    continue
+
+    def release_lease(self, key: str, holder: str) -> None:
+        from redis.exceptions import WatchError
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    if pipe.get(key) != holder:
+                        pipe.unwatch()
+                        return
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def _update_bucket(self, key: str, step: Callable) -> Any:
+        """
+        Read a token bucket, compute its new state with
+        ``step(state) -> (result, new state or None)`` and write it back
+        unless another worker changed it meanwhile (then try again)
+        """
+        from redis.exceptions import WatchError
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    values = pipe.hmget(key, "tokens", "updated_at", "blocked_until")
+                    state = None if values[0] is None else tuple(float(value) for value in values)
+                    result, new_state = step(state)
+                    if new_state is None:
+                        pipe.unwatch()
+                        return result
+                    pipe.multi()
+                    pipe.hset(key, mapping=dict(zip(("tokens", "updated_at", "blocked_until"), new_state)))
+                    pipe.execute()
+                    return result
+                except WatchError:
+                    continue
+
+    def take_tokens(self, key: str, rate: float, capacity: float, want: int, now: float) -> Tuple[int, float]:
+        def step(state):
+            granted, wait, new_state = _take_tokens(state or (capacity, now, 0.0), rate, capacity, want, now)
+            return (granted, wait), new_state if granted else None
+
+        return self._update_bucket(key, step)
+
+    def block_tokens(self, key: str, until: float) -> None:
+        def step(state):
+            tokens, updated_at, blocked_until = state or (0.0, until, 0.0)
+            return None, (0.0, updated_at, max(blocked_until, until))
+
+        self._update_bucket(key, step)
+
+
+class SharedStorage(BatchedStorage):
+    """Storage backend whose records and name claims live in a shared backend"""
+
+    shared = True
+
+    def __init__(self, backend, prefix: str = "anonbot", batch_size: int = 100):
+        """
+        Args:
+            backend: InProcessBackend or RedisBackend
+            prefix: Key prefix, so several bots can share one server
+            batch_size: Pending changes that trigger an immediate flush
+        """
+        super().__init__(batch_size)
+        self.backend = backend
+        self.prefix = prefix
+        # Namespace versions this process has already loaded
+        self.seen_versions: Dict[str, int] = {}
+        # (namespace, key) written here while a fetch is in flight; key None = cleared
+        self._written: Optional[Set[Tuple[str, Optional[str]]]] = None
+
+    def _records_key(self, namespace: str) -> str:
+        return f"{self.prefix}:records:{namespace}"
+
+    def _version_key(self, namespace: str) -> str:
+        return f"{self.prefix}:version:{namespace}"
+
+    def _changes_key(self, namespace: str) -> str:
+        return f"{self.prefix}:changes:{namespace}"
+
+    def _claims_key(self, namespace: str) -> str:
+        return f"{self.prefix}:claims:{namespace}"
+
+    def put(self, namespace: str, key: Any, value: Any) -> None:
+        if self._written is not None:
+            self._written.add((namespace, str(key)))
+        super().put(namespace, key, value)
+
+    def delete(self, namespace: str, key: Any) -> None:
+        if self._written is not None:
+            self._written.add((namespace, str(key)))
+        super().delete(namespace, key)
+
+    def clear(self, namespace: str) -> None:
+        if self._written is not None:
+            self._written.add((namespace, None))
+        super().clear(namespace)
+
+    def load(self, namespace: str) -> Dict[str, object]:
+        # Queued writes land first, so the load sees them
+        self.flush()
+        return self.backend.call(self._load, namespace)
+
+    def _load(self, namespace: str) -> Dict[str, object]:
+        self.seen_versions[namespace] = self.backend.get_int(self._version_key(namespace))
+        return {
+            key: json.loads(value)
+            for key, value in self.backend.hgetall(self._records_key(namespace)).items()
+        }
+
+    def _write_batch(self, cleared: List[str], ops: List[Tuple[str, str, Optional[str]]]) -> None:
+        self.backend.submit(self._write_changes, cleared, ops)
+
+    def _write_changes(self, cleared: List[str], ops: List[Tuple[str, str, Optional[str]]]) -> None:
+        by_namespace: Dict[str, Dict[str, Optional[str]]] = {namespace: {} for namespace in cleared}
+        for namespace, key, value in ops:
+            by_namespace.setdefault(namespace, {})[key] = value
+        for namespace, changes in by_namespace.items():
+            version = self.backend.write_changes(
+                self._records_key(namespace), self._changes_key(namespace), self._version_key(namespace),
+                changes, namespace in cleared,
+            )
+            # Only skip our own change if nobody else wrote in between
+            if version == self.seen_versions.get(namespace, 0) + 1:
+                self.seen_versions[namespace] = version
+
+    def fetch_changes(self) -> Dict[str, Tuple[bool, Dict[str, object]]]:
+        """
+        Records other workers have changed since this process last looked
+
+        Returns:
+            namespace -> (full, records) for each changed namespace loaded
+            here. With full set, records is the whole namespace; otherwise it
+            holds only the changed keys, None for a deleted one.
+        """
+        namespaces = list(self.seen_versions)
+        versions = self.backend.get_ints([self._version_key(namespace) for namespace in namespaces])
+        changes = {}
+        for namespace, version in zip(namespaces, versions):
+            seen = self.seen_versions.get(namespace)
+            if seen is None or version == seen:
+                continue
+            records_key = self._records_key(namespace)
+            keys = [] if version < seen else self.backend.changed_since(self._changes_key(namespace), seen, version)
+            if not keys or _CLEARED in keys:
+                # Cleared, reset, or written before keys were versioned
+                changes[namespace] = (True, self._load(namespace))
+                continue
+            values = self.backend.hmget(records_key, keys)
+            changes[namespace] = (False, {
+                key: None if value is None else json.loads(value) for key, value in zip(keys, values)
+            })
+            self.seen_versions[namespace] = version
+        return changes
+
+    async def fetch_changes_async(self) -> Dict[str, Tuple[bool, Dict[str, object]]]:
+        """
+        fetch_changes on the backend thread. Keys this process writes while
+        it runs are left out: the local state is newer than what was fetched.
+        """
+        seen = dict(self.seen_versions)
+        self._written = set()
+        try:
+            changes = await self.backend.run(self.fetch_changes)
+            written = self._written
+        finally:
+            self._written = None
+        if not written:
+            return changes
+        namespaces_written = {namespace for namespace, _ in written}
+        for namespace, (full, records) in list(changes.items()):
+            if (namespace, None) in written or (full and namespace in namespaces_written):
+                # A full load would undo local changes; fetch it again next time
+                del changes[namespace]
+                if namespace in self.seen_versions:
+                    self.seen_versions[namespace] = seen.get(namespace, 0)
+                continue
+            for key in [key for key in records if (namespace, key) in written]:
+                del records[key]
+        return changes
+
+    def unload(self, namespace: str) -> None:
+        """Stop watching a namespace for changes"""
+        self.seen_versions.pop(namespace, None)
+
+    def _claim(self, namespace: str, key: str, owner: str) -> bool:
+        claims_key = self._claims_key(namespace)
+        if self.backend.hsetnx(claims_key, key, owner):
+            return True
+        return self.backend.hget(claims_key, key) == owner
+
+    def claim(self, namespace: str, key: str, owner: str) -> bool:
+        return self.backend.call(self._claim, namespace, key, owner)
+
+    async def claim_async(self, namespace: str, key: str, owner: str) -> bool:
+        return await self.backend.run(self._claim, namespace, key, owner)
+
+    def release_claim(self, namespace: str, key: str, owner: str) -> None:
+        self.backend.submit(self.backend.hdel_if_equal, self._claims_key(namespace), key, owner)
+
+    def clear_claims(self, namespace: str) -> None:
+        self.backend.submit(self.backend.delete, self._claims_key(namespace))
+
+    def close(self) -> None:
+        self.flush()
+        self.backend.close()
+
+
+class SharedOutboundQueue:
+    """
+    Outbound queue shared by every worker. Each chat's items wait in their
+    own list, and the chat itself sits in exactly one place: the ready list,
+    the delayed sorted set (scored by due time, while its oldest item waits
+    for a retry) or the processing list of the worker delivering that item,
+    so a restarted worker can resume its own work. A chat is queued again
+    only once its oldest item is acknowledged, so its messages go out one at
+    a time and in order.
+    """
+
+    # Recipients pushed per transaction, so a big fan-out does not keep
+    # conflicting with workers acknowledging those chats' items
+    push_chunk = 500
+    # Seconds a worker's claim on its id outlives its last queue call
+    lease_ttl = 30.0
+
+    def __init__(self, backend, worker_id: str, prefix: str = "anonbot"):
+        """
+        Args:
+            backend: InProcessBackend or RedisBackend
+            worker_id: Stable identifier of this worker (survives restarts), unique
+                among live workers
+            prefix: Key prefix
+        """
+        self.backend = backend
+        self.worker_id = worker_id
+        self.prefix = prefix
+        self.ready_key = f"{prefix}:outbox:ready"
+        self.delayed_key = f"{prefix}:outbox:delayed"
+        self.processing_key = f"{prefix}:outbox:processing:{worker_id}"
+        self.id_key = f"{prefix}:outbox:next_id"
+        self.depth_key = f"{prefix}:outbox:depth"
+        # Held while this process works the processing list, so a second
+        # live worker with the same id fails instead of taking over its items
+        self.lease_key = f"{prefix}:outbox:worker:{worker_id}"
+        self.lease_holder = f"{socket.gethostname()}:{os.getpid()}"
+        self._lease_renewed = 0.0
+        # item id -> (chat, raw payload) for the items this worker has claimed
+        self.inflight: Dict[int, Tuple[str, str]] = {}
+        # Depth as of the last count, refreshed in the background by depth()
+        self._depth = 0
+
+    async def call(self, fn: Callable, *args) -> Any:
+        """Run a queue method on the backend thread; every method but depth goes through here"""
+        return await self.backend.run(fn, *args)
+
+    def _chat_key(self, chat: Any) -> str:
+        return f"{self.prefix}:outbox:chat:{chat}"
+
+    @staticmethod
+    def _decode(raw: str) -> OutboundItem:
+        data = json.loads(raw)
+        return OutboundItem(data["id"], data["user_id"], data["chat_id"], data["text"], data["attempts"],
+                            data.get("media"), data.get("ref"), data.get("reply_to"), data.get("edit"))
+
+    def _hold_lease(self) -> None:
+        """Take or renew this worker's lease; raises if another live process holds it"""
+        holder = self.backend.acquire_lease(self.lease_key, self.lease_holder, self.lease_ttl)
+        if holder is not None:
+            raise RuntimeError(
+                f"WORKER_ID {self.worker_id} is in use by {holder} (or it stopped uncleanly less than"
+                f" {self.lease_ttl:.0f}s ago); give every worker its own WORKER_ID"
+            )
+        self._lease_renewed = time.monotonic()
+
+    def enqueue(self, recipients: Iterable[Tuple[Optional[int], int]], text: str,
+                media: Optional[Dict] = None, ref: Optional[int] = None,
+                reply_to: Optional[int] = None, edit: Optional[str] = None) -> int:
+        """Push one message for many recipients; run it through call(), which raises if the backend fails"""
+        recipients = list(recipients)
+        if not recipients:
+            return 0
+        # Reserve a block of ids with a single round-trip
+        first_id = self.backend.incr(self.id_key, len(recipients)) - len(recipients) + 1
+        entries = [
+            (self._chat_key(chat_id), str(chat_id),
+             json.dumps({"id": first_id + offset, "user_id": user_id,
+                         "chat_id": chat_id, "text": text, "attempts": 0, "media": media,
+                         "ref": ref, "reply_to": reply_to, "edit": edit}))
+            for offset, (user_id, chat_id) in enumerate(recipients)
+        ]
+        for start in range(0, len(entries), self.push_chunk):
+            self.backend.push_keyed(self.ready_key, entries[start:start + self.push_chunk])
+        self.backend.incr(self.depth_key, len(entries))
+        return len(entries)
+
+    def claim(self, limit: int) -> List[OutboundItem]:
+        if time.monotonic() - self._lease_renewed > self.lease_ttl / 3:
+            self._hold_lease()
+        due = self.backend.zpop_due(self.delayed_key, time.time(), limit)
+        if due:
+            self.backend.rpush(self.ready_key, due)
+        chats = self.backend.lmove_many(self.ready_key, self.processing_key, limit)
+        items = []
+        for chat, raw in zip(chats, self.backend.heads([self._chat_key(chat) for chat in chats])):
+            if raw is None:
+                self.backend.lrem(self.processing_key, chat)
+                continue
+            item = self._decode(raw)
+            self.inflight[item.id] = (chat, raw)
+            items.append(item)
+        return items
+
+    def ack(self, item_ids: Iterable[int]) -> None:
+        for item_id in item_ids:
+            entry = self.inflight.pop(item_id, None)
+            if entry is not None:
+                chat = entry[0]
+                self.backend.pop_head(self._chat_key(chat), self.processing_key, chat, self.ready_key)
+                self.backend.incr(self.depth_key, -1)
+
+    def retry(self, item_id: int, delay: float) -> None:
+        entry = self.inflight.pop(item_id, None)
+        if entry is None:
+            return
+        chat, raw = entry
+        data = json.loads(raw)
+        data["attempts"] += 1
+        # The item stays at the head of its chat, so nothing overtakes it meanwhile
+        self.backend.delay_head(self._chat_key(chat), json.dumps(data), self.processing_key, chat,
+                                self.delayed_key, time.time() + delay)
+
+    def recover(self) -> int:
+        self._hold_lease()
+        stranded = self.backend.lrange(self.processing_key)
+        if stranded:
+            self.backend.rpush(self.ready_key, stranded)
+            self.backend.delete(self.processing_key)
+        self.inflight.clear()
+        return len(stranded)
+
+    def next_available_in(self) -> Optional[float]:
+        if self.backend.llen(self.ready_key):
+            return 0.0
+        due = self.backend.zmin_score(self.delayed_key)
+        return None if due is None else max(0.0, due - time.time())
+
+    def depth(self) -> int:
+        """Depth as of the previous call; the count is refreshed on the backend thread"""
+        self.backend.submit(self._count)
+        return self._depth
+
+    def _count(self) -> None:
+        self._depth = self.backend.get_int(self.depth_key)
+
+    def close(self) -> None:
+        if self._lease_renewed:
+            self.backend.submit(self.backend.release_lease, self.lease_key, self.lease_holder)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket (see broadcaster.TokenBucket) kept in the shared backend, so
+    its rate and any pause after a 429 hold for every worker together. Each
+    worker leases a few tokens per round trip and spends them locally.
+    """
+
+    def __init__(self, backend, name: str, rate: float, capacity: Optional[float] = None,
+                 prefix: str = "anonbot"):
+        """
+        Args:
+            backend: InProcessBackend or RedisBackend
+            name: Bucket name, shared by the workers drawing on it
+            rate: Tokens added per second, across all workers
+            capacity: Maximum burst size (defaults to one second worth of tokens)
+            prefix: Key prefix
+        """
+        self.backend = backend
+        self.key = f"{prefix}:bucket:{name}"
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        # Tokens leased per round trip: about 50ms worth
+        self.lease = max(1, int(rate / 20))
+        # Leased tokens not spent yet
+        self.tokens = 0
+        # One local waiter polls the backend at a time
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        async with self.lock:
+            while not self.tokens:
+                granted, wait = await self.backend.run(
+                    self.backend.take_tokens, self.key, self.rate, self.capacity, self.lease, time.time()
+                )
+                self.tokens = granted
+                if not granted:
+                    await asyncio.sleep(wait)
+            self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Block the bucket for every worker for the given number of seconds (e.g. after a 429)"""
+        self.tokens = 0
+        self.backend.submit(self.backend.block_tokens, self.key, time.time() + seconds)
+
+
+class StateSync:
+    def __init__(self, storage: SharedStorage, rooms, interval: float = 1.0, listeners: Iterable = ()):
+        """
+        Periodically apply other workers' changes to rooms
+
+        Args:
+            storage: Shared storage the rooms are built on
+            rooms: RoomManager to refresh
+            interval: Seconds between checks
+            listeners: Other objects with an ``apply_changes(changes)`` method
+        """
+        self.storage = storage
+        self.rooms = rooms
+        self.interval = interval
+        self.listeners = list(listeners)
+
+    async def sync_once(self) -> Set[str]:
+        """
+        Publish local changes, then apply the records others changed
+
+        Returns:
+            Namespaces that had changed
+        """
+        self.storage.flush()
+        changes = await self.storage.fetch_changes_async()
+        if changes:
+            self.rooms.apply_changes(changes)
+            for listener in self.listeners:
+                listener.apply_changes(changes)
+        return set(changes)
+
+    async def run(self) -> None:
+        """Sync every ``interval`` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync_once()
+            except Exception as e:
+                logger.warning(f"Shared state sync failed: {e}")
@@ -0,0 +1,305 @@
+"""
+Storage Module
+
+Pluggable persistence for UserManager and NameGenerator state. Records are
+grouped by namespace and written through a coalescing buffer so that bursts
+of joins and leaves turn into a single batched transaction.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Marker for a pending deletion in the write buffer
+_DELETED = object()
+
+
+class MemoryStorage:
+    """Default backend: state only lives in the owning objects' dicts"""
+
+    # True when other processes read and write the same records
+    shared = False
+
+    def load(self, namespace: str) -> Dict[str, Any]:
+        """
+        Load every record of a namespace
+
+        Args:
+            namespace: Record group, e.g. "users" or "assignments"
+
+        Returns:
+            Dictionary of key -> value (keys are always strings)
+        """
+        return {}
+
+    def put(self, namespace: str, key: Any, value: Any) -> None:
+        """Store (or replace) a record"""
+
+    def delete(self, namespace: str, key: Any) -> None:
+        """Delete a record if it exists"""
+
+    def clear(self, namespace: str) -> None:
+        """Delete every record of a namespace"""
+
+    def flush(self) -> int:
+        """
+        Write buffered changes to the backend
+
+        Returns:
+            Number of records written
+        """
+        return 0
+
+    def pending_count(self) -> int:
+        """Get the number of buffered, unwritten changes"""
+        return 0
+
+    def claim(self, namespace: str, key: str, owner: str) -> bool:
+        """
+        Reserve a key for an owner across every process sharing this backend
+
+        Returns:
+            True if the key is now (or already was) held by ``owner``
+        """
+        return True
+
+    async def claim_async(self, namespace: str, key: str, owner: str) -> bool:
+        """claim() for coroutines; a shared backend answers without blocking the event loop"""
+        return self.claim(namespace, key, owner)
+
+    def release_claim(self, namespace: str, key: str, owner: str) -> None:
+        """Give up a reservation made with claim()"""
+
+    def clear_claims(self, namespace: str) -> None:
+        """Drop every reservation of a namespace, whoever holds it"""
+
+    def unload(self, namespace: str) -> None:
+        """Stop tracking changes other processes make to a namespace"""
+
+    async def run_flusher(self, interval: float) -> None:
+        """Flush buffered changes every ``interval`` seconds until cancelled"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                self.flush()
+        finally:
+            self.flush()
+
+    def close(self) -> None:
+        """Flush and release the backend"""
+        self.flush()
+
+
+class BatchedStorage(MemoryStorage):
+    """Base for durable backends: coalesces writes and flushes them in batches"""
+
+    def __init__(self, batch_size: int = 500):
+        """
+        Args:
+            batch_size: Pending changes that trigger an immediate flush
+        """
+        self.batch_size = batch_size
+        # Later writes to the same key replace earlier ones before reaching disk
+        self.pending: Dict[Tuple[str, str], Any] = {}
+        self.cleared: List[str] = []
+
+    def put(self, namespace: str, key: Any, value: Any) -> None:
+        self.pending[(namespace, str(key))] = value
+        self._maybe_flush()
+
+    def delete(self, namespace: str, key: Any) -> None:
+        self.pending[(namespace, str(key))] = _DELETED
+        self._maybe_flush()
+
+    def clear(self, namespace: str) -> None:
+        for pending_key in [k for k in self.pending if k[0] == namespace]:
+            del self.pending[pending_key]
+        self.cleared.append(namespace)
+        self._maybe_flush()
+
+    def pending_count(self) -> int:
+        return len(self.pending) + len(self.cleared)
+
+    def _maybe_flush(self) -> None:
+        if self.pending_count() >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        if not self.pending and not self.cleared:
+            return 0
+        cleared, self.cleared = self.cleared, []
+        ops = [
+            (namespace, key, None if value is _DELETED else json.dumps(value))
+            for (namespace, key), value in self.pending.items()
+        ]
+        self.pending = {}
+        self._write_batch(cleared, ops)
+        return len(ops)
+
+    def _write_batch(self, cleared: List[str], ops: List[Tuple[str, str, Optional[str]]]) -> None:
+        """Persist cleared namespaces, then (namespace, key, json-or-None) operations"""
+        raise NotImplementedError
+
+
+class SQLiteStorage(BatchedStorage):
+    def __init__(self, path: str, batch_size: int = 500):
+        """
+        Open an SQLite database in WAL mode
+
+        Args:
+            path: Database file path
+            batch_size: Pending changes that trigger an immediate flush
+        """
+        super().__init__(batch_size)
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+
+    def load(self, namespace: str) -> Dict[str, Any]:
+        rows = self.conn.execute(
+            "SELECT key, value FROM records WHERE namespace = ?", (namespace,)
+        )
+        return {key: json.loads(value) for key, value in rows}
+
+    def _write_batch(self, cleared: List[str], ops: List[Tuple[str, str, Optional[str]]]) -> None:
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for namespace in cleared:
+                self.conn.execute("DELETE FROM records WHERE namespace = ?", (namespace,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO records (namespace, key, value) VALUES (?, ?, ?)",
+                [op for op in ops if op[2] is not None]
+            )
+            self.conn.executemany(
+                "DELETE FROM records WHERE namespace = ? AND key = ?",
+                [(namespace, key) for namespace, key, value in ops if value is None]
+            )
+
+    def close(self) -> None:
+        super().close()
+        self.conn.close()
+
+
+class AppendLogStorage(BatchedStorage):
+    """
+    Append-only JSON-lines log. Each line is one operation; the log is replayed
+    on startup and rewritten as a compact snapshot once it is mostly garbage,
+    both at startup and after any flush that pushes it past compact_ratio.
+    """
+    # Small logs are left alone at runtime rather than rewritten every few flushes
+    MIN_COMPACT_LINES = 1000
+
+    def __init__(self, path: str, batch_size: int = 500, compact_ratio: float = 2.0):
+        """
+        Args:
+            path: Log file path
+            batch_size: Pending changes that trigger an immediate flush
+            compact_ratio: Rewrite the log when it has this many lines per live record
+        """
+        super().__init__(batch_size)
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.log_lines = 0
+        self._replay()
+        if self.log_lines > self.compact_ratio * max(1, self._live_count()):
+            self.compact()
+        self.log = open(self.path, "a", encoding="utf-8")
+
+    def _live_count(self) -> int:
+        return sum(len(records) for records in self.records.values())
+
+    def _replay(self) -> None:
+        """Rebuild the in-memory image from the log"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as log:
+            for line in log:
+                self.log_lines += 1
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write; everything before it is valid
+                    logger.warning(f"Ignoring corrupt line {self.log_lines} in {self.path}")
+                    continue
+                namespace = op["ns"]
+                if "clear" in op:
+                    self.records.pop(namespace, None)
+                elif "v" in op:
+                    self.records.setdefault(namespace, {})[op["k"]] = op["v"]
+                else:
+                    self.records.get(namespace, {}).pop(op["k"], None)
+
+    def compact(self) -> None:
+        """Rewrite the log as one line per live record"""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as snapshot:
+            for namespace, records in self.records.items():
+                for key, value in records.items():
+                    snapshot.write(json.dumps({"ns": namespace, "k": key, "v": value}) + "\n")
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temp_path, self.path)
+        self.log_lines = self._live_count()
+
+    def load(self, namespace: str) -> Dict[str, Any]:
+        return dict(self.records.get(namespace, {}))
+
+    def _write_batch(self, cleared: List[str], ops: List[Tuple[str, str, Optional[str]]]) -> None:
+        lines = []
+        for namespace in cleared:
+            self.records.pop(namespace, None)
+            lines.append(json.dumps({"ns": namespace, "clear": True}))
+        for namespace, key, value in ops:
+            if value is None:
+                self.records.get(namespace, {}).pop(key, None)
+                lines.append(json.dumps({"ns": namespace, "k": key}))
+            else:
+                self.records.setdefault(namespace, {})[key] = json.loads(value)
+                lines.append(f'{{"ns": {json.dumps(namespace)}, "k": {json.dumps(key)}, "v": {value}}}')
+        self.log.write("\n".join(lines) + "\n")
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.log_lines += len(lines)
+        if (self.log_lines >= self.MIN_COMPACT_LINES
+                and self.log_lines > self.compact_ratio * max(1, self._live_count())):
+            self.log.close()
+            self.compact()
+            self.log = open(self.path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        super().close()
+        self.log.close()
+
+
+def create_storage(backend: str = "memory", path: Optional[str] = None) -> MemoryStorage:
+    """
+    Build a storage backend by name
+
+    Args:
+        backend: "memory", "sqlite" or "log"
+        path: File path for durable backends
+
+    Returns:
+        Storage instance
+    """
+    backend = (backend or "memory").lower()
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage(path or "bot_state.db")
+    if backend == "log":
+        return AppendLogStorage(path or "bot_state.log")
+    raise ValueError(f"Unknown storage backend: {backend}")
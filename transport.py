@@ -0,0 +1,111 @@
+"""
+Transport Module
+
+HTTP transport for the Bot API, configured from the environment. Handler
+traffic, getUpdates long polling and delivery each get their own connection
+pool, so a large broadcast cannot hold up replies or polling, and every pool
+reports how busy it is.
+
+Settings are read from BOT_API_<POOL>_<SETTING>, then BOT_API_<SETTING>,
+then the pool's default (e.g. BOT_API_DELIVERY_POOL_SIZE, BOT_API_HTTP_VERSION):
+
+    POOL_SIZE         connections in the pool
+    POOL_TIMEOUT      seconds to wait for a free connection
+    CONNECT_TIMEOUT, READ_TIMEOUT, WRITE_TIMEOUT
+    HTTP_VERSION      1.1 or 2 (HTTP/2 multiplexes requests over each connection)
+    KEEPALIVE_EXPIRY  seconds an idle connection is kept open
+    MAX_KEEPALIVE     idle connections kept open (defaults to the pool size)
+"""
+
+import os
+from typing import Callable, Optional, TypeVar
+
+import httpx
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+from metrics import HTTP_IN_FLIGHT, HTTP_POOL_CAPACITY, HTTP_POOL_SATURATED, HTTP_POOL_TIMEOUTS
+
+# Connection pools
+API = 'api'
+UPDATES = 'updates'
+DELIVERY = 'delivery'
+
+# Concurrent streams assumed per HTTP/2 connection when computing capacity
+# (the usual server default for SETTINGS_MAX_CONCURRENT_STREAMS)
+H2_STREAMS_PER_CONNECTION = 100
+
+T = TypeVar('T')
+
+
+def _setting(pool: str, name: str, default: T, parse: Callable[[str], T]) -> T:
+    value = os.getenv(f"BOT_API_{pool.upper()}_{name}") or os.getenv(f"BOT_API_{name}")
+    return parse(value) if value else default
+
+
+class PooledRequest(HTTPXRequest):
+    def __init__(self, pool: str, connection_pool_size: int = 1, keepalive_expiry: Optional[float] = 5.0,
+                 max_keepalive: Optional[int] = None, **kwargs):
+        """
+        HTTPXRequest with keep-alive limits and pool usage metrics
+
+        Args:
+            pool: Pool name reported in metrics
+            connection_pool_size: Connections in the pool
+            keepalive_expiry: Seconds an idle connection is kept open
+            max_keepalive: Idle connections kept open (defaults to the pool size)
+            **kwargs: Remaining HTTPXRequest settings (timeouts, http_version, ...)
+        """
+        self.pool = pool
+        self._limits = httpx.Limits(
+            max_connections=connection_pool_size,
+            max_keepalive_connections=connection_pool_size if max_keepalive is None else max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        self.pool_size = connection_pool_size
+        self.capacity = connection_pool_size * (1 if self.http_version == '1.1' else H2_STREAMS_PER_CONNECTION)
+        self.in_flight = 0
+        self._in_flight_gauge = HTTP_IN_FLIGHT.labels(pool)
+        self._saturated = HTTP_POOL_SATURATED.labels(pool)
+        self._pool_timeouts = HTTP_POOL_TIMEOUTS.labels(pool)
+        HTTP_POOL_CAPACITY.labels(pool).set(self.capacity)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(**dict(self._client_kwargs, limits=self._limits))
+
+    async def do_request(self, *args, **kwargs):
+        if self.in_flight >= self.capacity:
+            self._saturated.inc()
+        self.in_flight += 1
+        self._in_flight_gauge.inc()
+        try:
+            return await super().do_request(*args, **kwargs)
+        except TimedOut as e:
+            if isinstance(e.__cause__, httpx.PoolTimeout):
+                self._pool_timeouts.inc()
+            raise
+        finally:
+            self.in_flight -= 1
+            self._in_flight_gauge.inc(-1)
+
+
+def request_from_env(pool: str, pool_size: int) -> PooledRequest:
+    """
+    Build a pool's transport from the environment
+
+    Args:
+        pool: API, UPDATES or DELIVERY
+        pool_size: Connections in the pool unless POOL_SIZE is set
+    """
+    return PooledRequest(
+        pool,
+        connection_pool_size=_setting(pool, 'POOL_SIZE', pool_size, int),
+        pool_timeout=_setting(pool, 'POOL_TIMEOUT', 1.0, float),
+        connect_timeout=_setting(pool, 'CONNECT_TIMEOUT', 5.0, float),
+        read_timeout=_setting(pool, 'READ_TIMEOUT', 5.0, float),
+        write_timeout=_setting(pool, 'WRITE_TIMEOUT', 5.0, float),
+        http_version=_setting(pool, 'HTTP_VERSION', '1.1', str),
+        keepalive_expiry=_setting(pool, 'KEEPALIVE_EXPIRY', 5.0, float),
+        max_keepalive=_setting(pool, 'MAX_KEEPALIVE', None, int),
+    )
@@ -0,0 +1,72 @@
+"""
+Update Processor Module
+
+Concurrent update handling that keeps each user's updates in order. Updates
+from different users run in parallel, so one slow handler no longer stalls
+everybody else, while a user's own updates (e.g. /leave then /join) are
+still handled one after another, in arrival order.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict, Hashable, List
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class KeyedLocks:
+    """asyncio locks created per key on demand and dropped once nobody holds or awaits them"""
+
+    def __init__(self):
+        # key -> [lock, tasks holding or waiting for it]
+        self._locks: Dict[Hashable, List] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        """Hold the lock for ``key``; waiters acquire it in FIFO order"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int = 32, max_pending_updates: int = 10000):
+        """
+        Args:
+            max_concurrent_updates: Handlers running at once
+            max_pending_updates: Updates accepted at once, including those waiting
+                behind an earlier update from the same user
+        """
+        # The base class semaphore is taken before do_process_update. It only
+        # bounds pending updates here; the concurrency limit is applied after
+        # the per-user lock, so a user with a backlog cannot occupy every slot
+        super().__init__(max_pending_updates)
+        self.running = asyncio.Semaphore(max(1, max_concurrent_updates))
+        self.user_locks = KeyedLocks()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            async with self.running:
+                await coroutine
+            return
+        async with self.user_locks.hold(user.id):
+            async with self.running:
+                await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
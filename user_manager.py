@@ -4,14 +4,122 @@ User Manager Module
 Handles user session management, tracking active users and their anonymous names.
 """
 
-from typing import Dict, Set, Optional
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Set, Optional, Tuple, Union
+import bisect
+import heapq
+import sys
 import time
+from storage import MemoryStorage
+from name_generator import normalize_name
+
+class UserRecord:
+    """Compact per-user record; names are interned so equal names share storage"""
+    __slots__ = ('chat_id', 'name', 'joined_at', 'last_seen', 'dormant')
+
+    def __init__(self, chat_id: int, name: str, joined_at: float,
+                 last_seen: Optional[float] = None, dormant: bool = False):
+        self.chat_id = chat_id
+        self.name = sys.intern(name)
+        self.joined_at = joined_at
+        self.last_seen = joined_at if last_seen is None else last_seen
+        # Dormant members stay in the room but receive no broadcasts
+        self.dormant = dormant
+
+    def to_dict(self) -> Dict:
+        """Serialize for storage backends"""
+        return {
+            'chat_id': self.chat_id, 'name': self.name, 'joined_at': self.joined_at,
+            'last_seen': self.last_seen, 'dormant': self.dormant,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'UserRecord':
+        """Rebuild a record from its stored form"""
+        return cls(data['chat_id'], data['name'], data['joined_at'],
+                   data.get('last_seen'), data.get('dormant', False))
 
 class UserManager:
-    def __init__(self):
-        """Initialize user manager with empty user registry"""
-        # Structure: {user_id: {'chat_id': int, 'name': str, 'joined_at': float}}
-        self.active_users: Dict[int, Dict] = {}
+    STORAGE_NAMESPACE = 'users'
+    # last_seen is only refreshed (and persisted) once it is this many seconds old
+    LAST_SEEN_RESOLUTION = 60.0
+
+    def __init__(self, storage: Optional[MemoryStorage] = None, namespace: Optional[str] = None):
+        """
+        Initialize user manager, restoring the registry from storage
+
+        Args:
+            storage: Persistence backend (defaults to in-memory only)
+            namespace: Storage namespace (defaults to STORAGE_NAMESPACE)
+        """
+        self.storage = storage or MemoryStorage()
+        self.storage_namespace = namespace or self.STORAGE_NAMESPACE
+        # Structure: {user_id: UserRecord(chat_id, name, joined_at)}
+        self.active_users: Dict[int, UserRecord] = {
+            int(user_id): UserRecord.from_dict(user_info)
+            for user_id, user_info in self.storage.load(self.storage_namespace).items()
+        }
+        
+        # Reverse indexes: exact name -> user_id, and folded name -> user_id.
+        # Folding can make two names collide (same words, different emoji); only
+        # then does the folded entry hold a set of user IDs
+        self._name_index: Dict[str, int] = {}
+        self._folded_index: Dict[str, Union[int, Set[int]]] = {}
+        for user_id, user_info in self.active_users.items():
+            self._index_name(user_id, user_info.name)
+        
+        # Sorted (joined_at, user_id) pairs backing get_users_joined_since
+        self._joined_index: List[Tuple[float, int]] = sorted(
+            (user_info.joined_at, user_id) for user_id, user_info in self.active_users.items()
+        )
+        # Min-heap of (last_seen, user_id, joined_at) idle-expiry candidates, one
+        # per awake member. Entries go stale when a member is active again or
+        # leaves; expire_idle() re-checks the record and reschedules or drops them
+        self._expiry_heap: List[Tuple[float, int, float]] = [
+            (user_info.last_seen, user_id, user_info.joined_at)
+            for user_id, user_info in self.active_users.items()
+            if not user_info.dormant
+        ]
+        heapq.heapify(self._expiry_heap)
+        # Bumped on every change to membership or dormancy, so renderings of
+        # the member list can be cached until it changes
+        self.version = 0
+    
+    def _index_name(self, user_id: int, anonymous_name: str) -> None:
+        """Add a user's name to the reverse indexes"""
+        self._name_index[anonymous_name] = user_id
+        folded = normalize_name(anonymous_name)
+        holders = self._folded_index.get(folded)
+        if holders is None:
+            self._folded_index[folded] = user_id
+        elif isinstance(holders, set):
+            holders.add(user_id)
+        elif holders != user_id:
+            self._folded_index[folded] = {holders, user_id}
+    
+    def _unindex_name(self, user_id: int, anonymous_name: str) -> None:
+        """Remove a user's name from the reverse indexes"""
+        if self._name_index.get(anonymous_name) == user_id:
+            del self._name_index[anonymous_name]
+        folded = normalize_name(anonymous_name)
+        holders = self._folded_index.get(folded)
+        if holders == user_id:
+            del self._folded_index[folded]
+        elif isinstance(holders, set):
+            holders.discard(user_id)
+            if len(holders) == 1:
+                self._folded_index[folded] = holders.pop()
+    
+    def _index_joined(self, user_id: int, user_info: UserRecord) -> None:
+        """Add a user to the join-time index (appends in the common case)"""
+        bisect.insort(self._joined_index, (user_info.joined_at, user_id))
+    
+    def _unindex_joined(self, user_id: int, user_info: UserRecord) -> None:
+        """Remove a user from the join-time index"""
+        entry = (user_info.joined_at, user_id)
+        position = bisect.bisect_left(self._joined_index, entry)
+        if position < len(self._joined_index) and self._joined_index[position] == entry:
+            del self._joined_index[position]
     
     def add_user(self, user_id: int, chat_id: int, anonymous_name: str) -> bool:
         """
@@ -28,11 +136,13 @@ class UserManager:
         if user_id in self.active_users:
             return False
         
-        self.active_users[user_id] = {
-            'chat_id': chat_id,
-            'name': anonymous_name,
-            'joined_at': time.time()
-        }
+        user_info = UserRecord(chat_id, anonymous_name, time.time())
+        self.active_users[user_id] = user_info
+        self._index_name(user_id, user_info.name)
+        self._index_joined(user_id, user_info)
+        heapq.heappush(self._expiry_heap, (user_info.last_seen, user_id, user_info.joined_at))
+        self.storage.put(self.storage_namespace, user_id, user_info.to_dict())
+        self.version += 1
         
         return True
     
@@ -47,10 +157,47 @@ class UserManager:
             True if user was removed, False if user wasn't found
         """
         if user_id in self.active_users:
-            del self.active_users[user_id]
+            user_info = self.active_users.pop(user_id)
+            self._unindex_name(user_id, user_info.name)
+            self._unindex_joined(user_id, user_info)
+            self.storage.delete(self.storage_namespace, user_id)
+            self.version += 1
             return True
         return False
     
+    def apply_record(self, user_id: int, data: Optional[Dict]) -> Optional[UserRecord]:
+        """
+        Apply a record changed in storage by another worker, without writing it back
+        
+        Args:
+            user_id: Telegram user ID
+            data: Stored form of the record, or None if the user left
+            
+        Returns:
+            The record it replaced, or None if the user was not registered here
+        """
+        previous = self.active_users.pop(user_id, None)
+        if previous is not None:
+            self._unindex_name(user_id, previous.name)
+            self._unindex_joined(user_id, previous)
+        if data is None:
+            if previous is not None:
+                self.version += 1
+            return previous
+        
+        user_info = UserRecord.from_dict(data)
+        self.active_users[user_id] = user_info
+        self._index_name(user_id, user_info.name)
+        self._index_joined(user_id, user_info)
+        # A pending heap entry still covers a member who was awake and did not rejoin;
+        # expire_idle() picks up the newer last_seen when it pops it
+        rescheduled = (previous is None or previous.dormant or previous.joined_at != user_info.joined_at)
+        if rescheduled and not user_info.dormant:
+            heapq.heappush(self._expiry_heap, (user_info.last_seen, user_id, user_info.joined_at))
+        if previous is None or previous.name != user_info.name or previous.dormant != user_info.dormant:
+            self.version += 1
+        return previous
+    
     def is_user_active(self, user_id: int) -> bool:
         """
         Check if a user is currently active in the anonymous group
@@ -74,7 +221,7 @@ class UserManager:
             Anonymous name of the user or None if user not found
         """
         user_info = self.active_users.get(user_id)
-        return user_info['name'] if user_info else None
+        return user_info.name if user_info else None
     
     def get_user_chat_id(self, user_id: int) -> Optional[int]:
         """
@@ -87,16 +234,17 @@ class UserManager:
             Chat ID of the user or None if user not found
         """
         user_info = self.active_users.get(user_id)
-        return user_info['chat_id'] if user_info else None
+        return user_info.chat_id if user_info else None
     
-    def get_active_users(self) -> Dict[int, Dict]:
+    def get_active_users(self) -> Mapping[int, UserRecord]:
         """
         Get all active users
         
         Returns:
-            Dictionary of all active users with their information
+            Read-only live view of all active users and their records (not a copy;
+            take a snapshot with dict() before awaiting if it must not change)
         """
-        return self.active_users.copy()
+        return MappingProxyType(self.active_users)
     
     def get_used_names(self) -> Set[str]:
         """
@@ -105,7 +253,7 @@ class UserManager:
         Returns:
             Set of all anonymous names currently in use
         """
-        return {user_info['name'] for user_info in self.active_users.values()}
+        return {user_info.name for user_info in self.active_users.values()}
     
     def get_active_user_count(self) -> int:
         """
@@ -120,18 +268,24 @@ class UserManager:
         """
         Get user ID by anonymous name
         
+        Exact names are tried first; otherwise the name is matched ignoring
+        case, accents and emoji, as long as that match is unambiguous.
+        
         Args:
             anonymous_name: The anonymous name to search for
             
         Returns:
             User ID if found, None otherwise
         """
-        for user_id, user_info in self.active_users.items():
-            if user_info['name'] == anonymous_name:
-                return user_id
+        user_id = self._name_index.get(anonymous_name)
+        if user_id is not None:
+            return user_id
+        holders = self._folded_index.get(normalize_name(anonymous_name))
+        if isinstance(holders, int):
+            return holders
         return None
     
-    def get_users_joined_since(self, timestamp: float) -> Dict[int, Dict]:
+    def get_users_joined_since(self, timestamp: float) -> Dict[int, UserRecord]:
         """
         Get users who joined after a specific timestamp
         
@@ -141,12 +295,25 @@ class UserManager:
         Returns:
             Dictionary of users who joined after the timestamp
         """
+        start = bisect.bisect_right(self._joined_index, (timestamp, float('inf')))
         return {
-            user_id: user_info 
-            for user_id, user_info in self.active_users.items()
-            if user_info['joined_at'] > timestamp
+            user_id: self.active_users[user_id]
+            for _, user_id in self._joined_index[start:]
         }
     
+    def get_users_by_join_time(self, newest_first: bool = False) -> List[Tuple[int, UserRecord]]:
+        """
+        Get every user ordered by join time
+        
+        Args:
+            newest_first: Most recent joiners first instead of oldest first
+            
+        Returns:
+            List of (user_id, record) pairs
+        """
+        order = reversed(self._joined_index) if newest_first else self._joined_index
+        return [(user_id, self.active_users[user_id]) for _, user_id in order]
+    
     def cleanup_user(self, user_id: int) -> Optional[str]:
         """
         Clean up a user and return their anonymous name for cleanup
@@ -158,12 +325,84 @@ class UserManager:
             The anonymous name that was freed up, or None if user wasn't found
         """
         if user_id in self.active_users:
-            anonymous_name = self.active_users[user_id]['name']
-            del self.active_users[user_id]
-            return anonymous_name
+            user_info = self.active_users.pop(user_id)
+            self._unindex_name(user_id, user_info.name)
+            self._unindex_joined(user_id, user_info)
+            self.storage.delete(self.storage_namespace, user_id)
+            self.version += 1
+            return user_info.name
         return None
     
-    def get_user_info(self, user_id: int) -> Optional[Dict]:
+    def touch(self, user_id: int, now: Optional[float] = None) -> bool:
+        """
+        Record activity from a user, waking them if they were dormant
+        
+        Args:
+            user_id: Telegram user ID
+            now: Activity time (defaults to the current time)
+            
+        Returns:
+            True if the user was dormant and is now awake again
+        """
+        user_info = self.active_users.get(user_id)
+        if user_info is None:
+            return False
+        now = time.time() if now is None else now
+        if not user_info.dormant and now - user_info.last_seen < self.LAST_SEEN_RESOLUTION:
+            return False
+        
+        woke = user_info.dormant
+        user_info.last_seen = now
+        if woke:
+            user_info.dormant = False
+            heapq.heappush(self._expiry_heap, (now, user_id, user_info.joined_at))
+            self.version += 1
+        self.storage.put(self.storage_namespace, user_id, user_info.to_dict())
+        return woke
+    
+    def expire_idle(self, ttl: float, now: Optional[float] = None) -> List[int]:
+        """
+        Move members idle for longer than ``ttl`` seconds to the dormant state
+        
+        Only due heap entries are visited, so a sweep costs O(k log n) for k
+        due entries rather than a scan of every member.
+        
+        Args:
+            ttl: Idle time after which a member goes dormant
+            now: Current time (defaults to the current time)
+            
+        Returns:
+            IDs of the users that went dormant
+        """
+        now = time.time() if now is None else now
+        heap = self._expiry_heap
+        expired = []
+        while heap and heap[0][0] + ttl <= now:
+            _, user_id, joined_at = heapq.heappop(heap)
+            user_info = self.active_users.get(user_id)
+            if user_info is None or user_info.joined_at != joined_at or user_info.dormant:
+                # Left (or left and rejoined, which scheduled a new entry)
+                continue
+            if user_info.last_seen + ttl > now:
+                heapq.heappush(heap, (user_info.last_seen, user_id, joined_at))
+                continue
+            user_info.dormant = True
+            self.storage.put(self.storage_namespace, user_id, user_info.to_dict())
+            expired.append(user_id)
+        if expired:
+            self.version += 1
+        return expired
+    
+    def is_user_dormant(self, user_id: int) -> bool:
+        """Check if a user is in the room but not receiving broadcasts"""
+        user_info = self.active_users.get(user_id)
+        return bool(user_info and user_info.dormant)
+    
+    def get_dormant_count(self) -> int:
+        """Get the number of dormant users (O(n); for admin views)"""
+        return sum(1 for user_info in self.active_users.values() if user_info.dormant)
+    
+    def get_user_info(self, user_id: int) -> Optional[UserRecord]:
         """
         Get complete information about a user
         
@@ -171,7 +410,7 @@ class UserManager:
             user_id: Telegram user ID
             
         Returns:
-            User information dictionary or None if not found
+            User record or None if not found
         """
         return self.active_users.get(user_id)
     
@@ -184,4 +423,10 @@ class UserManager:
         """
         count = len(self.active_users)
         self.active_users.clear()
+        self._name_index.clear()
+        self._folded_index.clear()
+        self._joined_index.clear()
+        self._expiry_heap.clear()
+        self.storage.clear(self.storage_namespace)
+        self.version += 1
         return count